@@ -0,0 +1,295 @@
+"""
+FitForge benchmark harness.
+
+    python bench.py cold-start            # measure and compare against bench_baseline.json
+    python bench.py cold-start --update   # record the current numbers as the new baseline
+    python bench.py projection            # vectorized scenario grid vs the scalar /stats loop
+    python bench.py schema                # BSON bytes per document/index key, legacy vs compact
+    python bench.py timeseries            # documents vs time-series storage (needs a local mongod)
+    python bench.py api                   # in-process load test against a temporary SQLite store
+
+Exits non-zero when a measurement regresses past the baseline by more than
+--tolerance, or when a module that should load lazily is imported at boot.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+from pathlib import Path
+
+ROOT_DIR = Path(__file__).parent
+BASELINE_FILE = ROOT_DIR / "bench_baseline.json"
+
+# Only a handful of routes need these; importing server.py must not pull them in
+LAZY_MODULES = ["pywebpush", "py_vapid", "http_ece", "requests", "httpx", "numpy"]
+# Differences below this are timer noise, not regressions
+MIN_DELTA_S = 0.01
+
+COLD_START_SNIPPET = """
+import json, sys, time
+t0 = time.perf_counter()
+import server
+t1 = time.perf_counter()
+eager = [m for m in %r if m in sys.modules]
+from starlette.testclient import TestClient
+client = TestClient(server.app)
+t2 = time.perf_counter()
+status = client.get("/api/health").status_code
+t3 = time.perf_counter()
+print(json.dumps({"import_s": t1 - t0, "first_request_s": t3 - t2, "status": status, "eager": eager}))
+"""
+
+
+def bench_env():
+    env = dict(os.environ)
+    env.setdefault("MONGO_URL", "mongodb://127.0.0.1:27017")
+    env.setdefault("DB_NAME", "fitforge_bench")
+    env.setdefault("JWT_SECRET", "bench-secret")
+    env["SCHEDULER_ENABLED"] = "false"
+    return env
+
+
+def measure_cold_start(runs=5):
+    samples = []
+    for _ in range(runs):
+        out = subprocess.run([sys.executable, "-c", COLD_START_SNIPPET % LAZY_MODULES], cwd=ROOT_DIR,
+                             env=bench_env(), capture_output=True, text=True, check=True)
+        samples.append(json.loads(out.stdout.strip().splitlines()[-1]))
+    return {
+        "import_s": round(statistics.median(s["import_s"] for s in samples), 4),
+        "first_request_s": round(statistics.median(s["first_request_s"] for s in samples), 4),
+        "status": samples[-1]["status"],
+        "eager": sorted({m for s in samples for m in s["eager"]}),
+    }
+
+
+def load_baseline():
+    if BASELINE_FILE.exists():
+        return json.loads(BASELINE_FILE.read_text())
+    return {}
+
+
+def compare(name, result, baseline, tolerance):
+    failures = []
+    for key, value in result.items():
+        base = baseline.get(name, {}).get(key)
+        if isinstance(value, (int, float)) and isinstance(base, (int, float)) \
+                and value > base * (1 + tolerance) and value - base > MIN_DELTA_S:
+            failures.append(f"{name}.{key}: {value} > {base} (+{int(tolerance * 100)}%)")
+    return failures
+
+
+def cmd_cold_start(args):
+    result = measure_cold_start(args.runs)
+    failures = []
+    if result["eager"]:
+        failures.append(f"cold-start: eagerly imported {result['eager']}")
+    if result["status"] != 200:
+        failures.append(f"cold-start: first request returned {result['status']}")
+    timings = {k: result[k] for k in ("import_s", "first_request_s")}
+    return "cold_start", timings, failures
+
+
+def scalar_projection(weight, goal_kg, tdee, cal_target, weeks):
+    # The pre-vectorization /stats loop, kept as the yardstick
+    out, w = [], weight
+    weekly_loss = max(tdee - cal_target, 0) * 7 / 7700
+    for _ in range(weeks):
+        w = max(w - weekly_loss, goal_kg)
+        out.append(round(w, 1))
+    return out
+
+
+def best_of(fn, repeat=50):
+    import time
+    best = float("inf")
+    for _ in range(repeat):
+        t = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - t)
+    return best
+
+
+def cmd_projection(args):
+    import projection
+    one = best_of(lambda: scalar_projection(90.0, 80.0, 2219, 1800, 24))
+    loop = best_of(lambda: [scalar_projection(90.0, 80.0, 2219, c, 52) for c in range(1500, 2500, 10)], repeat=10)
+    grid = best_of(lambda: projection.project(90.0, 175.0, 30, "male", 80.0, range(1500, 2500, 100),
+                                              (1.2, 1.375, 1.55, 1.725, 1.9), (0, 300), weeks=52))
+    failures = []
+    # The point of vectorizing: 100 scenarios x 52 weeks in about the time of one scalar 24-week run
+    if grid > one * 5:
+        failures.append(f"projection: 100x52 grid took {grid * 1000:.2f}ms vs scalar {one * 1000:.3f}ms")
+    return "projection", {"scalar_1x24_s": round(one, 6), "scalar_100x52_s": round(loop, 6),
+                          "grid_100x52_s": round(grid, 6)}, failures
+
+
+def sample_docs():
+    import uuid
+    user_id = str(uuid.uuid4())
+    stamp = "2024-05-06T07:08:09.123000+00:00"
+    return {
+        "weight_logs": {"id": str(uuid.uuid4()), "user_id": user_id, "weight": 82.4,
+                        "date": "2024-05-06", "timestamp": stamp},
+        "steps": {"id": str(uuid.uuid4()), "user_id": user_id, "steps": 8500, "date": "2024-05-06"},
+        "workouts": {"id": str(uuid.uuid4()), "user_id": user_id, "type": "Running", "duration": 30,
+                     "calories": 300, "date": "2024-05-06", "timestamp": stamp},
+    }
+
+
+def cmd_schema(args):
+    import bson
+    import schema
+    sizes = {}
+    for name, doc in sample_docs().items():
+        legacy, compact = len(bson.encode(doc)), len(bson.encode(schema.compact(doc)))
+        sizes[f"{name}_legacy_b"], sizes[f"{name}_compact_b"] = legacy, compact
+    # (user_id, date) is the hot compound index; approximate its key by the same two fields
+    key = {k: sample_docs()["steps"][k] for k in ("user_id", "date")}
+    sizes["user_date_key_legacy_b"] = len(bson.encode(key))
+    sizes["user_date_key_compact_b"] = len(bson.encode(schema.compact(key)))
+    failures = [f"schema: {name} compact {sizes[name + '_compact_b']}b >= legacy {sizes[name + '_legacy_b']}b"
+                for name in (*sample_docs(), "user_date_key")
+                if sizes[name + "_compact_b"] >= sizes[name + "_legacy_b"]]
+    return "schema", sizes, failures
+
+
+async def timeseries_bench(server, users, days):
+    import random
+    import time
+    from datetime import date, timedelta
+    from storage import make_storage
+    db = server.client[bench_env()["DB_NAME"]]
+    await db.command("ping")
+    first = date(2024, 1, 1)
+    all_days = [(first + timedelta(days=i)).isoformat() for i in range(days)]
+    result = {}
+    for storage in ("documents", "timeseries"):
+        repos = {name: make_storage("mongo", db, measurement_storage=storage).logs[name]
+                 for name in ("weight_logs", "steps", "water")}
+        for repo in repos.values():
+            await db.drop_collection(repo.name)
+            await repo.ensure()
+            await repo.coll.create_index([("user_id", 1), ("date", 1)])
+        for u in range(users):
+            user_id = f"bench-user-{u}"
+            await repos["steps"].insert_many([{"user_id": user_id, "date": d, "steps": random.randint(2000, 15000)}
+                                              for d in all_days])
+            await repos["water"].insert_many([{"user_id": user_id, "date": d, "glasses": random.randint(0, 10)}
+                                              for d in all_days])
+            await repos["weight_logs"].insert_many([{"user_id": user_id, "date": d, "weight": 90 - i * 0.01,
+                                                     "timestamp": f"{d}T07:00:00+00:00"}
+                                                    for i, d in enumerate(all_days)])
+        size = 0
+        for repo in repos.values():
+            stats = await db.command("collStats", repo.name)
+            size += stats.get("storageSize", 0) + stats.get("totalIndexSize", 0)
+        result[f"{storage}_bytes"] = size
+        best = float("inf")
+        for _ in range(5):
+            t = time.perf_counter()
+            for u in range(min(users, 20)):
+                await repos["steps"].daily_values(f"bench-user-{u}", all_days[0], all_days[-1], "steps")
+                await repos["weight_logs"].find(f"bench-user-{u}")
+            best = min(best, time.perf_counter() - t)
+        result[f"{storage}_range_scan_s"] = round(best, 4)
+        for repo in repos.values():
+            await db.drop_collection(repo.name)
+    return result
+
+
+def cmd_timeseries(args):
+    import asyncio
+    os.environ.update(bench_env())
+    sys.path.insert(0, str(ROOT_DIR))
+    import server
+    try:
+        result = asyncio.run(timeseries_bench(server, args.users, args.days))
+    except Exception as e:
+        return "timeseries", {}, [f"timeseries: needs a reachable mongod at {os.environ['MONGO_URL']} ({e})"]
+    finally:
+        server.storage.close()
+    return "timeseries", result, []
+
+
+API_SNIPPET = """
+import json, statistics, sys, time
+from concurrent.futures import ThreadPoolExecutor
+import server
+from starlette.testclient import TestClient
+
+requests, concurrency = %d, %d
+with TestClient(server.app) as client:
+    token = client.post("/api/auth/register", json={"email": "bench@example.com", "password": "bench-pass",
+                                                    "name": "Bench"}).json()["token"]
+    headers = {"Authorization": f"Bearer {token}"}
+    client.put("/api/profile", headers=headers, json={"age": 30, "gender": "male", "heightCm": 180,
+                                                       "weight": 85, "goalKg": 78, "calTarget": 2000})
+    calls = [("post", "/api/weight-logs", {"weight": 84.5}), ("post", "/api/steps", {"steps": 8000}),
+             ("post", "/api/water", {"glasses": 6}), ("get", "/api/stats", None),
+             ("get", "/api/weight-logs", None), ("get", "/api/workouts", None)]
+
+    def call(i):
+        method, path, body = calls[i %% len(calls)]
+        t = time.perf_counter()
+        r = getattr(client, method)(path, headers=headers, **({"json": body} if body else {}))
+        assert r.status_code == 200, (path, r.status_code, r.text)
+        return time.perf_counter() - t
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as pool:
+        latencies = sorted(pool.map(call, range(requests)))
+    elapsed = time.perf_counter() - start
+q = statistics.quantiles(latencies, n=100)
+print(json.dumps({"req_per_s": round(requests / elapsed, 1), "p50_ms": round(q[49] * 1000, 2),
+                  "p99_ms": round(q[98] * 1000, 2)}))
+"""
+
+
+def cmd_api(args):
+    # Whole API against SQLite in a subprocess, so no MongoDB server is needed
+    import tempfile
+    with tempfile.TemporaryDirectory() as tmp:
+        env = {**bench_env(), "STORAGE_BACKEND": "sqlite", "SQLITE_PATH": str(Path(tmp) / "bench.db"),
+               "SHARED_STATE": "local", "WEB_CONCURRENCY": "1", "RATE_LIMIT_ENABLED": "false"}
+        out = subprocess.run([sys.executable, "-c", API_SNIPPET % (args.requests, args.concurrency)],
+                             cwd=ROOT_DIR, env=env, capture_output=True, text=True)
+    if out.returncode:
+        return "api", {}, [f"api: load test failed: {out.stderr.strip().splitlines()[-1:]}"]
+    return "api", json.loads(out.stdout.strip().splitlines()[-1]), []
+
+
+COMMANDS = {"cold-start": cmd_cold_start, "projection": cmd_projection, "schema": cmd_schema,
+            "timeseries": cmd_timeseries, "api": cmd_api}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="FitForge benchmarks")
+    parser.add_argument("command", choices=sorted(COMMANDS))
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--users", type=int, default=200, help="timeseries: synthetic users")
+    parser.add_argument("--days", type=int, default=730, help="timeseries: days of history per user")
+    parser.add_argument("--requests", type=int, default=2000, help="api: total requests")
+    parser.add_argument("--concurrency", type=int, default=8, help="api: client threads")
+    parser.add_argument("--tolerance", type=float, default=0.5)
+    parser.add_argument("--update", action="store_true", help="write results as the new baseline")
+    args = parser.parse_args(argv)
+
+    name, timings, failures = COMMANDS[args.command](args)
+    baseline = load_baseline()
+    print(json.dumps({name: timings, "baseline": baseline.get(name)}, indent=2))
+    if args.update:
+        baseline[name] = timings
+        BASELINE_FILE.write_text(json.dumps(baseline, indent=2, sort_keys=True) + "\n")
+        print(f"Baseline updated: {BASELINE_FILE.name}")
+    else:
+        failures += compare(name, timings, baseline, args.tolerance)
+    for f in failures:
+        print(f"REGRESSION {f}", file=sys.stderr)
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
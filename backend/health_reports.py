@@ -0,0 +1,142 @@
+"""
+Weekly health reports for every user. Profiles are streamed in batches; a
+batch's daily rollups come from one grouped query per log collection, the
+reports are computed in a process pool with the same metrics functions
+/stats and /stats/range use, and each batch is written with one bulk upsert
+into `health_reports`, keyed by user and the week's Monday.
+
+Loading the next batches overlaps with computing the current ones, so with
+enough cores the job is bound by the database rather than by the math.
+"""
+import asyncio
+import multiprocessing
+import os
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date, datetime, timedelta, timezone
+
+import metrics
+import schema
+from leaderboards import STREAK_LOOKBACK_DAYS, week_bounds, week_of
+
+REQUIRED = ("weight", "heightCm", "age", "gender", "calTarget", "goalKg")
+# rollup name -> (log collection, field, op), as /stats/range reads them
+ROLLUPS = {"steps": ("steps", "steps", "first"), "burned": ("workouts", "calories", "sum"),
+           "eaten": ("nutrition", "total.calories", "first"), "water": ("water", "glasses", "first")}
+
+
+def last_week(today=None):
+    today = date.fromisoformat(today) if today else datetime.now(timezone.utc).date()
+    return week_of((today - timedelta(days=7)).isoformat())
+
+
+def weekly_report(profile, week, days, rollups, streak, body_comp):
+    weight, height_cm, cal_target, gender = profile["weight"], profile["heightCm"], profile["calTarget"], profile["gender"]
+    bmi, bmr, tdee = metrics.body_metrics(weight, height_cm, profile["age"], gender)
+    stats = [metrics.day_stats(d, rollups["steps"].get(d) or 0, rollups["burned"].get(d, 0), rollups["eaten"].get(d),
+                               rollups["water"].get(d) or 0, weight, height_cm, bmi, tdee, cal_target, streak)
+             for d in days]
+    logged = [s for s in stats if s["has_nutrition"]]
+    weekly_loss, weeks_to_goal = metrics.goal_pace(weight, profile["goalKg"], max(tdee - cal_target, 0))
+    report = {
+        "user_id": profile["user_id"], "week": week, "date": days[0],
+        "bmi": bmi, "bmi_category": metrics.bmi_category(bmi)[0], "tdee": tdee, "streak": streak,
+        "health_score": round(sum(s["health_score"] for s in stats) / len(stats)),
+        "daily_scores": [s["health_score"] for s in stats],
+        "steps": sum(s["steps"] for s in stats),
+        "workout_calories": sum(s["burned_workouts"] for s in stats),
+        "nutrition_days": len(logged),
+        "avg_eaten": round(sum(s["eaten"] for s in logged) / len(logged)) if logged else 0,
+        "avg_deficit": round(sum(s["deficit"] for s in stats) / len(stats)),
+        "water_glasses": sum(s["water_glasses"] for s in stats),
+        "weekly_loss": round(weekly_loss, 2), "weeks_to_goal": weeks_to_goal,
+    }
+    if body_comp and body_comp.get("waist") and body_comp.get("neck"):
+        bf = metrics.navy_body_fat(gender, height_cm, body_comp["waist"], body_comp["neck"], body_comp.get("hip"))
+        lean_mass, fat_mass = metrics.lean_and_fat_mass(weight, bf)
+        report.update({"body_fat": bf, "body_fat_category": metrics.body_fat_category(bf, gender),
+                       "lean_mass": lean_mass, "fat_mass": fat_mass})
+    return report
+
+
+def compute_reports(week, items):
+    """Worker process entry point: items are (profile, rollups, streak, body_comp) tuples."""
+    days = list(metrics.date_range(*week_bounds(week)))
+    return [weekly_report(profile, week, days, rollups, streak, body_comp)
+            for profile, rollups, streak, body_comp in items]
+
+
+class HealthReports:
+    def __init__(self, storage, workers=None, batch_size=500):
+        self.storage = storage
+        self.workers = workers or os.cpu_count() or 1
+        self.batch_size = batch_size
+
+    async def _load(self, profiles, week):
+        start, end = week_bounds(week)
+        user_ids = [p["user_id"] for p in profiles]
+        since = (date.fromisoformat(end) - timedelta(days=STREAK_LOOKBACK_DAYS)).isoformat()
+        *rollups, dates, body_comps = await asyncio.gather(
+            *[self.storage.logs[coll].daily_values_many(user_ids, start, end, field, op)
+              for coll, field, op in ROLLUPS.values()],
+            self.storage.weight_logs.dates_by_user(since, user_ids),
+            self.storage.body_comp.latest_by_user(user_ids))
+        items = []
+        for p in profiles:
+            user_id = p["user_id"]
+            # Streak as of the end of the report's week, not today
+            streak = metrics.weight_log_streak([d for d in dates.get(user_id, []) if d <= end], end)
+            items.append((p, {name: r.get(user_id, {}) for name, r in zip(ROLLUPS, rollups)}, streak,
+                          body_comps.get(user_id)))
+        return items
+
+    async def _process(self, pool, profiles, week):
+        items = await self._load(profiles, week)
+        reports = await asyncio.get_running_loop().run_in_executor(pool, compute_reports, week, items)
+        now = schema.now_iso()
+        await self.storage.health_reports.put_days([
+            (r["user_id"], r["date"], {**{k: v for k, v in r.items() if k not in ("user_id", "date")},
+                                       "generated_at": now}, {"id": str(uuid.uuid4())})
+            for r in reports])
+        return len(reports)
+
+    async def run(self, week=None):
+        """Scheduler job / manage.py health-reports: every profile's report for `week` (default last week)."""
+        week = week or last_week()
+        week_bounds(week)  # ValueError before any work if malformed
+        start = time.perf_counter()
+        totals = {"week": week, "workers": self.workers, "users": 0, "reports": 0, "skipped": 0}
+        pending = set()
+
+        async def drain(when):
+            done, _ = await asyncio.wait(pending, return_when=when)
+            for task in done:
+                pending.discard(task)
+                totals["reports"] += task.result()
+        # Spawned, not forked: a fork inside the threaded server copies locks other threads may hold
+        with ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context("spawn")) as pool:
+            try:
+                batch = []
+                async for profile in self.storage.profiles.all():
+                    totals["users"] += 1
+                    if any(profile.get(k) is None for k in REQUIRED):
+                        totals["skipped"] += 1
+                        continue
+                    batch.append(profile)
+                    if len(batch) >= self.batch_size:
+                        pending.add(asyncio.ensure_future(self._process(pool, batch, week)))
+                        batch = []
+                        # Two batches per worker in flight: one computing, one loading or writing
+                        if len(pending) >= 2 * self.workers:
+                            await drain(asyncio.FIRST_COMPLETED)
+                if batch:
+                    pending.add(asyncio.ensure_future(self._process(pool, batch, week)))
+                if pending:
+                    await drain(asyncio.ALL_COMPLETED)
+            finally:
+                for task in pending:
+                    task.cancel()
+        totals["elapsed_s"] = round(time.perf_counter() - start, 3)
+        totals["users_per_sec"] = round(totals["reports"] / totals["elapsed_s"], 1) if totals["elapsed_s"] else 0.0
+        return totals
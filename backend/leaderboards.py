@@ -0,0 +1,102 @@
+"""
+Leaderboards. Each board holds one score per user and period in the
+`leaderboards` collection, indexed by score, so a top-N view is one indexed
+range read and "my rank" one indexed count instead of an aggregation over
+every user's logs.
+
+  steps             steps per ISO week ("2024-W19")
+  workout_calories  workout calories burned per ISO week
+  streak            current run of consecutive weigh-in days (period "current")
+
+Write paths refresh only the writer's own score from their own logs (a small
+indexed read), so a retried or out-of-order write can't skew it. The
+reconcile job rebuilds the current and previous week and the streak board
+from the logs in one grouped query each, which repairs anything a failed
+refresh missed and drops streaks that lapsed without a new write.
+"""
+from datetime import date, datetime, timedelta, timezone
+
+import metrics
+
+# board -> (log collection, summed field)
+WEEKLY = {"steps": ("steps", "steps"), "workout_calories": ("workouts", "calories")}
+STREAK = "streak"
+CURRENT = "current"
+BOARDS = (*WEEKLY, STREAK)
+# Streaks are counted from this many days of weigh-ins at most
+STREAK_LOOKBACK_DAYS = 366
+
+
+def week_of(day):
+    year, week, _ = date.fromisoformat(day).isocalendar()
+    return f"{year}-W{week:02d}"
+
+
+def week_bounds(period):
+    """First and last day (Monday, Sunday) of an ISO week "YYYY-Www"; ValueError if malformed."""
+    year, week = period.split("-W")
+    monday = date.fromisocalendar(int(year), int(week), 1)
+    return monday.isoformat(), (monday + timedelta(days=6)).isoformat()
+
+
+def current_period(board, today):
+    return CURRENT if board == STREAK else week_of(today)
+
+
+def ranked(entries):
+    # Ties share a rank, matching the storage rank() count of strictly higher scores
+    out, rank, previous = [], 0, None
+    for i, e in enumerate(entries):
+        if e["score"] != previous:
+            rank, previous = i + 1, e["score"]
+        out.append({**e, "rank": rank})
+    return out
+
+
+class Leaderboards:
+    def __init__(self, storage, keep_weeks=12):
+        self.storage = storage
+        self.keep_weeks = keep_weeks
+
+    async def refresh_week(self, board, user_id, day):
+        coll, field = WEEKLY[board]
+        period = week_of(day)
+        start, end = week_bounds(period)
+        values = await self.storage.logs[coll].daily_values(user_id, start, end, field, op="sum")
+        await self.storage.leaderboards.set(board, period, user_id, sum(v or 0 for v in values.values()))
+
+    async def refresh_streak(self, user_id, today):
+        dates = await self.storage.weight_logs.distinct("date", user_id)
+        await self.storage.leaderboards.set(STREAK, CURRENT, user_id, metrics.weight_log_streak(dates, today))
+
+    async def reconcile(self, today=None):
+        """Scheduler job: rebuilds this and last week's boards and the streak board from the logs."""
+        today = date.fromisoformat(today) if today else datetime.now(timezone.utc).date()
+        report = {}
+        for board, (coll, field) in WEEKLY.items():
+            for day in (today - timedelta(days=7), today):
+                period = week_of(day.isoformat())
+                totals = await self.storage.logs[coll].totals_by_user(*week_bounds(period), field)
+                await self.storage.leaderboards.replace(board, period, totals)
+                report[f"{board}:{period}"] = sum(1 for v in totals.values() if v > 0)
+            oldest = week_of((today - timedelta(weeks=self.keep_weeks)).isoformat())
+            report[f"{board}:pruned"] = await self.storage.leaderboards.prune(board, oldest)
+        since = (today - timedelta(days=STREAK_LOOKBACK_DAYS)).isoformat()
+        dates = await self.storage.weight_logs.dates_by_user(since)
+        streaks = {user_id: metrics.weight_log_streak(days, today.isoformat()) for user_id, days in dates.items()}
+        await self.storage.leaderboards.replace(STREAK, CURRENT, streaks)
+        report[STREAK] = sum(1 for v in streaks.values() if v > 0)
+        return report
+
+    async def standings(self, board, period, user_id, limit=10):
+        top = ranked(await self.storage.leaderboards.top(board, period, limit))
+        profiles = await self.storage.profiles.get_many(e["user_id"] for e in top)
+        names = {p["user_id"]: p.get("name", "") for p in profiles}
+        me = await self.storage.leaderboards.rank(board, period, user_id)
+        return {
+            "board": board, "period": period,
+            "participants": await self.storage.leaderboards.count(board, period),
+            "top": [{"rank": e["rank"], "name": names.get(e["user_id"], ""), "score": e["score"],
+                     "me": e["user_id"] == user_id} for e in top],
+            "me": me,
+        }
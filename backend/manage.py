@@ -0,0 +1,152 @@
+"""
+Maintenance commands for the FitForge backend. Uses the same .env and
+database as server.py.
+
+    python manage.py rebuild-trends              # every user with weight logs
+    python manage.py rebuild-trends --user ID    # a single user
+    python manage.py migrate-schema              # rewrite legacy docs in the compact schema
+    python manage.py migrate-schema --measure    # only print collection/index sizes
+    python manage.py copy-timeseries             # fill the *_ts collections from steps/water/weight_logs
+    python manage.py health-reports              # last week's health report for every user
+    python manage.py health-reports --week 2024-W19 --workers 8
+
+migrate-schema and copy-timeseries only apply to STORAGE_BACKEND=mongo.
+"""
+import argparse
+import asyncio
+import sys
+import time
+
+from pymongo import UpdateOne
+
+import schema
+import server
+from health_reports import HealthReports
+from storage import MongoTimeSeriesLogs
+
+
+async def rebuild_trends(args):
+    user_ids = [args.user] if args.user else await server.storage.weight_logs.distinct("user_id")
+    start, points = time.perf_counter(), 0
+    for i, user_id in enumerate(user_ids, 1):
+        points += await server.rebuild_weight_trend(user_id)
+        if i % 100 == 0:
+            print(f"  {i}/{len(user_ids)} users")
+    print(f"Rebuilt trends for {len(user_ids)} users ({points} points) in {time.perf_counter() - start:.1f}s")
+
+
+async def coll_stats(name):
+    try:
+        s = await server.db.command("collStats", name)
+    except Exception:
+        return {}
+    return {k: s.get(k, 0) for k in ("count", "size", "avgObjSize", "storageSize", "totalIndexSize")}
+
+
+async def print_stats(label, names=schema.COMPACT_COLLECTIONS):
+    print(label)
+    for name in names:
+        print(f"  {name:16} {await coll_stats(name)}")
+
+
+async def migrate_collection(name, args):
+    # Resumable: the last migrated _id is checkpointed after every batch
+    coll, checkpoints = server.db[name], server.db.schema_migrations
+    if args.restart:
+        await checkpoints.delete_one({"collection": name})
+    checkpoint = await checkpoints.find_one({"collection": name}) or {}
+    query = schema.legacy_filter()
+    if checkpoint.get("last_id") is not None:
+        query = {"$and": [query, {"_id": {"$gt": checkpoint["last_id"]}}]}
+    migrated = checkpoint.get("migrated", 0)
+    while True:
+        batch = await coll.find(query).sort("_id", 1).limit(args.batch).to_list(args.batch)
+        if not batch:
+            break
+        ops = [UpdateOne({"_id": d["_id"]}, {"$set": schema.compact({k: v for k, v in d.items() if k != "_id"})})
+               for d in batch]
+        await coll.bulk_write(ops, ordered=False)
+        migrated += len(batch)
+        last_id = batch[-1]["_id"]
+        await checkpoints.update_one({"collection": name}, {"$set": {"last_id": last_id, "migrated": migrated}},
+                                     upsert=True)
+        query = {"$and": [schema.legacy_filter(), {"_id": {"$gt": last_id}}]}
+        if args.pause:
+            # Throttle so a live primary keeps up with replication
+            await asyncio.sleep(args.pause)
+    return migrated
+
+
+async def migrate_schema(args):
+    await print_stats("Before:")
+    if args.measure:
+        return
+    if schema.MODE == "legacy":
+        print("Warning: SCHEMA_MODE=legacy; set it to `migrating` on every server before migrating")
+    start = time.perf_counter()
+    for name in schema.COMPACT_COLLECTIONS:
+        n = await migrate_collection(name, args)
+        print(f"  {name}: {n} documents")
+    print(f"Migrated in {time.perf_counter() - start:.1f}s")
+    await print_stats("After:")
+
+
+async def copy_timeseries(args):
+    # Regular collections are left untouched, so MEASUREMENT_STORAGE can be switched back
+    start = time.perf_counter()
+    for name in ("weight_logs", "steps", "water"):
+        target = MongoTimeSeriesLogs(server.db, name)
+        await target.ensure()
+        if args.restart:
+            await target.coll.delete_many({})
+        elif await target.coll.estimated_document_count():
+            print(f"  {target.name}: not empty, skipped (use --restart to recopy)")
+            continue
+        copied, cursor = 0, server.db[name].find({}).sort("_id", 1).batch_size(args.batch)
+        batch = []
+        async for doc in cursor:
+            # The ObjectId time stands in for when a steps/water value was last set
+            batch.append({**schema.decode({k: v for k, v in doc.items() if k != "_id"}),
+                          "recorded_at": doc["_id"].generation_time})
+            if len(batch) >= args.batch:
+                await target.insert_many(batch)
+                copied, batch = copied + len(batch), []
+                if args.pause:
+                    await asyncio.sleep(args.pause)
+        await target.insert_many(batch)
+        print(f"  {name} -> {target.name}: {copied + len(batch)} documents")
+    print(f"Copied in {time.perf_counter() - start:.1f}s")
+    await print_stats("Sizes:", ["weight_logs", "weight_logs_ts", "steps", "steps_ts", "water", "water_ts"])
+
+
+async def health_reports(args):
+    reports = HealthReports(server.storage, workers=args.workers, batch_size=args.batch)
+    totals = await reports.run(args.week)
+    print(f"{totals['reports']} reports for {totals['week']} ({totals['skipped']} incomplete profiles skipped) "
+          f"in {totals['elapsed_s']:.1f}s with {totals['workers']} workers: {totals['users_per_sec']} users/s")
+
+
+COMMANDS = {"rebuild-trends": rebuild_trends, "migrate-schema": migrate_schema, "copy-timeseries": copy_timeseries,
+            "health-reports": health_reports}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="FitForge maintenance commands")
+    parser.add_argument("command", choices=sorted(COMMANDS))
+    parser.add_argument("--user", help="limit to one user id")
+    parser.add_argument("--batch", type=int, default=500, help="documents per bulk write")
+    parser.add_argument("--pause", type=float, default=0.0, help="seconds to sleep between batches")
+    parser.add_argument("--restart", action="store_true", help="ignore saved checkpoints / recopy")
+    parser.add_argument("--measure", action="store_true", help="print sizes without migrating")
+    parser.add_argument("--week", help="ISO week for health-reports, e.g. 2024-W19 (default: last week)")
+    parser.add_argument("--workers", type=int, default=0, help="health-reports processes (default: one per core)")
+    args = parser.parse_args(argv)
+    try:
+        asyncio.run(COMMANDS[args.command](args))
+    finally:
+        server.storage.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,133 @@
+"""
+Pure fitness math shared by the stats endpoints (and anything else that must
+agree with them). No I/O here.
+"""
+import math
+from datetime import date as date_cls, timedelta
+
+
+def body_metrics(weight, height_cm, age, gender):
+    height_m = height_cm / 100
+    # BMI: weight(kg) / height(m)^2
+    bmi = round(weight / (height_m ** 2), 1)
+    # BMR: Mifflin-St Jeor equation
+    bmr = round(10 * weight + 6.25 * height_cm - 5 * age + (5 if gender == "male" else -161))
+    # TDEE: BMR * activity factor (1.2 = sedentary base)
+    tdee = round(bmr * 1.2)
+    return bmi, bmr, tdee
+
+
+def bmi_category(bmi):
+    if bmi < 18.5:
+        return "Underweight", "blue"
+    elif bmi < 25:
+        return "Normal", "green"
+    elif bmi < 30:
+        return "Overweight", "orange"
+    return "Obese", "red"
+
+
+def steps_calories(steps, height_cm, weight):
+    # Precise steps calories: stride = height × 0.413, MET 3.5 moderate walking
+    stride_m = height_cm * 0.413 / 100
+    distance_km = steps * stride_m / 1000
+    walking_time_h = distance_km / 4.8
+    return round(3.5 * weight * walking_time_h)
+
+
+def daily_deficit(tdee, burned_today, eaten, has_nutrition, cal_target):
+    if has_nutrition:
+        return (tdee + burned_today) - eaten
+    return (tdee + burned_today) - cal_target
+
+
+def goal_pace(weight, goal_kg, daily_deficit):
+    # weekly_loss in kg: (daily_deficit * 7) / 7700 cal per kg of body fat
+    weekly_loss = (daily_deficit * 7) / 7700 if daily_deficit > 0 else 0
+    weeks_to_goal = round(max(weight - goal_kg, 0) / weekly_loss) if weekly_loss > 0 else 0
+    return weekly_loss, weeks_to_goal
+
+
+def navy_body_fat(gender, height_cm, waist, neck, hip=None):
+    # US Navy circumference method, clamped to 2-60%
+    if gender == "male":
+        bf = 86.010 * math.log10(waist - neck) - 70.041 * math.log10(height_cm) + 36.76
+    else:
+        bf = 163.205 * math.log10(waist + (hip or 0) - neck) - 97.684 * math.log10(height_cm) - 78.387
+    return max(2, min(round(bf, 1), 60))
+
+
+def body_fat_category(bf, gender):
+    if gender == "male":
+        return "Essential" if bf < 6 else "Athletic" if bf < 14 else "Fitness" if bf < 18 else "Average" if bf < 25 else "Above Average"
+    return "Essential" if bf < 14 else "Athletic" if bf < 21 else "Fitness" if bf < 25 else "Average" if bf < 32 else "Above Average"
+
+
+def lean_and_fat_mass(weight, bf):
+    return round(weight * (1 - bf / 100), 1), round(weight * (bf / 100), 1)
+
+
+def weight_log_streak(dates, today):
+    # Streak: count consecutive days with weight log entries (backward from today)
+    streak = 0
+    today_date = date_cls.fromisoformat(today)
+    prev = None
+    for d_str in sorted(set(dates), reverse=True):
+        try:
+            d = date_cls.fromisoformat(d_str)
+            if prev is None:
+                # First date: must be today or yesterday to count
+                diff_from_today = (today_date - d).days
+                if diff_from_today <= 1:
+                    streak = 1
+                    prev = d
+                else:
+                    break
+            elif (prev - d).days == 1:
+                streak += 1
+                prev = d
+            else:
+                break
+        except Exception:
+            break
+    return streak
+
+
+def health_score(bmi, steps, burned_today, has_nutrition, eaten, cal_target, streak):
+    # Health Score (0-100)
+    # BMI score (25 pts): 25 if normal, scaled down for over/underweight
+    bmi_score = 25 if 18.5 <= bmi < 25 else max(0, 25 - abs(bmi - 22) * 2)
+    # Activity score (25 pts): based on steps (10k = max) and burned cals
+    steps_score = min(steps / 10000, 1) * 15
+    burn_score = min(burned_today / 500, 1) * 10
+    activity_score = steps_score + burn_score
+    # Nutrition score (25 pts): adherence to calTarget (closer = better)
+    if has_nutrition:
+        cal_diff = abs(eaten - cal_target)
+        nutrition_score = max(0, 25 - (cal_diff / cal_target) * 25)
+    else:
+        nutrition_score = 12  # Partial if not tracking
+    # Streak score (25 pts): 7+ days = full
+    streak_score = min(streak / 7, 1) * 25
+    return round(min(bmi_score + activity_score + nutrition_score + streak_score, 100))
+
+
+def day_stats(day, steps, burned_workouts, eaten, water_glasses, weight, height_cm, bmi, tdee, cal_target, streak):
+    # One day of /stats/range (and the weekly health reports) from that day's logged totals
+    steps_cal = steps_calories(steps, height_cm, weight)
+    burned_today = burned_workouts + steps_cal
+    has_nutrition = bool(eaten)
+    eaten = eaten if has_nutrition else 0
+    deficit = daily_deficit(tdee, burned_today, eaten, has_nutrition, cal_target)
+    return {"date": day, "burned_workouts": burned_workouts, "steps": steps,
+            "steps_calories": steps_cal, "burned_today": burned_today,
+            "eaten": eaten, "has_nutrition": has_nutrition, "deficit": round(deficit),
+            "water_glasses": water_glasses,
+            "health_score": health_score(bmi, steps, burned_today, has_nutrition, eaten, cal_target, streak)}
+
+
+def date_range(start, end):
+    d, last = date_cls.fromisoformat(start), date_cls.fromisoformat(end)
+    while d <= last:
+        yield d.isoformat()
+        d += timedelta(days=1)
@@ -0,0 +1,83 @@
+"""
+Connection pool counters for the Motor client, fed by a pymongo pool
+listener: checkouts, failed checkouts by reason, connections in use and
+open, and how long checkouts waited for a free connection. Served per worker
+by /api/admin/limits, so MONGO_MAX_POOL_SIZE can be sized against
+WEB_CONCURRENCY and MAX_IN_FLIGHT.
+
+pymongo emits a checkout's started and checked-out events from the same
+(executor) thread, so the wait is timed with a thread-local start.
+"""
+import threading
+import time
+from collections import Counter, deque
+
+from pymongo import monitoring
+
+
+class PoolStats(monitoring.ConnectionPoolListener):
+    def __init__(self, window=1000):
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._waits = deque(maxlen=window)
+        self.checkouts = 0
+        self.failures = Counter()
+        self.in_use = 0
+        self.open = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+
+    def connection_check_out_started(self, event):
+        self._local.started = time.perf_counter()
+
+    def connection_checked_out(self, event):
+        wait = time.perf_counter() - getattr(self._local, "started", time.perf_counter())
+        with self._lock:
+            self.checkouts += 1
+            self.in_use += 1
+            self.wait_total += wait
+            self.wait_max = max(self.wait_max, wait)
+            self._waits.append(wait)
+
+    def connection_check_out_failed(self, event):
+        with self._lock:
+            self.failures[event.reason] += 1
+
+    def connection_checked_in(self, event):
+        with self._lock:
+            self.in_use -= 1
+
+    def connection_created(self, event):
+        with self._lock:
+            self.open += 1
+
+    def connection_closed(self, event):
+        with self._lock:
+            self.open -= 1
+
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        pass
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_ready(self, event):
+        pass
+
+    def stats(self):
+        with self._lock:
+            waits = sorted(self._waits)
+            return {
+                "checkouts": self.checkouts, "failed_checkouts": dict(self.failures),
+                "in_use": self.in_use, "open": self.open,
+                "wait_ms_avg": round(self.wait_total * 1000 / self.checkouts, 3) if self.checkouts else 0.0,
+                # Over the last `window` checkouts
+                "wait_ms_p99": round(waits[int(len(waits) * 0.99)] * 1000, 3) if waits else 0.0,
+                "wait_ms_max": round(self.wait_max * 1000, 3),
+            }
@@ -0,0 +1,187 @@
+"""
+Nutrition diary sync. A connector fetches a user's diary days from one source
+(the built-in `mock`, or `http` for any service speaking the small JSON
+protocol in HttpConnector); SyncService runs them in the background with a
+concurrency limit per connector, retries transient failures with backoff,
+fetches only days since the account's last sync and writes each batch of
+accounts with one bulk upsert into `nutrition`.
+"""
+import asyncio
+import contextvars
+import logging
+import random
+import time
+import uuid
+from datetime import date, datetime, timedelta, timezone
+
+import schema
+
+logger = logging.getLogger(__name__)
+
+MACROS = ("calories", "carbs", "protein", "fat")
+
+
+class TransientError(Exception):
+    """Worth retrying: timeouts, 429s, 5xx."""
+
+
+def meal_totals(meals):
+    return {k: sum(m.get(k, 0) for m in meals) for k in MACROS}
+
+
+def days_between(since, until):
+    start, end = date.fromisoformat(since), date.fromisoformat(until)
+    return [(start + timedelta(days=i)).isoformat() for i in range((end - start).days + 1)]
+
+
+class Connector:
+    name = None
+
+    def __init__(self, concurrency=4):
+        self.concurrency = concurrency
+
+    async def fetch(self, account, since, until):
+        """Diary days in [since, until] as [{"date": "YYYY-MM-DD", "meals": [...]}, ...]."""
+        raise NotImplementedError
+
+    async def close(self):
+        pass
+
+
+class MockConnector(Connector):
+    # MyFitnessPal has no public API; seeded by username and day so re-syncing a day is stable
+    name = "mock"
+
+    MEALS = [("Breakfast", (300, 500), (30, 60), (15, 30), (10, 20)),
+             ("Lunch", (400, 700), (40, 80), (25, 45), (15, 30)),
+             ("Dinner", (500, 800), (50, 90), (30, 50), (20, 35)),
+             ("Snacks", (100, 300), (10, 30), (5, 15), (5, 15))]
+
+    def day(self, username, day):
+        rng = random.Random(f"{username}:{day}")
+        return {"date": day, "meals": [{"name": name, **{k: rng.randint(*r) for k, r in zip(MACROS, ranges)}}
+                                       for name, *ranges in self.MEALS]}
+
+    async def fetch(self, account, since, until):
+        return [self.day(account.get("username", ""), d) for d in days_between(since, until)]
+
+
+class HttpConnector(Connector):
+    """
+    GET {base_url}/diary?username=..&since=YYYY-MM-DD&until=YYYY-MM-DD
+    -> {"days": [{"date": "YYYY-MM-DD", "meals": [{"name", "calories", "carbs", "protein", "fat"}]}]}
+    """
+    name = "http"
+
+    def __init__(self, base_url, concurrency=4, timeout=10):
+        super().__init__(concurrency)
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+        self._client = None
+
+    async def fetch(self, account, since, until):
+        import httpx
+        if self._client is None:
+            self._client = httpx.AsyncClient(timeout=self.timeout,
+                                             limits=httpx.Limits(max_connections=self.concurrency))
+        try:
+            resp = await self._client.get(f"{self.base_url}/diary", params={
+                "username": account.get("username", ""), "since": since, "until": until})
+        except httpx.TransportError as e:
+            raise TransientError(str(e)) from e
+        if resp.status_code == 429 or resp.status_code >= 500:
+            raise TransientError(f"HTTP {resp.status_code}")
+        resp.raise_for_status()
+        return resp.json().get("days", [])
+
+    async def close(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+
+class SyncService:
+    def __init__(self, storage, connectors, max_retries=3, backoff=1.0, batch_size=200, backfill_days=1):
+        self.storage = storage
+        self.connectors = {c.name: c for c in connectors}
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.batch_size = batch_size
+        self.backfill_days = backfill_days
+        self._limits = {c.name: asyncio.Semaphore(c.concurrency) for c in connectors}
+        self._pending = {}
+
+    async def _fetch(self, account, until):
+        connector = self.connectors[account["connector"]]
+        # Re-fetch the last synced day: it may have been synced before the user finished logging it
+        since = account.get("last_synced")
+        if not since:
+            since = (date.fromisoformat(until) - timedelta(days=self.backfill_days - 1)).isoformat()
+        for attempt in range(self.max_retries + 1):
+            try:
+                async with self._limits[connector.name]:
+                    return await connector.fetch(account, since, until)
+            except TransientError:
+                if attempt == self.max_retries:
+                    raise
+                await asyncio.sleep(self.backoff * (2 ** attempt) * (1 + random.random() / 2))
+
+    async def sync_accounts(self, accounts, today=None):
+        """Fetches every account concurrently, then one bulk write for the diaries and one for the sync state."""
+        today = today or datetime.now(timezone.utc).strftime("%Y-%m-%d")
+        results = await asyncio.gather(*[self._fetch(a, today) for a in accounts], return_exceptions=True)
+        items, updates = [], {}
+        report = {"accounts": len(accounts), "synced": 0, "failed": 0, "days": 0}
+        now = schema.now_iso()
+        for account, days in zip(accounts, results):
+            user_id = account["user_id"]
+            if isinstance(days, Exception):
+                logger.warning(f"Nutrition sync failed for {user_id} ({account['connector']}): {days}")
+                report["failed"] += 1
+                updates[user_id] = {"status": "error", "last_error": str(days), "attempted_at": now}
+                continue
+            for d in days:
+                values = {"meals": d["meals"], "total": meal_totals(d["meals"]),
+                          "source": account["connector"], "username": account.get("username", ""),
+                          "synced_at": now}
+                items.append((user_id, d["date"], values, {"id": str(uuid.uuid4())}))
+            report["synced"] += 1
+            report["days"] += len(days)
+            updates[user_id] = {"status": "ok", "last_error": None, "last_synced": today, "attempted_at": now}
+        await self.storage.nutrition.put_days(items)
+        await self.storage.nutrition_accounts.update_many(updates)
+        return report
+
+    async def run(self):
+        """Scheduler job: every linked account, batch_size at a time."""
+        start = time.perf_counter()
+        totals = {"accounts": 0, "synced": 0, "failed": 0, "days": 0}
+        batch = []
+        async for account in self.storage.nutrition_accounts.all():
+            if account.get("connector") not in self.connectors:
+                continue
+            batch.append(account)
+            if len(batch) >= self.batch_size:
+                for k, v in (await self.sync_accounts(batch)).items():
+                    totals[k] += v
+                batch = []
+        if batch:
+            for k, v in (await self.sync_accounts(batch)).items():
+                totals[k] += v
+        totals["elapsed_s"] = round(time.perf_counter() - start, 3)
+        return totals
+
+    def enqueue(self, account):
+        """Background sync of one account; concurrent calls for the same user share one run."""
+        user_id = account["user_id"]
+        task = self._pending.get(user_id)
+        if task is None:
+            # A fresh context: the sync outlives the request, so it must not inherit its database deadline
+            task = asyncio.get_running_loop().create_task(self.sync_accounts([account]), context=contextvars.Context())
+            self._pending[user_id] = task
+            task.add_done_callback(lambda _: self._pending.pop(user_id, None))
+        return task
+
+    async def close(self):
+        for connector in self.connectors.values():
+            await connector.close()
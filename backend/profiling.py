@@ -0,0 +1,230 @@
+"""
+On-demand request profiling. A request is profiled when an admin sends
+`X-Profile: 1` (with X-Admin-Token) or when it falls in PROFILE_SAMPLE_RATE.
+While at least one profiled request is in flight, a sampler thread looks at
+each one every PROFILE_INTERVAL_MS and files the sample under:
+
+  cpu             the request's code is running on the event loop
+  db              suspended in a storage call (Motor, or the SQLite worker)
+  blocking:<x>    suspended on work pushed to a thread: bcrypt, webpush, and
+                  files (GridFS or the SQLite blob store)
+  await           any other wait, including waiting for the loop itself
+
+Tasks the handler spawns (coalesced reads, gathers) are followed through a
+task factory that is installed only while something is being profiled, so
+with no profiled requests the cost is one header scan per request.
+
+The result is a wall-time split per category plus the sampled stacks in
+folded format ("frame;frame;frame microseconds" lines), which flamegraph.pl
+and speedscope read directly. Each sample is weighted by the time since the
+previous one: the sampler only gets the GIL between the loop's switch
+intervals, so CPU-bound stretches yield fewer samples than waits and plain
+counts would under-report them.
+"""
+import asyncio
+import hmac
+import inspect
+import os
+import random
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from contextvars import ContextVar
+from datetime import datetime, timezone
+
+_current = ContextVar("profile", default=None)
+DB_MODULES = ("storage", "sqlite_storage", "motor", "pymongo")
+
+
+def _frame_name(frame):
+    return f"{os.path.basename(frame.f_code.co_filename)}:{frame.f_code.co_qualname}"
+
+
+def _awaiting(coro):
+    # The suspended coroutine chain, outermost first
+    frames, obj = [], coro
+    while obj is not None:
+        frame = getattr(obj, "cr_frame", None) or getattr(obj, "gi_frame", None) or getattr(obj, "ag_frame", None)
+        if frame is None:
+            break
+        frames.append(frame)
+        obj = getattr(obj, "cr_await", None) or getattr(obj, "gi_yieldfrom", None) or getattr(obj, "ag_await", None)
+    return frames
+
+
+def classify(frames):
+    modules = [f.f_globals.get("__name__", "") for f in frames]
+    if any("gridfs" in m for m in modules) or any("Files." in f.f_code.co_qualname for f in frames):
+        return "blocking:files"
+    if "push" in modules:
+        return "blocking:webpush"
+    if modules and modules[-1] == "asyncio.threads":
+        func = frames[-1].f_locals.get("func")
+        return f"blocking:{(getattr(func, '__module__', None) or 'thread').split('.')[0]}"
+    if any(m.split(".")[0] in DB_MODULES for m in modules):
+        return "db"
+    return "await"
+
+
+class RequestProfile:
+    def __init__(self, method, path):
+        self.id = uuid.uuid4().hex[:16]
+        self.method, self.path = method, path
+        self.thread_id = threading.get_ident()
+        self.coros = []
+        self.categories = Counter()
+        self.stacks = Counter()
+        self.started = self.sampled = time.perf_counter()
+        self.samples = 0
+        self.status = None
+
+    def sample(self, frame, weight):
+        coros = self.coros[:]
+        running = next((c for c in coros if c.cr_running), None)
+        if running is not None:
+            stack, f = [], frame
+            while f is not None:
+                stack.append(f)
+                if f is running.cr_frame:
+                    break
+                f = f.f_back
+            else:
+                return  # finished between the two reads
+            stack.reverse()
+            category = "cpu"
+        else:
+            # Root chain plus the newest spawned task still pending, if any
+            stack = _awaiting(coros[0]) if coros else []
+            child = next((c for c in reversed(coros[1:]) if c.cr_frame is not None), None)
+            if child is not None:
+                stack += _awaiting(child)
+            if not stack:
+                return
+            category = classify(stack)
+        self.samples += 1
+        self.categories[category] += weight
+        self.stacks[";".join([category, *map(_frame_name, stack)])] += weight
+
+    def dump(self, max_stacks=500):
+        wall = time.perf_counter() - self.started
+        total = sum(self.categories.values())
+        return {
+            "id": self.id, "method": self.method, "path": self.path, "status": self.status,
+            "at": datetime.now(timezone.utc).isoformat(), "wall_ms": round(wall * 1000, 2), "samples": self.samples,
+            # Sampled time is a little short of wall time; each category gets its share of the whole
+            "split_ms": {k: round(wall * 1000 * t / total, 2) for k, t in self.categories.most_common()},
+            "folded": "\n".join(f"{s} {round(t * 1e6)}" for s, t in self.stacks.most_common(max_stacks)),
+        }
+
+
+class Profiler:
+    def __init__(self, interval=0.001):
+        self.interval = interval
+        self._active = {}
+        self._lock = threading.Lock()
+        self._thread = None
+        self._loop = None
+        self._previous_factory = None
+
+    def _task_factory(self, loop, coro, **kwargs):
+        if self._previous_factory is not None:
+            task = self._previous_factory(loop, coro, **kwargs)
+        else:
+            task = asyncio.Task(coro, loop=loop, **kwargs)
+        profile = _current.get()
+        if profile is not None and inspect.iscoroutine(coro):
+            profile.coros.append(coro)
+        return task
+
+    def start(self, profile, coro):
+        profile.coros.append(coro)
+        _current.set(profile)
+        with self._lock:
+            if not self._active:
+                self._loop = asyncio.get_running_loop()
+                self._previous_factory = self._loop.get_task_factory()
+                self._loop.set_task_factory(self._task_factory)
+            self._active[profile.id] = profile
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="profiler", daemon=True)
+                self._thread.start()
+
+    def stop(self, profile):
+        with self._lock:
+            self._active.pop(profile.id, None)
+            if not self._active and self._loop is not None:
+                self._loop.set_task_factory(self._previous_factory)
+                self._loop = self._previous_factory = None
+
+    def _run(self):
+        while True:
+            with self._lock:
+                if not self._active:
+                    self._thread = None
+                    return
+                profiles = list(self._active.values())
+            frames = sys._current_frames()
+            now = time.perf_counter()
+            for profile in profiles:
+                weight, profile.sampled = now - profile.sampled, now
+                try:
+                    profile.sample(frames.get(profile.thread_id), weight)
+                except Exception:
+                    # The loop thread moves on while we look; a torn sample is just dropped
+                    pass
+            del frames
+            time.sleep(self.interval)
+
+
+class ProfilingMiddleware:
+    """ASGI middleware; add it innermost so the route handler runs in the task it profiles."""
+
+    def __init__(self, app, profiler, sample_rate=0.0, admin_token=None, on_finish=None):
+        self.app = app
+        self.profiler = profiler
+        self.sample_rate = sample_rate
+        self.admin_token = admin_token.encode() if admin_token else None
+        self.on_finish = on_finish
+
+    def _requested(self, scope):
+        if self.admin_token is None:
+            return False
+        headers = dict(scope.get("headers") or ())
+        token = headers.get(b"x-admin-token", b"")
+        return headers.get(b"x-profile") == b"1" and hmac.compare_digest(token, self.admin_token)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        requested = self._requested(scope)
+        if not requested and not (self.sample_rate and random.random() < self.sample_rate):
+            return await self.app(scope, receive, send)
+        profile = RequestProfile(scope["method"], scope["path"])
+        finished = False
+
+        async def finish():
+            nonlocal finished
+            if not finished:
+                finished = True
+                self.profiler.stop(profile)
+                if self.on_finish is not None:
+                    await self.on_finish(profile.dump())
+
+        async def send_profiled(message):
+            if message["type"] == "http.response.start":
+                profile.status = message["status"]
+                if requested:
+                    message = {**message, "headers": [*message.get("headers", []),
+                                                      (b"x-profile-id", profile.id.encode())]}
+            elif message["type"] == "http.response.body" and not message.get("more_body"):
+                # Stored before the last byte goes out, so the id in the header is fetchable at once
+                await finish()
+            await send(message)
+        coro = self.app(scope, receive, send_profiled)
+        self.profiler.start(profile, coro)
+        try:
+            await coro
+        finally:
+            await finish()
@@ -0,0 +1,63 @@
+"""
+Vectorized what-if weight projection. Every scenario in the grid (calorie
+target x activity factor x daily exercise) is a row in a NumPy array, and every
+week is a column computed in closed form, so there is no week-by-week loop.
+"""
+import numpy as np
+
+KCAL_PER_KG = 7700
+
+
+def scenario_grid(cal_targets, activity_factors, exercise_kcal):
+    # One axis per input, so per-scenario math broadcasts to (cal, af, ex) without copies
+    cal, af, ex = (np.asarray(list(values), dtype=float) for values in (cal_targets, activity_factors, exercise_kcal))
+    return cal[:, None, None], af[None, :, None], ex[None, None, :]
+
+
+def project(weight, height_cm, age, gender, goal_kg, cal_targets, activity_factors=(1.2,),
+            exercise_kcal=(0,), weeks=52, adaptive=True):
+    """Returns (cal, af, ex, weights) where weights has shape (scenarios, weeks + 1).
+
+    Scenarios are in itertools.product order of the three inputs. With
+    adaptive=False TDEE is fixed at the starting weight, which is what
+    /api/stats assumes; adaptive=True recomputes BMR each week as weight drops.
+    goal_kg=None leaves weights unclamped, for goal_weeks.
+    """
+    cal, af, ex = scenario_grid(cal_targets, activity_factors, exercise_kcal)
+    bmr_offset = 6.25 * height_cm - 5 * age + (5 if gender == "male" else -161)
+    w0 = float(weight)
+    week = np.arange(weeks + 1)
+    if adaptive:
+        # TDEE drops 10 * af kcal per kg lost, so every week closes the same share of the
+        # gap to the weight where TDEE meets the target: a geometric decay towards it.
+        # Unlike the fixed path, this TDEE is not rounded to whole kcal.
+        floor = np.minimum((cal - ex - bmr_offset * af) / (10 * af), w0)[..., None]
+        weights = floor + (w0 - floor) * (1 - 10 * af * 7 / KCAL_PER_KG)[..., None] ** week
+    else:
+        tdee = np.round(np.round(10 * w0 + bmr_offset) * af) + ex
+        # Same clamp as /stats: eating above TDEE projects no loss rather than gain
+        weights = w0 - (np.maximum(tdee - cal, 0) * 7 / KCAL_PER_KG)[..., None] * week
+    if goal_kg is not None:
+        weights = np.maximum(weights, goal_kg)
+    weights = weights.reshape(-1, weeks + 1)
+    lanes = np.zeros((cal.size, af.size, ex.size))
+    return (cal + lanes).ravel(), (af + lanes).ravel(), (ex + lanes).ravel(), weights
+
+
+def weeks_to_goal(weights, goal_kg):
+    # First week index at which the goal is reached; -1 if never within the horizon
+    reached = weights <= goal_kg + 1e-9
+    first = reached.argmax(axis=1)
+    return np.where(reached.any(axis=1), first, -1)
+
+
+def goal_weeks(weights, goal_kg):
+    # Fractional weeks until unclamped weights cross the goal, interpolating within the
+    # week it happens (exact for fixed TDEE); 0 if already there, -1 past the horizon
+    reached = weights <= goal_kg
+    week = reached.argmax(axis=1)
+    rows = np.arange(len(weights))
+    before, after = weights[rows, np.maximum(week - 1, 0)], weights[rows, week]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        crossing = np.where(week > 0, week - 1 + (before - goal_kg) / (before - after), 0.0)
+    return np.where(reached.any(axis=1), crossing, -1.0)
@@ -0,0 +1,149 @@
+"""
+Web push fan-out: groups subscriptions by push-service origin, sends over one
+pooled keep-alive session per origin, encrypts and posts on a bounded thread
+pool with retries, and reports which subscriptions the push service says are
+gone (404/410).
+"""
+import asyncio
+import json
+import logging
+import random
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse
+
+import requests
+from py_vapid import Vapid
+from pywebpush import WebPusher
+
+logger = logging.getLogger(__name__)
+
+# Status codes the push service uses for subscriptions that will never work again
+EXPIRED_STATUSES = {404, 410}
+# Status codes worth retrying (rate limited / transient server errors)
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+# Signed VAPID JWTs are valid for 12h; re-sign an hour before that
+VAPID_TTL = 12 * 60 * 60
+VAPID_REFRESH = 60 * 60
+
+
+def push_origin(endpoint):
+    url = urlparse(endpoint)
+    return f"{url.scheme}://{url.netloc}"
+
+
+class PushReport:
+    def __init__(self):
+        self.sent = 0
+        self.failed = 0
+        self.retries = 0
+        self.expired = []
+        self.origins = 0
+        self.elapsed = 0.0
+
+    @property
+    def rate(self):
+        return round(self.sent / self.elapsed, 1) if self.elapsed > 0 else 0.0
+
+    def as_dict(self):
+        return {"sent": self.sent, "failed": self.failed, "retries": self.retries,
+                "expired": len(self.expired), "origins": self.origins,
+                "elapsed_s": round(self.elapsed, 3), "sends_per_sec": self.rate}
+
+
+class PushDispatcher:
+    def __init__(self, vapid_private_key, vapid_sub="mailto:admin@fittrackpro.com",
+                 max_workers=8, per_origin=4, max_retries=3, backoff=0.5, timeout=10, ttl=0):
+        self.vapid = Vapid.from_string(private_key=vapid_private_key)
+        self.vapid_sub = vapid_sub
+        self.max_workers = max_workers
+        self.per_origin = per_origin
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self.ttl = ttl
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="webpush")
+        self._lock = threading.Lock()
+        self._sessions = {}
+        self._vapid_headers = {}
+        # Cumulative counters for this process; cross-worker totals live in shared state
+        self.totals = {"sent": 0, "failed": 0, "retries": 0, "expired": 0}
+
+    def _session(self, origin):
+        with self._lock:
+            session = self._sessions.get(origin)
+            if session is None:
+                session = requests.Session()
+                adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=self.per_origin)
+                session.mount(origin, adapter)
+                self._sessions[origin] = session
+            return session
+
+    def _headers(self, origin):
+        # One ECDSA signature per origin per ~11h instead of one per message
+        now = int(time.time())
+        with self._lock:
+            cached = self._vapid_headers.get(origin)
+            if cached and cached[0] - VAPID_REFRESH > now:
+                return dict(cached[1])
+            exp = now + VAPID_TTL
+            headers = self.vapid.sign({"sub": self.vapid_sub, "aud": origin, "exp": exp})
+            self._vapid_headers[origin] = (exp, headers)
+            return dict(headers)
+
+    def _send_blocking(self, origin, sub, data):
+        # Runs on the pool: AES-GCM encryption plus the POST never touch the event loop
+        pusher = WebPusher({"endpoint": sub["endpoint"], "keys": sub["keys"]},
+                           requests_session=self._session(origin))
+        resp = pusher.send(data, headers=self._headers(origin), ttl=self.ttl, timeout=self.timeout)
+        return resp.status_code
+
+    async def _send_one(self, origin, sub, data, report, sem):
+        loop = asyncio.get_running_loop()
+        async with sem:
+            for attempt in range(self.max_retries + 1):
+                try:
+                    status = await loop.run_in_executor(self._pool, self._send_blocking, origin, sub, data)
+                    if status <= 202:
+                        report.sent += 1
+                        return
+                    if status in EXPIRED_STATUSES:
+                        report.expired.append(sub["endpoint"])
+                        return
+                    if status not in RETRY_STATUSES:
+                        logger.warning(f"Push to {sub['endpoint'][:60]} rejected ({status})")
+                        break
+                except Exception as e:
+                    logger.warning(f"Push to {sub['endpoint'][:60]} errored: {e}")
+                if attempt < self.max_retries:
+                    report.retries += 1
+                    await asyncio.sleep(self.backoff * (2 ** attempt) * (1 + random.random() / 2))
+            report.failed += 1
+
+    async def send_many(self, subs, payload):
+        data = payload if isinstance(payload, str) else json.dumps(payload)
+        by_origin = defaultdict(list)
+        for sub in subs:
+            by_origin[push_origin(sub["endpoint"])].append(sub)
+        report = PushReport()
+        report.origins = len(by_origin)
+        start = time.perf_counter()
+        tasks = []
+        for origin, group in by_origin.items():
+            # Concurrency per origin matches its connection pool, so sends reuse sockets
+            sem = asyncio.Semaphore(self.per_origin)
+            tasks.extend(self._send_one(origin, s, data, report, sem) for s in group)
+        await asyncio.gather(*tasks)
+        report.elapsed = time.perf_counter() - start
+        for k in ("sent", "failed", "retries"):
+            self.totals[k] += getattr(report, k)
+        self.totals["expired"] += len(report.expired)
+        return report
+
+    def close(self):
+        self._pool.shutdown(wait=False)
+        for session in self._sessions.values():
+            session.close()
+        self._sessions.clear()
@@ -0,0 +1,100 @@
+"""
+Admission control. Each user (or client IP on the unauthenticated auth
+routes) gets a token bucket; a request spends its route's cost, so bcrypt and
+upload routes drain it faster than plain reads. Separately, each worker caps
+how many requests it has in flight and sheds the rest with 503 instead of
+letting every request's latency grow.
+
+Buckets live in this process by default. With a shared backend (see
+shared_state.py) all workers draw from the same budget.
+"""
+import math
+import time
+from collections import Counter
+
+
+class LocalBuckets:
+    def __init__(self, max_keys=100_000):
+        self._buckets = {}
+        self.max_keys = max_keys
+
+    async def take(self, key, cost, rate, burst):
+        """Spends `cost` tokens; returns 0 if allowed, else seconds until it would be."""
+        now = time.monotonic()
+        tokens, last = self._buckets.get(key, (burst, now))
+        tokens = min(burst, tokens + (now - last) * rate)
+        if tokens < cost:
+            self._buckets[key] = (tokens, now)
+            return (cost - tokens) / rate
+        if key not in self._buckets and len(self._buckets) >= self.max_keys:
+            # Idle buckets are full again by now, so dropping them changes nothing
+            cutoff = now - burst / rate
+            self._buckets = {k: v for k, v in self._buckets.items() if v[1] > cutoff}
+        self._buckets[key] = (tokens - cost, now)
+        return 0
+
+
+class SharedBuckets:
+    # The shared backend only offers atomic incr, so the bucket is
+    # approximated by a counter per refill window (burst / rate seconds):
+    # the same long-run rate and burst, with at most one extra burst at a
+    # window boundary.
+    def __init__(self, state, prefix="rate:"):
+        self.state, self.prefix = state, prefix
+
+    async def take(self, key, cost, rate, burst):
+        window = burst / rate
+        now = time.time()
+        slot = int(now // window)
+        spent = await self.state.incr(f"{self.prefix}{key}:{slot}", cost, ttl=window * 2)
+        if spent <= burst:
+            return 0
+        return (slot + 1) * window - now
+
+
+class RateLimiter:
+    def __init__(self, rate, burst, costs=None, buckets=None):
+        self.rate, self.burst = rate, burst
+        self.costs = costs or {}
+        self.buckets = buckets or LocalBuckets()
+        self.allowed = Counter()
+        self.limited = Counter()
+
+    def cost(self, method, path):
+        return self.costs.get(f"{method} {path}", 1)
+
+    async def check(self, key, method, path):
+        """Returns 0 if the request may proceed, else the Retry-After in seconds."""
+        route = f"{method} {path}"
+        retry_after = await self.buckets.take(key, min(self.cost(method, path), self.burst), self.rate, self.burst)
+        if retry_after:
+            self.limited[route] += 1
+            return max(1, math.ceil(retry_after))
+        self.allowed[route] += 1
+        return 0
+
+    def stats(self):
+        return {"rate": self.rate, "burst": self.burst, "allowed": sum(self.allowed.values()),
+                "limited": dict(self.limited.most_common(20))}
+
+
+class InFlightLimiter:
+    def __init__(self, limit):
+        self.limit = limit
+        self.in_flight = 0
+        self.peak = 0
+        self.shed = 0
+
+    def enter(self):
+        if self.limit and self.in_flight >= self.limit:
+            self.shed += 1
+            return False
+        self.in_flight += 1
+        self.peak = max(self.peak, self.in_flight)
+        return True
+
+    def leave(self):
+        self.in_flight -= 1
+
+    def stats(self):
+        return {"limit": self.limit, "in_flight": self.in_flight, "peak": self.peak, "shed": self.shed}
@@ -0,0 +1,231 @@
+"""
+In-process asyncio job scheduler. Every worker runs one, but only the worker
+holding the Mongo leader lock (`scheduler_locks`) actually executes jobs, so
+adding workers never duplicates a Sunday check-in. Without a database
+(STORAGE_BACKEND=sqlite, always a single worker) it is the leader and keeps
+job state in memory.
+"""
+import asyncio
+import logging
+import os
+import socket
+import uuid
+from datetime import datetime, timezone, timedelta
+
+from pymongo.errors import DuplicateKeyError
+
+logger = logging.getLogger(__name__)
+
+
+class every:
+    """Run every `seconds` seconds."""
+    def __init__(self, seconds):
+        self.seconds = seconds
+
+    def next_after(self, last):
+        return last + timedelta(seconds=self.seconds)
+
+
+class daily:
+    """Run once a day at hour:minute UTC."""
+    def __init__(self, hour=0, minute=0):
+        self.hour, self.minute = hour, minute
+
+    def next_after(self, last):
+        candidate = last.replace(hour=self.hour, minute=self.minute, second=0, microsecond=0)
+        if candidate <= last:
+            candidate += timedelta(days=1)
+        return candidate
+
+
+class weekly:
+    """Run once a week on `weekday` (Mon=0 .. Sun=6) at hour:minute UTC."""
+    def __init__(self, weekday, hour=0, minute=0):
+        self.weekday, self.hour, self.minute = weekday, hour, minute
+
+    def next_after(self, last):
+        candidate = last.replace(hour=self.hour, minute=self.minute, second=0, microsecond=0)
+        candidate += timedelta(days=(self.weekday - candidate.weekday()) % 7)
+        if candidate <= last:
+            candidate += timedelta(days=7)
+        return candidate
+
+
+class JobRunning(Exception):
+    """run_job was asked for a job that is already running (here or in another worker)."""
+
+
+class Scheduler:
+    def __init__(self, db, lock_name="scheduler", lease_seconds=60, tick_seconds=15, max_runtime_hours=6):
+        self.db = db
+        self.lock_name = lock_name
+        self.lease = timedelta(seconds=lease_seconds)
+        self.tick_seconds = tick_seconds
+        # A run's claim expires after this, so a worker dying mid-job doesn't block the job for good
+        self.max_runtime = timedelta(hours=max_runtime_hours)
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self.jobs = {}
+        self.is_leader = False
+        self._task = None
+        self._running = set()
+        # Strong references: the loop only keeps weak ones, so a fire-and-forget task can vanish mid-run
+        self._tasks = set()
+        self._states = {}
+
+    def add_job(self, name, func, trigger):
+        self.jobs[name] = {"func": func, "trigger": trigger, "last_result": None, "last_error": None}
+
+    async def _acquire_lock(self):
+        if self.db is None:
+            return True
+        now = datetime.now(timezone.utc)
+        try:
+            await self.db.scheduler_locks.find_one_and_update(
+                {"_id": self.lock_name, "$or": [{"owner": self.owner}, {"expires_at": {"$lt": now}}]},
+                {"$set": {"owner": self.owner, "expires_at": now + self.lease, "renewed_at": now}},
+                upsert=True)
+            return True
+        except DuplicateKeyError:
+            # Lock document exists, is held by someone else and has not expired
+            return False
+
+    async def _release_lock(self):
+        if self.db is None:
+            return
+        await self.db.scheduler_locks.delete_one({"_id": self.lock_name, "owner": self.owner})
+
+    async def _due_jobs(self, now):
+        due = []
+        for name, job in self.jobs.items():
+            if name in self._running:
+                continue
+            state = await self._get_state(name)
+            next_run = (state or {}).get("next_run")
+            if next_run is None:
+                # First sighting: schedule from now instead of firing immediately
+                await self._init_state(name, job["trigger"].next_after(now))
+                continue
+            if next_run.tzinfo is None:
+                next_run = next_run.replace(tzinfo=timezone.utc)
+            if next_run <= now:
+                due.append(name)
+        return due
+
+    async def _get_state(self, name):
+        if self.db is None:
+            return self._states.get(name)
+        return await self.db.scheduler_jobs.find_one({"_id": name})
+
+    async def _init_state(self, name, next_run):
+        if self.db is None:
+            self._states.setdefault(name, {"_id": name, "next_run": next_run})
+            return
+        await self.db.scheduler_jobs.update_one({"_id": name}, {"$setOnInsert": {"next_run": next_run}}, upsert=True)
+
+    async def _set_state(self, name, values):
+        if self.db is None:
+            self._states.setdefault(name, {"_id": name}).update(values)
+            return
+        await self.db.scheduler_jobs.update_one({"_id": name}, {"$set": values}, upsert=True)
+
+    def is_running(self, name):
+        return name in self._running
+
+    async def _claim(self, name, now):
+        # Same trick as the leader lock: the upsert collides with a live claim held elsewhere.
+        # A job first run by hand gets its next_run here, as _init_state would have given it
+        if self.db is None:
+            return True
+        try:
+            await self.db.scheduler_jobs.find_one_and_update(
+                {"_id": name, "$or": [{"running_until": None}, {"running_until": {"$lt": now}}]},
+                {"$set": {"running_until": now + self.max_runtime},
+                 "$setOnInsert": {"next_run": self.jobs[name]["trigger"].next_after(now)}}, upsert=True)
+            return True
+        except DuplicateKeyError:
+            return False
+
+    async def run_job(self, name):
+        """Runs `name` now; raises JobRunning if a run is already in progress."""
+        job = self.jobs[name]
+        if name in self._running:
+            raise JobRunning(name)
+        self._running.add(name)
+        started = datetime.now(timezone.utc)
+        try:
+            if not await self._claim(name, started):
+                raise JobRunning(name)
+        except BaseException:
+            self._running.discard(name)
+            raise
+        try:
+            result = await job["func"]()
+            job["last_result"], job["last_error"] = result, None
+            logger.info(f"Job {name} finished: {result}")
+        except Exception as e:
+            job["last_error"] = str(e)
+            logger.error(f"Job {name} failed: {e}")
+            result = None
+        finally:
+            self._running.discard(name)
+        await self._set_state(name, {
+            "last_run": started, "next_run": job["trigger"].next_after(started),
+            "last_result": result, "last_error": job["last_error"], "running_until": None})
+        return result
+
+    def _job_done(self, task):
+        self._tasks.discard(task)
+        error = None if task.cancelled() else task.exception()
+        # JobRunning: a manual run from another worker got there first
+        if error is not None and not isinstance(error, JobRunning):
+            logger.error(f"Job task failed: {error!r}")
+
+    async def _loop(self):
+        while True:
+            try:
+                self.is_leader = await self._acquire_lock()
+                if self.is_leader:
+                    now = datetime.now(timezone.utc)
+                    for name in await self._due_jobs(now):
+                        task = asyncio.create_task(self.run_job(name))
+                        self._tasks.add(task)
+                        task.add_done_callback(self._job_done)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.is_leader = False
+                logger.warning(f"Scheduler tick failed: {e}")
+            await asyncio.sleep(self.tick_seconds)
+
+    def start(self):
+        if not self._task:
+            self._task = asyncio.create_task(self._loop())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self.is_leader:
+            try:
+                await self._release_lock()
+            except Exception as e:
+                logger.warning(f"Scheduler lock release failed: {e}")
+            self.is_leader = False
+
+    async def status(self):
+        if self.db is None:
+            states = self._states
+        else:
+            states = {s["_id"]: s async for s in self.db.scheduler_jobs.find({})}
+        jobs = []
+        for name, job in self.jobs.items():
+            st = states.get(name, {})
+            jobs.append({"name": name, "running": name in self._running,
+                         "last_run": st.get("last_run"), "next_run": st.get("next_run"),
+                         "last_result": job["last_result"] or st.get("last_result"),
+                         "last_error": job["last_error"] or st.get("last_error")})
+        return {"owner": self.owner, "is_leader": self.is_leader, "jobs": jobs}
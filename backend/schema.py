@@ -0,0 +1,182 @@
+"""
+Storage schema codec for the per-user log collections.
+
+SCHEMA_MODE selects how documents are written:
+  legacy     `date` as "YYYY-MM-DD", timestamps as ISO strings, `id` as UUID text (default)
+  migrating  writes compact, reads/queries match both forms (run `manage.py migrate-schema`)
+  compact    `date` as an int day number, timestamps as BSON dates, `id` as binary UUID
+
+Decoding is type-driven and always on, so API responses look the same
+whatever form a document is stored in.
+"""
+import os
+import uuid
+from datetime import date as date_cls, datetime, timezone, timedelta
+
+from bson.binary import Binary, UuidRepresentation
+
+MODE = os.environ.get("SCHEMA_MODE", "legacy")
+if MODE not in ("legacy", "migrating", "compact"):
+    raise ValueError(f"Unknown SCHEMA_MODE: {MODE}")
+
+COMPACT_COLLECTIONS = ["weight_logs", "workouts", "measurements", "steps", "water",
+                       "nutrition", "body_comp", "progress_photos", "meal_templates", "health_reports"]
+DATE_FIELDS = {"date"}
+TIME_FIELDS = {"timestamp", "createdAt", "created_at", "updated_at", "synced_at"}
+ID_FIELDS = {"id"}
+# BSON dates hold milliseconds: the microseconds below that, per time field, so reads are exact
+SUB_MS_FIELD = "sub_ms"
+
+EPOCH = date_cls(1970, 1, 1)
+
+
+def day_number(value):
+    try:
+        return (date_cls.fromisoformat(value) - EPOCH).days
+    except (TypeError, ValueError):
+        return value
+
+
+def day_string(value):
+    if isinstance(value, int) and not isinstance(value, bool):
+        return (EPOCH + timedelta(days=value)).isoformat()
+    if isinstance(value, datetime):
+        # Time-series collections need a BSON date as the time field
+        return value.date().isoformat()
+    return value
+
+
+def day_datetime(value):
+    try:
+        return datetime.combine(date_cls.fromisoformat(value), datetime.min.time(), tzinfo=timezone.utc)
+    except (TypeError, ValueError):
+        return value
+
+
+def _to_datetime(value):
+    # (BSON-ready datetime, sub-millisecond microseconds); a string that would not read
+    # back identically (naive, non-UTC offset, "Z") is kept as it is
+    try:
+        dt = datetime.fromisoformat(value)
+    except (TypeError, ValueError):
+        return value, 0
+    if dt.utcoffset() != timedelta(0) or dt.isoformat() != value:
+        return value, 0
+    sub_ms = dt.microsecond % 1000
+    return dt.replace(microsecond=dt.microsecond - sub_ms), sub_ms
+
+
+def _from_datetime(value, sub_ms=0):
+    if isinstance(value, datetime):
+        value = value if value.tzinfo else value.replace(tzinfo=timezone.utc)
+        return value.replace(microsecond=value.microsecond + sub_ms).isoformat()
+    return value
+
+
+def _to_uuid(value):
+    try:
+        return Binary.from_uuid(uuid.UUID(value), UuidRepresentation.STANDARD)
+    except (TypeError, ValueError, AttributeError):
+        return value
+
+
+def _from_uuid(value):
+    if isinstance(value, Binary) and value.subtype == 4:
+        return str(value.as_uuid(UuidRepresentation.STANDARD))
+    if isinstance(value, uuid.UUID):
+        return str(value)
+    return value
+
+
+def compact(doc):
+    out = {}
+    for k, v in doc.items():
+        if k in DATE_FIELDS and isinstance(v, str):
+            v = day_number(v)
+        elif k in TIME_FIELDS and isinstance(v, str):
+            v, sub_ms = _to_datetime(v)
+            if sub_ms:
+                out.setdefault(SUB_MS_FIELD, {})[k] = sub_ms
+        elif k in ID_FIELDS and isinstance(v, str):
+            v = _to_uuid(v)
+        out[k] = v
+    return out
+
+
+def encode(doc):
+    # Always a copy: insert_one adds `_id` to the dict it is given
+    return dict(doc) if MODE == "legacy" else compact(doc)
+
+
+def decode(doc):
+    if not doc:
+        return doc
+    out, sub_ms = {}, doc.get(SUB_MS_FIELD) or {}
+    for k, v in doc.items():
+        if k == SUB_MS_FIELD:
+            continue
+        if k in DATE_FIELDS:
+            v = day_string(v)
+        elif k in TIME_FIELDS:
+            v = _from_datetime(v, sub_ms.get(k, 0))
+        elif k in ID_FIELDS:
+            v = _from_uuid(v)
+        out[k] = v
+    return out
+
+
+def decode_all(docs):
+    return [decode(d) for d in docs]
+
+
+def now_iso():
+    return datetime.now(timezone.utc).isoformat()
+
+
+def projection(fields=None):
+    """Find projection returning just `fields` (all when None), plus what decode needs."""
+    if not fields:
+        return {"_id": 0}
+    return {"_id": 0, SUB_MS_FIELD: 1, **{f: 1 for f in fields}}
+
+
+def _eq(field, value):
+    if field in DATE_FIELDS:
+        new = day_number(value)
+    elif field in ID_FIELDS:
+        new = _to_uuid(value)
+    else:
+        return value
+    if MODE == "legacy" or new is value:
+        return value
+    if MODE == "compact":
+        return new
+    return {"$in": [value, new]}
+
+
+def match(**fields):
+    """Equality filter whose date/id values match the stored representation(s)."""
+    return {k: _eq(k, v) for k, v in fields.items()}
+
+
+def date_range(gte=None, lte=None, field="date"):
+    """Filter fragment for a date range; merge it into the query dict."""
+    def bounds(conv):
+        cond = {}
+        if gte is not None:
+            cond["$gte"] = conv(gte)
+        if lte is not None:
+            cond["$lte"] = conv(lte)
+        return cond
+    if MODE == "legacy":
+        return {field: bounds(lambda v: v)}
+    if MODE == "compact":
+        return {field: bounds(day_number)}
+    # String and int values never compare across BSON types, so match each form separately
+    return {"$or": [{field: bounds(lambda v: v)}, {field: bounds(day_number)}]}
+
+
+def legacy_filter():
+    # Documents still holding at least one legacy-typed field
+    fields = sorted(DATE_FIELDS | TIME_FIELDS | ID_FIELDS)
+    return {"$or": [{f: {"$type": "string"}} for f in fields]}
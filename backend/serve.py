@@ -0,0 +1,58 @@
+"""
+Production launcher for the FitForge API.
+
+    python serve.py                 # one uvicorn worker per available core
+    WEB_CONCURRENCY=4 python serve.py
+    FORWARDED_ALLOW_IPS=10.0.0.5 python serve.py   # behind an ingress at 10.0.0.5
+
+Each worker is a separate process with its own event loop, so bcrypt, JSON
+encoding and image handling spread across all cores. With more than one
+worker, SHARED_STATE defaults to `mongo` so counters and caches agree across
+processes, and only the worker holding the scheduler lease runs jobs.
+STORAGE_BACKEND=sqlite always runs a single worker.
+"""
+import os
+
+import uvicorn
+
+
+def available_cores():
+    # Respects container CPU affinity, unlike os.cpu_count()
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+def worker_count():
+    if os.environ.get("STORAGE_BACKEND") == "sqlite":
+        # One process owns the database file; see sqlite_storage.py
+        return 1
+    configured = os.environ.get("WEB_CONCURRENCY")
+    if configured:
+        return max(1, int(configured))
+    return max(1, min(available_cores(), int(os.environ.get("MAX_WORKERS", "8"))))
+
+
+def trusted_proxies():
+    # Proxies whose X-Forwarded-For entry is believed (comma-separated addresses). The client address is
+    # the rightmost entry not on this list, i.e. the one the ingress appended; the rest is client-supplied.
+    trusted = os.environ.get("FORWARDED_ALLOW_IPS", "127.0.0.1")
+    if "*" in (h.strip() for h in trusted.split(",")):
+        # uvicorn would then take the leftmost entry, which any client can set
+        raise RuntimeError("FORWARDED_ALLOW_IPS=* lets clients pick their own address; list the proxy addresses")
+    return trusted
+
+
+def main():
+    workers = worker_count()
+    # Workers read these at import; set them before uvicorn forks
+    os.environ["WEB_CONCURRENCY"] = str(workers)
+    if workers > 1:
+        os.environ.setdefault("SHARED_STATE", "mongo")
+    uvicorn.run("server:app", host=os.environ.get("HOST", "0.0.0.0"), port=int(os.environ.get("PORT", "8001")),
+                workers=workers, proxy_headers=True, forwarded_allow_ips=trusted_proxies())
+
+
+if __name__ == "__main__":
+    main()
@@ -1,34 +1,104 @@
 from fastapi import FastAPI, APIRouter, HTTPException, Request, Depends, File, UploadFile, Response
+from fastapi.responses import JSONResponse
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
-from motor.motor_asyncio import AsyncIOMotorClient, AsyncIOMotorGridFSBucket
-from bson import ObjectId
+from motor.motor_asyncio import AsyncIOMotorClient
+import pymongo
+from pymongo.errors import PyMongoError
 import os
 import logging
 import uuid
-import json
-import httpx
+import asyncio
+import contextlib
 from pathlib import Path
 from pydantic import BaseModel, Field, ConfigDict, field_validator
 from typing import List, Optional
 from datetime import datetime, timezone, timedelta
 import jwt as pyjwt
-import bcrypt
-from pywebpush import webpush, WebPushException
-from cryptography.hazmat.primitives.asymmetric import ec
-from cryptography.hazmat.primitives import serialization
 import base64
+import hmac
+import time
+from scheduler import JobRunning, Scheduler, every, daily, weekly
+from shared_state import make_shared_state
+from ratelimit import RateLimiter, InFlightLimiter, LocalBuckets, SharedBuckets
+from singleflight import SingleFlight
+from mongo_pool import PoolStats
+from profiling import Profiler, ProfilingMiddleware
+import nutrition_sync
+from nutrition_sync import SyncService, MockConnector, HttpConnector
+from storage import make_storage, read_preference as storage_read_preference
+from health_reports import HealthReports
+from leaderboards import Leaderboards, BOARDS, STREAK, current_period, week_bounds, week_of
+import metrics
+import schema
+import trend
 
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
 
-mongo_url = os.environ['MONGO_URL']
-client = AsyncIOMotorClient(mongo_url)
-db = client[os.environ['DB_NAME']]
+# `mongo` (default) or `sqlite` for single-node installs without a MongoDB server
+STORAGE_BACKEND = os.environ.get('STORAGE_BACKEND', 'mongo')
+# Connections per worker process (so WEB_CONCURRENCY x this in total), and how long to wait for a usable server
+MONGO_MAX_POOL_SIZE = int(os.environ.get('MONGO_MAX_POOL_SIZE', '100'))
+MONGO_MIN_POOL_SIZE = int(os.environ.get('MONGO_MIN_POOL_SIZE', '0'))
+MONGO_SERVER_SELECTION_TIMEOUT_MS = int(os.environ.get('MONGO_SERVER_SELECTION_TIMEOUT_MS', '5000'))
+# Deadline for all of a request's Mongo work (pool wait + maxTimeMS) unless ROUTE_DEADLINES says otherwise; 0 disables
+MONGO_MAX_TIME_MS = int(os.environ.get('MONGO_MAX_TIME_MS', '10000'))
+# `primary` (default) or `secondaryPreferred` for the log reads of HEAVY_READ_ROUTES
+MONGO_HEAVY_READ_PREFERENCE = os.environ.get('MONGO_HEAVY_READ_PREFERENCE', 'primary')
+if STORAGE_BACKEND == 'mongo':
+    mongo_url = os.environ['MONGO_URL']
+    mongo_pool = PoolStats()
+    client = AsyncIOMotorClient(mongo_url, maxPoolSize=MONGO_MAX_POOL_SIZE, minPoolSize=MONGO_MIN_POOL_SIZE,
+                                serverSelectionTimeoutMS=MONGO_SERVER_SELECTION_TIMEOUT_MS,
+                                event_listeners=[mongo_pool])
+    db = client[os.environ['DB_NAME']]
+else:
+    client = db = mongo_pool = None
 
 GOOGLE_CLIENT_ID = os.environ.get('GOOGLE_CLIENT_ID')
 GOOGLE_CLIENT_SECRET = os.environ.get('GOOGLE_CLIENT_SECRET')
 JWT_SECRET = os.environ['JWT_SECRET']
+ADMIN_TOKEN = os.environ.get('ADMIN_TOKEN')
+SCHEDULER_ENABLED = os.environ.get('SCHEDULER_ENABLED', 'true').lower() in ('1', 'true', 'yes')
+PUSH_MAX_WORKERS = int(os.environ.get('PUSH_MAX_WORKERS', '16'))
+PUSH_PER_ORIGIN = int(os.environ.get('PUSH_PER_ORIGIN', '8'))
+PUSH_BATCH_SIZE = int(os.environ.get('PUSH_BATCH_SIZE', '500'))
+WORKERS = int(os.environ.get('WEB_CONCURRENCY', '1'))
+# Per-process state silently diverges once there is more than one worker
+SHARED_STATE = os.environ.get('SHARED_STATE', 'mongo' if WORKERS > 1 else 'local')
+# `documents` (one regular document per reading) or `timeseries`; mongo only
+MEASUREMENT_STORAGE = os.environ.get('MEASUREMENT_STORAGE', 'documents')
+SQLITE_PATH = os.environ.get('SQLITE_PATH', str(ROOT_DIR / 'fitforge.db'))
+# `table` keeps uploaded files in the database, `disk` next to it in <SQLITE_PATH>.files/
+SQLITE_BLOBS = os.environ.get('SQLITE_BLOBS', 'table')
+# Token buckets per user (tokens/s, bucket size) and per client IP on the auth routes
+RATE_LIMIT_ENABLED = os.environ.get('RATE_LIMIT_ENABLED', 'true').lower() in ('1', 'true', 'yes')
+RATE_LIMIT_RATE = float(os.environ.get('RATE_LIMIT_RATE', '20'))
+RATE_LIMIT_BURST = float(os.environ.get('RATE_LIMIT_BURST', '100'))
+AUTH_RATE_LIMIT_RATE = float(os.environ.get('AUTH_RATE_LIMIT_RATE', '1'))
+AUTH_RATE_LIMIT_BURST = float(os.environ.get('AUTH_RATE_LIMIT_BURST', '60'))
+# `local` (per worker) or `shared` (SHARED_STATE backend, one budget across workers)
+RATE_LIMIT_STATE = os.environ.get('RATE_LIMIT_STATE', 'local')
+# Connector for newly linked diaries: `mock`, or `http` once NUTRITION_HTTP_URL is set
+NUTRITION_CONNECTOR = os.environ.get('NUTRITION_CONNECTOR', 'mock')
+NUTRITION_HTTP_URL = os.environ.get('NUTRITION_HTTP_URL')
+# Concurrent fetches per connector, and the UTC hour of the nightly sync of every linked account
+NUTRITION_SYNC_CONCURRENCY = int(os.environ.get('NUTRITION_SYNC_CONCURRENCY', '8'))
+NUTRITION_SYNC_HOUR = int(os.environ.get('NUTRITION_SYNC_HOUR', '3'))
+# How long /mfp waits for its background sync before answering `queued`
+NUTRITION_SYNC_WAIT = float(os.environ.get('NUTRITION_SYNC_WAIT', '5'))
+# Processes computing the Monday health reports in the server (manage.py health-reports uses one per core)
+HEALTH_REPORT_WORKERS = int(os.environ.get('HEALTH_REPORT_WORKERS', '2'))
+# Share of requests profiled without asking (0 = only X-Profile requests from admins)
+PROFILE_SAMPLE_RATE = float(os.environ.get('PROFILE_SAMPLE_RATE', '0'))
+# Sampling interval while a profiled request runs, and how long its dump is kept
+PROFILE_INTERVAL_MS = float(os.environ.get('PROFILE_INTERVAL_MS', '1'))
+PROFILE_TTL = int(os.environ.get('PROFILE_TTL', '900'))
+# Requests one worker serves at once before shedding with 503; 0 disables
+MAX_IN_FLIGHT = int(os.environ.get('MAX_IN_FLIGHT', '256'))
+if STORAGE_BACKEND == 'sqlite' and (WORKERS > 1 or SHARED_STATE != 'local'):
+    raise RuntimeError("STORAGE_BACKEND=sqlite runs a single worker with SHARED_STATE=local")
 
 app = FastAPI()
 api_router = APIRouter(prefix="/api")
@@ -36,45 +106,195 @@ api_router = APIRouter(prefix="/api")
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
-# --- GridFS Storage ---
-async def upload_to_gridfs(data: bytes, filename: str, content_type: str) -> str:
-    bucket = AsyncIOMotorGridFSBucket(db)
-    file_id = await bucket.upload_from_stream(filename, data, metadata={"content_type": content_type})
-    return str(file_id)
+storage = make_storage(STORAGE_BACKEND, db, measurement_storage=MEASUREMENT_STORAGE,
+                       sqlite_path=SQLITE_PATH, sqlite_blobs=SQLITE_BLOBS)
+shared_state = make_shared_state(SHARED_STATE, db)
+
+# --- Admission control ---
+# Tokens a request spends; anything not listed costs 1
+ROUTE_COSTS = {
+    "POST /api/auth/register": 10,
+    "POST /api/auth/login": 5,
+    "POST /api/auth/google": 5,
+    "POST /api/upload/avatar": 10,
+    "POST /api/progress-photos": 10,
+    "POST /api/mfp-scrape": 10,
+    "POST /api/mfp": 10,
+    "POST /api/push/send-checkin": 5,
+    "POST /api/projection": 5,
+    "GET /api/stats/range": 3,
+    "GET /api/stats": 2,
+}
+
+# Mongo deadlines (ms) for routes that legitimately take longer than MONGO_MAX_TIME_MS
+ROUTE_DEADLINES = {
+    "POST /api/upload/avatar": 30000,
+    "POST /api/progress-photos": 30000,
+    "GET /api/stats/range": 20000,
+    "GET /api/workouts/analytics": 20000,
+}
+# Read-only history views that can tolerate replication lag
+HEAVY_READ_ROUTES = {
+    "GET /api/weight-logs", "GET /api/workouts", "GET /api/measurements", "GET /api/steps",
+    "GET /api/workout-heatmap", "GET /api/workouts/analytics", "GET /api/stats/range", "GET /api/health-reports",
+}
+READ_PREFERENCES = {"primary": None, "secondaryPreferred": pymongo.ReadPreference.SECONDARY_PREFERRED}
+if MONGO_HEAVY_READ_PREFERENCE not in READ_PREFERENCES:
+    raise ValueError(f"Unknown MONGO_HEAVY_READ_PREFERENCE: {MONGO_HEAVY_READ_PREFERENCE}")
+heavy_read_preference = READ_PREFERENCES[MONGO_HEAVY_READ_PREFERENCE]
+db_timeouts = 0
+
+def make_buckets(prefix):
+    if RATE_LIMIT_STATE == 'shared':
+        return SharedBuckets(shared_state, prefix)
+    if RATE_LIMIT_STATE == 'local':
+        return LocalBuckets()
+    raise ValueError(f"Unknown RATE_LIMIT_STATE: {RATE_LIMIT_STATE}")
+
+user_limiter = RateLimiter(RATE_LIMIT_RATE, RATE_LIMIT_BURST, ROUTE_COSTS, make_buckets("rate:user:"))
+ip_limiter = RateLimiter(AUTH_RATE_LIMIT_RATE, AUTH_RATE_LIMIT_BURST, ROUTE_COSTS, make_buckets("rate:ip:"))
+in_flight = InFlightLimiter(MAX_IN_FLIGHT)
+# Identical concurrent GETs (multi-tab clients, fetchAll, retries) share one computation
+reads = SingleFlight()
+
+async def enforce_limit(limiter, key, request: Request):
+    if not RATE_LIMIT_ENABLED:
+        return
+    retry_after = await limiter.check(key, request.method, request.url.path)
+    if retry_after:
+        raise HTTPException(429, "Too many requests", headers={"Retry-After": str(retry_after)})
 
-async def get_from_gridfs(file_id: str):
-    bucket = AsyncIOMotorGridFSBucket(db)
-    stream = await bucket.open_download_stream(ObjectId(file_id))
-    data = await stream.read()
-    content_type = (stream.metadata or {}).get("content_type", "application/octet-stream")
-    return data, content_type
+# --- File storage ---
+# Uploads are content-addressed and reference-counted by the storage backend
+FILE_GC_GRACE = timedelta(hours=1)
+FILE_GC_BATCH = 200
 
-async def delete_from_gridfs(file_id: str):
+async def release_file(file_id: str):
     try:
-        bucket = AsyncIOMotorGridFSBucket(db)
-        await bucket.delete(ObjectId(file_id))
+        await storage.files.release(file_id)
     except Exception as e:
-        logger.warning(f"GridFS delete failed for {file_id}: {e}")
+        logger.warning(f"File release failed for {file_id}: {e}")
+
+def file_id_from_url(url):
+    if url and url.startswith("/api/files/"):
+        return url[len("/api/files/"):]
+    return None
+
+async def referenced_file_ids():
+    refs = {file_id async for file_id in storage.progress_photos.values("file_id")}
+    for repo in (storage.users, storage.profiles):
+        # Only uploaded avatars; external (e.g. Google) picture URLs don't point at a stored file
+        refs.update([file_id_from_url(url) async for url in repo.values("avatarUrl", prefix="/api/files/")])
+    return refs
+
+async def sweep_files():
+    stats = await storage.files.sweep(await referenced_file_ids(), FILE_GC_GRACE, FILE_GC_BATCH)
+    logger.info(f"File sweep: {stats}")
+    return stats
 
 # --- VAPID ---
+# Loaded once per process and cached; only a cold process ever touches settings
 vapid_keys = {"private": None, "public": None}
+vapid_lock = asyncio.Lock()
 
 async def init_vapid():
-    existing = await db.settings.find_one({"type": "vapid_keys"}, {"_id": 0})
-    if existing:
+    if vapid_keys["private"]:
+        return
+    async with vapid_lock:
+        if vapid_keys["private"]:
+            return
+        existing = await storage.settings.get("vapid_keys")
+        if not existing:
+            from cryptography.hazmat.primitives.asymmetric import ec
+            from cryptography.hazmat.primitives import serialization
+            key = ec.generate_private_key(ec.SECP256R1())
+            priv = base64.urlsafe_b64encode(
+                key.private_numbers().private_value.to_bytes(32, 'big')
+            ).decode().rstrip('=')
+            pub = base64.urlsafe_b64encode(
+                key.public_key().public_bytes(serialization.Encoding.X962, serialization.PublicFormat.UncompressedPoint)
+            ).decode().rstrip('=')
+            # Workers booting together all try this; exactly one key pair wins and all adopt it
+            existing = await storage.settings.setdefault("vapid_keys", {"private_key": priv, "public_key": pub})
         vapid_keys["private"] = existing["private_key"]
         vapid_keys["public"] = existing["public_key"]
-        return
-    key = ec.generate_private_key(ec.SECP256R1())
-    priv = base64.urlsafe_b64encode(
-        key.private_numbers().private_value.to_bytes(32, 'big')
-    ).decode().rstrip('=')
-    pub = base64.urlsafe_b64encode(
-        key.public_key().public_bytes(serialization.Encoding.X962, serialization.PublicFormat.UncompressedPoint)
-    ).decode().rstrip('=')
-    await db.settings.insert_one({"type": "vapid_keys", "private_key": priv, "public_key": pub})
-    vapid_keys["private"] = priv
-    vapid_keys["public"] = pub
+
+# --- Push fan-out ---
+CHECKIN_PAYLOAD = {"title": "FitTrack Pro", "body": "Sunday Check-in! Plan your week ahead and log your weight."}
+push_dispatcher = None
+
+async def get_push_dispatcher():
+    global push_dispatcher
+    await init_vapid()
+    if push_dispatcher is None:
+        from push import PushDispatcher
+        push_dispatcher = PushDispatcher(vapid_keys["private"], max_workers=PUSH_MAX_WORKERS,
+                                         per_origin=PUSH_PER_ORIGIN)
+    return push_dispatcher
+
+async def record_push_report(report):
+    for k in ("sent", "failed", "retries"):
+        await shared_state.incr(f"push:{k}", getattr(report, k))
+    await shared_state.incr("push:expired", len(report.expired))
+
+async def prune_push_subs(endpoints):
+    if endpoints:
+        deleted = await storage.push_subs.delete_endpoints(endpoints)
+        logger.info(f"Pruned {deleted} expired push subscriptions")
+
+async def run_sunday_checkin():
+    dispatcher = await get_push_dispatcher()
+    totals = {"sent": 0, "failed": 0, "retries": 0, "expired": 0, "elapsed_s": 0.0}
+    batch = []
+    async def flush():
+        report = await dispatcher.send_many(batch, CHECKIN_PAYLOAD)
+        await record_push_report(report)
+        await prune_push_subs(report.expired)
+        for k, v in report.as_dict().items():
+            if k in totals:
+                totals[k] += v
+        batch.clear()
+    async for sub in storage.push_subs.all():
+        batch.append(sub)
+        if len(batch) >= PUSH_BATCH_SIZE:
+            await flush()
+    if batch:
+        await flush()
+    totals["elapsed_s"] = round(totals["elapsed_s"], 3)
+    totals["sends_per_sec"] = round(totals["sent"] / totals["elapsed_s"], 1) if totals["elapsed_s"] else 0.0
+    return totals
+
+# --- Nutrition sync ---
+def make_connectors():
+    connectors = [MockConnector(NUTRITION_SYNC_CONCURRENCY)]
+    if NUTRITION_HTTP_URL:
+        connectors.append(HttpConnector(NUTRITION_HTTP_URL, NUTRITION_SYNC_CONCURRENCY))
+    return connectors
+
+diary_sync = SyncService(storage, make_connectors())
+
+# --- Leaderboards ---
+rankings = Leaderboards(storage)
+
+async def refresh_rankings(refresh, *args):
+    # A failed refresh must not fail the write it follows; the reconcile job repairs the board
+    try:
+        await refresh(*args)
+    except Exception as e:
+        logger.warning(f"Leaderboard refresh failed ({refresh.__name__}): {e}")
+
+health_reports = HealthReports(storage, workers=HEALTH_REPORT_WORKERS)
+
+# Sunday 09:00 UTC check-in for every subscriber
+# Without MongoDB there is a single process, which is always the leader
+scheduler = Scheduler(db)
+scheduler.add_job("sunday_checkin", run_sunday_checkin, weekly(6, hour=9))
+scheduler.add_job("file_sweep", sweep_files, every(24 * 60 * 60))
+scheduler.add_job("nutrition_sync", diary_sync.run, daily(NUTRITION_SYNC_HOUR))
+# Just after UTC midnight, when streaks missing yesterday's weigh-in lapse
+scheduler.add_job("leaderboard_reconcile", rankings.reconcile, daily(0, 15))
+# Monday 04:00 UTC: last week's report for every user
+scheduler.add_job("health_reports", health_reports.run, weekly(0, hour=4))
 
 # --- Auth ---
 def create_token(user_id):
@@ -96,8 +316,20 @@ async def get_current_user(request: Request) -> str:
     uid = verify_token(auth[7:])
     if not uid:
         raise HTTPException(401, "Invalid or expired token")
+    await enforce_limit(user_limiter, uid, request)
+    request.state.user_id = uid
     return uid
 
+async def limit_by_ip(request: Request):
+    # Behind a proxy in FORWARDED_ALLOW_IPS this is the address that proxy appended to X-Forwarded-For
+    # (see serve.py); earlier, client-supplied entries are ignored
+    await enforce_limit(ip_limiter, request.client.host if request.client else "unknown", request)
+
+async def require_admin(request: Request):
+    token = request.headers.get("X-Admin-Token", "")
+    if not ADMIN_TOKEN or not hmac.compare_digest(token.encode(), ADMIN_TOKEN.encode()):
+        raise HTTPException(403, "Admin access required")
+
 # --- Models ---
 class GoogleAuthRequest(BaseModel):
     credential: str
@@ -160,10 +392,23 @@ class PushSubRequest(BaseModel):
     endpoint: str
     keys: dict
 
+class PushUnsubRequest(BaseModel):
+    endpoint: str
+
 class WaterUpdate(BaseModel):
     glasses: int
     date: Optional[str] = None
 
+class MealTemplateCreate(BaseModel):
+    name: str
+    date: Optional[str] = None  # day to build it from; today if omitted
+
+class MealTemplateApply(BaseModel):
+    start: str
+    end: str
+    weekdays: Optional[List[int]] = None  # 0=Mon .. 6=Sun; every day if omitted
+    overwrite: bool = True
+
 class NutritionManualCreate(BaseModel):
     mode: str  # 'total' or 'macros'
     calories: Optional[float] = None
@@ -179,6 +424,41 @@ class NutritionManualCreate(BaseModel):
             return None
         return v
 
+class ProjectionRequest(BaseModel):
+    calTargets: Optional[List[int]] = None
+    activityFactors: List[float] = [1.2]
+    exerciseKcal: List[int] = [0]
+    weeks: int = 52
+    adaptive: bool = True
+
+# --- Trend weight ---
+async def rebuild_weight_trend(user_id):
+    logs = await storage.weight_logs.find(user_id, fields=["date", "weight", "timestamp"])
+    state, points = trend.rebuild(logs)
+    if state:
+        current = await storage.trends.get(user_id)
+        state.update(user_id=user_id, version=(current or {}).get("version", 0) + 1)
+    await storage.trends.replace(user_id, state, points)
+    return len(points)
+
+async def update_weight_trend(user_id, day, weight):
+    # Optimistic concurrency on the per-user state doc; O(1) regardless of history length
+    for _ in range(3):
+        current = await storage.trends.get(user_id)
+        state, point = trend.apply_weight(current, day, weight)
+        if state is None:
+            # Backdated weigh-in: the smoothing has to be replayed
+            await rebuild_weight_trend(user_id)
+            return
+        version = (current or {}).get("version", 0)
+        state.update(user_id=user_id, version=version + 1)
+        if not await storage.trends.save(user_id, state, version):
+            continue
+        await storage.trends.put_point(user_id, point)
+        return
+    logger.warning(f"Trend update for {user_id} lost a race three times; rebuilding")
+    await rebuild_weight_trend(user_id)
+
 # --- Seed ---
 async def seed_user_data(user_id):
     weights = [
@@ -189,24 +469,56 @@ async def seed_user_data(user_id):
         {"id": str(uuid.uuid4()), "user_id": user_id, "weight": 89.5, "date": "2026-02-12", "timestamp": "2026-02-12T08:00:00+00:00"},
         {"id": str(uuid.uuid4()), "user_id": user_id, "weight": 89.0, "date": "2026-02-19", "timestamp": "2026-02-19T08:00:00+00:00"},
     ]
-    for w in weights:
-        await db.weight_logs.insert_one({**w})
+    await storage.weight_logs.insert_many(weights)
+    await rebuild_weight_trend(user_id)
     workouts = [
         {"id": str(uuid.uuid4()), "user_id": user_id, "type": "Chest + Triceps", "duration": 55, "calories": 420, "notes": "Heavy bench day", "date": "2026-02-17", "timestamp": "2026-02-17T10:00:00+00:00"},
         {"id": str(uuid.uuid4()), "user_id": user_id, "type": "HIIT Cardio", "duration": 30, "calories": 350, "notes": "Sprint intervals", "date": "2026-02-18", "timestamp": "2026-02-18T07:00:00+00:00"},
         {"id": str(uuid.uuid4()), "user_id": user_id, "type": "Back + Biceps", "duration": 50, "calories": 380, "notes": "Deadlift PR!", "date": "2026-02-19", "timestamp": "2026-02-19T10:00:00+00:00"},
     ]
-    for w in workouts:
-        await db.workouts.insert_one({**w})
+    await storage.workouts.insert_many(workouts)
+
+# --- Warm-up ---
+app_state = {"ready": False, "warm_up_s": None}
+
+async def ensure_indexes():
+    await storage.ensure_indexes()
+    if hasattr(shared_state, "ensure_indexes"):
+        await shared_state.ensure_indexes()
+
+async def warm_up():
+    # Open the pool, build indexes and cache VAPID keys before reporting ready
+    start = time.perf_counter()
+    await storage.ping()
+    await ensure_indexes()
+    await init_vapid()
+    app_state["warm_up_s"] = round(time.perf_counter() - start, 3)
+    app_state["ready"] = True
+    logger.info(f"Warm-up finished in {app_state['warm_up_s']}s")
 
 # --- Routes ---
 @api_router.get("/")
 async def root():
     return {"message": "FitForge API"}
 
+@api_router.get("/health")
+async def health():
+    return {"status": "ok"}
+
+@api_router.get("/health/ready")
+async def readiness():
+    if not app_state["ready"]:
+        try:
+            await warm_up()
+        except Exception as e:
+            logger.warning(f"Readiness warm-up failed: {e}")
+            raise HTTPException(503, "Not ready")
+    return {"status": "ready", "warm_up_s": app_state["warm_up_s"]}
+
 # REMINDER: DO NOT HARDCODE THE URL, OR ADD ANY FALLBACKS OR REDIRECT URLS, THIS BREAKS THE AUTH
-@api_router.post("/auth/google")
+@api_router.post("/auth/google", dependencies=[Depends(limit_by_ip)])
 async def google_auth(body: GoogleAuthRequest):
+    import httpx
     async with httpx.AsyncClient() as hc:
         resp = await hc.get(f"https://oauth2.googleapis.com/tokeninfo?id_token={body.credential}")
     if resp.status_code != 200:
@@ -218,49 +530,52 @@ async def google_auth(body: GoogleAuthRequest):
     name = gdata.get("name", "Athlete")
     picture = gdata.get("picture", "")
     google_id = gdata.get("sub")
-    user = await db.users.find_one({"google_id": google_id}, {"_id": 0})
+    user = await storage.users.find_one(google_id=google_id)
     if not user:
         user = {"id": str(uuid.uuid4()), "google_id": google_id, "email": email,
                 "name": name, "avatarUrl": picture, "createdAt": datetime.now(timezone.utc).isoformat()}
-        await db.users.insert_one({**user})
+        await storage.users.insert(user)
         profile = {"id": str(uuid.uuid4()), "user_id": user["id"], "name": name,
                    "weight": 90.0, "heightCm": 175.0, "age": 30, "gender": "male",
                    "calTarget": 1800, "goalKg": 80.0, "avatarUrl": picture,
                    "createdAt": datetime.now(timezone.utc).isoformat()}
-        await db.profiles.insert_one({**profile})
+        await storage.profiles.insert(profile)
         await seed_user_data(user["id"])
     token = create_token(user["id"])
     return {"token": token, "user": {"id": user["id"], "name": user.get("name", ""),
             "email": user.get("email", ""), "avatarUrl": user.get("avatarUrl", "")}}
 
-@api_router.post("/auth/register")
+@api_router.post("/auth/register", dependencies=[Depends(limit_by_ip)])
 async def register(body: RegisterRequest):
     if not body.email or not body.password or not body.name:
         raise HTTPException(400, "Name, email and password required")
-    existing = await db.users.find_one({"email": body.email})
+    existing = await storage.users.find_one(email=body.email)
     if existing:
         raise HTTPException(400, "Email already registered")
-    hashed = bcrypt.hashpw(body.password.encode(), bcrypt.gensalt()).decode()
+    import bcrypt
+    # bcrypt releases the GIL; hashing on a thread keeps the event loop serving
+    hashed = (await asyncio.to_thread(bcrypt.hashpw, body.password.encode(), bcrypt.gensalt())).decode()
     user = {"id": str(uuid.uuid4()), "email": body.email, "name": body.name,
             "password": hashed, "avatarUrl": "", "createdAt": datetime.now(timezone.utc).isoformat()}
-    await db.users.insert_one({**user})
+    await storage.users.insert(user)
     profile = {"id": str(uuid.uuid4()), "user_id": user["id"], "name": body.name,
                "weight": 90.0, "heightCm": 175.0, "age": 30, "gender": "male",
                "calTarget": 1800, "goalKg": 80.0, "avatarUrl": "",
                "createdAt": datetime.now(timezone.utc).isoformat()}
-    await db.profiles.insert_one({**profile})
+    await storage.profiles.insert(profile)
     await seed_user_data(user["id"])
     token = create_token(user["id"])
     return {"token": token, "user": {"id": user["id"], "name": user["name"], "email": user["email"], "avatarUrl": user["avatarUrl"]}}
 
-@api_router.post("/auth/login")
+@api_router.post("/auth/login", dependencies=[Depends(limit_by_ip)])
 async def login(body: LoginRequest):
     if not body.email or not body.password:
         raise HTTPException(400, "Email and password required")
-    user = await db.users.find_one({"email": body.email}, {"_id": 0})
+    user = await storage.users.find_one(email=body.email)
     if not user or not user.get("password"):
         raise HTTPException(401, "Invalid email or password")
-    valid = bcrypt.checkpw(body.password.encode(), user["password"].encode())
+    import bcrypt
+    valid = await asyncio.to_thread(bcrypt.checkpw, body.password.encode(), user["password"].encode())
     if not valid:
         raise HTTPException(401, "Invalid email or password")
     token = create_token(user["id"])
@@ -268,14 +583,15 @@ async def login(body: LoginRequest):
 
 @api_router.get("/auth/me")
 async def get_me(user_id: str = Depends(get_current_user)):
-    user = await db.users.find_one({"id": user_id}, {"_id": 0})
+    user = await storage.users.get(user_id)
     if not user:
         raise HTTPException(404, "User not found")
     return {"id": user["id"], "name": user.get("name", ""), "email": user.get("email", ""), "avatarUrl": user.get("avatarUrl", "")}
 
 @api_router.get("/profile")
+@reads.coalesce
 async def get_profile(user_id: str = Depends(get_current_user)):
-    profile = await db.profiles.find_one({"user_id": user_id}, {"_id": 0})
+    profile = await storage.profiles.get(user_id)
     if not profile:
         raise HTTPException(404, "Profile not found")
     return profile
@@ -284,163 +600,213 @@ async def get_profile(user_id: str = Depends(get_current_user)):
 async def update_profile(update: ProfileUpdate, user_id: str = Depends(get_current_user)):
     update_data = {k: v for k, v in update.model_dump().items() if v is not None}
     if update_data:
-        await db.profiles.update_one({"user_id": user_id}, {"$set": update_data})
+        await storage.profiles.update(user_id, update_data)
         if "weight" in update_data:
             wl = {"id": str(uuid.uuid4()), "user_id": user_id, "weight": update_data["weight"],
-                  "date": datetime.now(timezone.utc).strftime("%Y-%m-%d"), "timestamp": datetime.now(timezone.utc).isoformat()}
-            await db.weight_logs.insert_one(wl)
-    return await db.profiles.find_one({"user_id": user_id}, {"_id": 0})
+                  "date": datetime.now(timezone.utc).strftime("%Y-%m-%d"), "timestamp": schema.now_iso()}
+            await storage.weight_logs.insert(wl)
+            await update_weight_trend(user_id, wl["date"], wl["weight"])
+            await refresh_rankings(rankings.refresh_streak, user_id, wl["date"])
+    return await storage.profiles.get(user_id)
 
 @api_router.get("/weight-logs")
+@reads.coalesce
 async def get_weight_logs(user_id: str = Depends(get_current_user)):
-    return await db.weight_logs.find({"user_id": user_id}, {"_id": 0}).sort("date", 1).to_list(1000)
+    return await storage.weight_logs.find(user_id, limit=1000)
 
 @api_router.post("/weight-logs")
 async def add_weight_log(entry: WeightLogCreate, user_id: str = Depends(get_current_user)):
     log = {"id": str(uuid.uuid4()), "user_id": user_id, "weight": entry.weight,
-           "date": datetime.now(timezone.utc).strftime("%Y-%m-%d"), "timestamp": datetime.now(timezone.utc).isoformat()}
-    await db.weight_logs.insert_one({**log})
-    await db.profiles.update_one({"user_id": user_id}, {"$set": {"weight": entry.weight}})
+           "date": datetime.now(timezone.utc).strftime("%Y-%m-%d"), "timestamp": schema.now_iso()}
+    await storage.weight_logs.insert(log)
+    await storage.profiles.update(user_id, {"weight": entry.weight})
+    await update_weight_trend(user_id, log["date"], entry.weight)
+    await refresh_rankings(rankings.refresh_streak, user_id, log["date"])
     return log
 
+@api_router.get("/weight-trend")
+@reads.coalesce
+async def get_weight_trend(days: int = 90, user_id: str = Depends(get_current_user)):
+    days = max(1, min(days, 730))
+    state = await storage.trends.get(user_id)
+    if not state:
+        return {"trend": None, "avg7": None, "avg30": None, "weekly_rate": None, "series": []}
+    last = datetime.strptime(state["trend_date"], "%Y-%m-%d")
+    since = (last - timedelta(days=days)).strftime("%Y-%m-%d")
+    week_ago = (last - timedelta(days=7)).strftime("%Y-%m-%d")
+    series = await storage.trends.points_since(user_id, since, days + 1)
+    earlier = await storage.trends.point_at_or_before(user_id, week_ago)
+    now_point = {"date": state["trend_date"], "trend": state["trend"]}
+    return {"trend": round(state["trend"], 2), "avg7": round(state["avg7"], 2), "avg30": round(state["avg30"], 2),
+            "trend_date": state["trend_date"], "weekly_rate": trend.weekly_rate(now_point, earlier),
+            "series": series}
+
 @api_router.get("/workouts")
+@reads.coalesce
 async def get_workouts(user_id: str = Depends(get_current_user)):
-    return await db.workouts.find({"user_id": user_id}, {"_id": 0}).sort("timestamp", -1).to_list(100)
+    return await storage.workouts.find(user_id, order_by="timestamp", sort=-1, limit=100)
+
+WORKOUT_ANALYTICS_DAYS = 84
+WORKOUT_ANALYTICS_MAX_DAYS = 366
+WORKOUT_SUMS = ("duration", "calories")
+
+@api_router.get("/workouts/analytics")
+@reads.coalesce
+async def get_workout_analytics(start: Optional[str] = None, end: Optional[str] = None, type: Optional[str] = None,
+                                q: Optional[str] = None, limit: int = 20, user_id: str = Depends(get_current_user)):
+    # Totals per type and ISO week plus the newest matching workouts. The database returns one
+    # row per (day, type), so the response stays small however many workouts a user has.
+    try:
+        end_d = datetime.strptime(end, "%Y-%m-%d") if end else datetime.now(timezone.utc)
+        start_d = datetime.strptime(start, "%Y-%m-%d") if start else end_d - timedelta(days=WORKOUT_ANALYTICS_DAYS - 1)
+    except ValueError:
+        raise HTTPException(400, "start and end must be YYYY-MM-DD")
+    if end_d < start_d:
+        raise HTTPException(400, "end must not be before start")
+    if (end_d - start_d).days >= WORKOUT_ANALYTICS_MAX_DAYS:
+        raise HTTPException(400, f"Range is limited to {WORKOUT_ANALYTICS_MAX_DAYS} days")
+    start, end = start_d.strftime("%Y-%m-%d"), end_d.strftime("%Y-%m-%d")
+    filters = {"start": start, "end": end, "equals": {"type": type} if type else None,
+               "text": q.strip() if q and q.strip() else None}
+    rows, workouts = await asyncio.gather(
+        storage.workouts.grouped_totals(user_id, "type", WORKOUT_SUMS, **filters),
+        storage.workouts.search(user_id, limit=max(1, min(limit, 100)), **filters))
+
+    def rollup(key_of):
+        out = {}
+        for r in rows:
+            group = out.setdefault(key_of(r), dict.fromkeys(("count", *WORKOUT_SUMS), 0))
+            for f in group:
+                group[f] += r[f] or 0
+        return out
+    return {"start": start, "end": end, "type": type, "q": filters["text"],
+            "totals": rollup(lambda r: "all").get("all", dict.fromkeys(("count", *WORKOUT_SUMS), 0)),
+            "by_type": sorted(({"type": k, **v} for k, v in rollup(lambda r: r["type"]).items()),
+                              key=lambda g: -g["calories"]),
+            "by_week": sorted(({"week": k, **v} for k, v in rollup(lambda r: week_of(r["date"])).items()),
+                              key=lambda g: g["week"]),
+            "workouts": workouts}
 
 @api_router.post("/workouts")
 async def add_workout(entry: WorkoutCreate, user_id: str = Depends(get_current_user)):
     doc = {"id": str(uuid.uuid4()), "user_id": user_id, **entry.model_dump(),
-           "date": datetime.now(timezone.utc).strftime("%Y-%m-%d"), "timestamp": datetime.now(timezone.utc).isoformat()}
-    await db.workouts.insert_one({**doc})
-    return {k: v for k, v in doc.items() if k != "_id"}
+           "date": datetime.now(timezone.utc).strftime("%Y-%m-%d"), "timestamp": schema.now_iso()}
+    await storage.workouts.insert(doc)
+    await refresh_rankings(rankings.refresh_week, "workout_calories", user_id, doc["date"])
+    return doc
 
 @api_router.delete("/workouts/{workout_id}")
 async def delete_workout(workout_id: str, user_id: str = Depends(get_current_user)):
-    result = await db.workouts.delete_one({"id": workout_id, "user_id": user_id})
-    if result.deleted_count == 0:
+    workout = await storage.workouts.get(user_id, workout_id)
+    if not workout or not await storage.workouts.delete(user_id, workout_id):
         raise HTTPException(404, "Workout not found")
+    await refresh_rankings(rankings.refresh_week, "workout_calories", user_id, workout["date"])
     return {"message": "Deleted"}
 
 @api_router.get("/measurements")
+@reads.coalesce
 async def get_measurements(user_id: str = Depends(get_current_user)):
-    return await db.measurements.find({"user_id": user_id}, {"_id": 0}).sort("date", -1).to_list(100)
+    return await storage.measurements.find(user_id, sort=-1, limit=100)
 
 @api_router.post("/measurements")
 async def add_measurement(entry: MeasurementCreate, user_id: str = Depends(get_current_user)):
     doc = {"id": str(uuid.uuid4()), "user_id": user_id, **entry.model_dump(),
            "date": datetime.now(timezone.utc).strftime("%Y-%m-%d")}
-    await db.measurements.insert_one({**doc})
-    return {k: v for k, v in doc.items() if k != "_id"}
+    await storage.measurements.insert(doc)
+    return doc
 
 @api_router.get("/steps")
+@reads.coalesce
 async def get_steps(user_id: str = Depends(get_current_user)):
-    return await db.steps.find({"user_id": user_id}, {"_id": 0}).sort("date", -1).to_list(100)
+    return await storage.steps.find(user_id, sort=-1, limit=100)
 
 @api_router.post("/steps")
 async def add_steps(entry: StepsCreate, user_id: str = Depends(get_current_user)):
     date = entry.date or datetime.now(timezone.utc).strftime("%Y-%m-%d")
-    existing = await db.steps.find_one({"user_id": user_id, "date": date}, {"_id": 0})
-    if existing:
-        await db.steps.update_one({"user_id": user_id, "date": date}, {"$set": {"steps": entry.steps}})
-        return {**existing, "steps": entry.steps}
-    doc = {"id": str(uuid.uuid4()), "user_id": user_id, "steps": entry.steps, "date": date}
-    await db.steps.insert_one({**doc})
-    return {k: v for k, v in doc.items() if k != "_id"}
+    doc = await storage.steps.put_day(user_id, date, {"steps": entry.steps}, on_insert={"id": str(uuid.uuid4())})
+    await refresh_rankings(rankings.refresh_week, "steps", user_id, date)
+    return doc
 
 @api_router.post("/water")
 async def update_water(entry: WaterUpdate, user_id: str = Depends(get_current_user)):
     date = entry.date or datetime.now(timezone.utc).strftime("%Y-%m-%d")
-    await db.water.update_one({"user_id": user_id, "date": date},
-        {"$set": {"user_id": user_id, "date": date, "glasses": entry.glasses}}, upsert=True)
+    await storage.water.put_day(user_id, date, {"glasses": entry.glasses})
     return {"glasses": entry.glasses, "date": date}
 
 @api_router.get("/water")
+@reads.coalesce
 async def get_water(date: Optional[str] = None, user_id: str = Depends(get_current_user)):
     target_date = date or datetime.now(timezone.utc).strftime("%Y-%m-%d")
-    doc = await db.water.find_one({"user_id": user_id, "date": target_date}, {"_id": 0})
-    return doc or {"glasses": 0, "date": target_date}
+    return await storage.water.get_day(user_id, target_date) or {"glasses": 0, "date": target_date}
+
+# Diary sync (MOCKED by default - MFP has no public API); the fetch runs in the background
+async def link_and_sync(user_id, username):
+    if NUTRITION_CONNECTOR not in diary_sync.connectors:
+        raise HTTPException(503, f"Nutrition connector {NUTRITION_CONNECTOR} is not configured")
+    previous = await storage.nutrition_accounts.get(user_id) or {}
+    values = {"connector": NUTRITION_CONNECTOR, "username": username}
+    if any(previous.get(k) != v for k, v in values.items()):
+        # A different diary: start over instead of syncing only since the old one's last day
+        values.update(last_synced=None, linked_at=schema.now_iso())
+    await storage.nutrition_accounts.upsert(user_id, values)
+    task = diary_sync.enqueue({**previous, **values, "user_id": user_id})
+    # The sync may finish after this request has answered "queued"
+    task.add_done_callback(lambda _: reads.wrote(user_id))
+    try:
+        await asyncio.wait_for(asyncio.shield(task), NUTRITION_SYNC_WAIT)
+    except asyncio.TimeoutError:
+        return None
+    account = await storage.nutrition_accounts.get(user_id)
+    if account.get("status") == "error":
+        raise HTTPException(502, f"Diary sync failed: {account.get('last_error')}")
+    return await storage.nutrition.get_day(user_id, datetime.now(timezone.utc).strftime("%Y-%m-%d"))
 
-# MFP Scrape (MOCKED - MFP has no public API)
 @api_router.post("/mfp-scrape")
 async def mfp_scrape(body: MfpScrapeRequest, user_id: str = Depends(get_current_user)):
-    import random
-    meals = [
-        {"name": "Breakfast", "calories": random.randint(300, 500), "carbs": random.randint(30, 60), "protein": random.randint(15, 30), "fat": random.randint(10, 20)},
-        {"name": "Lunch", "calories": random.randint(400, 700), "carbs": random.randint(40, 80), "protein": random.randint(25, 45), "fat": random.randint(15, 30)},
-        {"name": "Dinner", "calories": random.randint(500, 800), "carbs": random.randint(50, 90), "protein": random.randint(30, 50), "fat": random.randint(20, 35)},
-        {"name": "Snacks", "calories": random.randint(100, 300), "carbs": random.randint(10, 30), "protein": random.randint(5, 15), "fat": random.randint(5, 15)},
-    ]
-    total = {"calories": sum(m["calories"] for m in meals), "carbs": sum(m["carbs"] for m in meals),
-             "protein": sum(m["protein"] for m in meals), "fat": sum(m["fat"] for m in meals)}
-    today = datetime.now(timezone.utc).strftime("%Y-%m-%d")
-    doc = {"id": str(uuid.uuid4()), "user_id": user_id, "date": today, "meals": meals, "total": total,
-           "username": body.username, "synced_at": datetime.now(timezone.utc).isoformat()}
-    await db.nutrition.update_one({"user_id": user_id, "date": today}, {"$set": doc}, upsert=True)
-    return {"meals": meals, "total": total, "message": f"Synced! {meals[0]['name']} {meals[0]['calories']}cal"}
+    doc = await link_and_sync(user_id, body.username)
+    if not doc:
+        return {"status": "queued", "message": "Sync started"}
+    meals = doc["meals"]
+    return {"meals": meals, "total": doc["total"], "message": f"Synced! {meals[0]['name']} {meals[0]['calories']}cal"}
 
-# Sync My Diary endpoint (MOCKED)
 @api_router.post("/mfp")
 async def sync_diary(body: MfpRequest, user_id: str = Depends(get_current_user)):
-    import random
-    name = body.username
-    meals = [
-        {"name": "Breakfast", "calories": random.randint(300, 500), "carbs": random.randint(30, 60), "protein": random.randint(15, 30), "fat": random.randint(10, 20)},
-        {"name": "Lunch", "calories": random.randint(400, 700), "carbs": random.randint(40, 80), "protein": random.randint(25, 45), "fat": random.randint(15, 30)},
-        {"name": "Dinner", "calories": random.randint(500, 800), "carbs": random.randint(50, 90), "protein": random.randint(30, 50), "fat": random.randint(20, 35)},
-        {"name": "Snacks", "calories": random.randint(100, 300), "carbs": random.randint(10, 30), "protein": random.randint(5, 15), "fat": random.randint(5, 15)},
-    ]
-    total = {"calories": sum(m["calories"] for m in meals), "carbs": sum(m["carbs"] for m in meals),
-             "protein": sum(m["protein"] for m in meals), "fat": sum(m["fat"] for m in meals)}
-    today = datetime.now(timezone.utc).strftime("%Y-%m-%d")
-    doc = {"id": str(uuid.uuid4()), "user_id": user_id, "date": today, "meals": meals, "total": total,
-           "username": name, "synced_at": datetime.now(timezone.utc).isoformat()}
-    await db.nutrition.update_one({"user_id": user_id, "date": today}, {"$set": doc}, upsert=True)
-    return {"name": name, "calories": total["calories"], "protein": total["protein"],
-            "carbs": total["carbs"], "fat": total["fat"], "meals": meals, "total": total}
+    doc = await link_and_sync(user_id, body.username)
+    if not doc:
+        return {"name": body.username, "status": "queued"}
+    total = doc["total"]
+    return {"name": body.username, "calories": total["calories"], "protein": total["protein"],
+            "carbs": total["carbs"], "fat": total["fat"], "meals": doc["meals"], "total": total}
 
 # Body Composition (Navy Method)
 @api_router.post("/body-composition")
 async def calc_body_comp(body: BodyCompRequest, user_id: str = Depends(get_current_user)):
-    import math
-    profile = await db.profiles.find_one({"user_id": user_id}, {"_id": 0})
+    profile = await storage.profiles.get(user_id)
     if not profile:
         raise HTTPException(404, "Profile not found")
-    height_cm = profile["heightCm"]
-    gender = profile["gender"]
-    if gender == "male":
-        bf = 86.010 * math.log10(body.waist - body.neck) - 70.041 * math.log10(height_cm) + 36.76
-    else:
-        hip = body.hip or 0
-        bf = 163.205 * math.log10(body.waist + hip - body.neck) - 97.684 * math.log10(height_cm) - 78.387
-    bf = max(2, min(round(bf, 1), 60))
-    # Categorize
-    if gender == "male":
-        cat = "Essential" if bf < 6 else "Athletic" if bf < 14 else "Fitness" if bf < 18 else "Average" if bf < 25 else "Above Average"
-    else:
-        cat = "Essential" if bf < 14 else "Athletic" if bf < 21 else "Fitness" if bf < 25 else "Average" if bf < 32 else "Above Average"
+    bf = metrics.navy_body_fat(profile["gender"], profile["heightCm"], body.waist, body.neck, body.hip)
+    cat = metrics.body_fat_category(bf, profile["gender"])
     # Store
     doc = {"id": str(uuid.uuid4()), "user_id": user_id, "body_fat": bf, "category": cat,
            "waist": body.waist, "neck": body.neck, "hip": body.hip,
            "date": datetime.now(timezone.utc).strftime("%Y-%m-%d")}
-    await db.body_comp.insert_one({**doc})
-    lean_mass = round(profile["weight"] * (1 - bf / 100), 1)
-    fat_mass = round(profile["weight"] * (bf / 100), 1)
+    await storage.body_comp.insert(doc)
+    lean_mass, fat_mass = metrics.lean_and_fat_mass(profile["weight"], bf)
     return {"body_fat": bf, "category": cat, "lean_mass": lean_mass, "fat_mass": fat_mass}
 
 @api_router.get("/body-composition")
+@reads.coalesce
 async def get_body_comp(user_id: str = Depends(get_current_user)):
-    docs = await db.body_comp.find({"user_id": user_id}, {"_id": 0}).sort("date", -1).to_list(20)
-    return docs
+    return await storage.body_comp.find(user_id, sort=-1, limit=20)
 
 # Workout Heatmap (last 12 weeks)
 @api_router.get("/workout-heatmap")
+@reads.coalesce
 async def get_workout_heatmap(user_id: str = Depends(get_current_user)):
     from datetime import timedelta
     today = datetime.now(timezone.utc).date()
     start = today - timedelta(weeks=12)
-    workouts = await db.workouts.find(
-        {"user_id": user_id, "date": {"$gte": start.isoformat()}}, {"_id": 0}
-    ).to_list(1000)
+    workouts = await storage.workouts.find(user_id, since=start.isoformat(), limit=1000)
     # Group by date
     heatmap = {}
     for w in workouts:
@@ -462,28 +828,33 @@ async def get_workout_heatmap(user_id: str = Depends(get_current_user)):
 @api_router.post("/progress-photos")
 async def upload_progress_photo(file: UploadFile = File(...), user_id: str = Depends(get_current_user)):
     data = await file.read()
-    file_id = await upload_to_gridfs(data, file.filename or "photo.png", file.content_type or "image/png")
+    file_id = await storage.files.put(data, file.filename or "photo.png", file.content_type or "image/png")
     doc = {"id": str(uuid.uuid4()), "user_id": user_id, "file_id": file_id,
            "date": datetime.now(timezone.utc).strftime("%Y-%m-%d"),
-           "timestamp": datetime.now(timezone.utc).isoformat()}
-    await db.progress_photos.insert_one({**doc})
+           "timestamp": schema.now_iso()}
+    try:
+        await storage.progress_photos.insert(doc)
+    except Exception:
+        await release_file(file_id)
+        raise
     return {"id": doc["id"], "file_id": file_id, "url": f"/api/files/{file_id}", "date": doc["date"]}
 
 @api_router.get("/progress-photos")
+@reads.coalesce
 async def get_progress_photos(user_id: str = Depends(get_current_user)):
-    photos = await db.progress_photos.find({"user_id": user_id}, {"_id": 0}).sort("timestamp", 1).to_list(100)
+    photos = await storage.progress_photos.find(user_id, order_by="timestamp", limit=100)
     for p in photos:
         p["url"] = f"/api/files/{p.get('file_id', p.get('storage_path', ''))}"
     return photos
 
 @api_router.delete("/progress-photos/{photo_id}")
 async def delete_progress_photo(photo_id: str, user_id: str = Depends(get_current_user)):
-    doc = await db.progress_photos.find_one({"id": photo_id, "user_id": user_id}, {"_id": 0})
+    doc = await storage.progress_photos.get(user_id, photo_id)
     if not doc:
         raise HTTPException(404, "Photo not found")
     if doc.get("file_id"):
-        await delete_from_gridfs(doc["file_id"])
-    await db.progress_photos.delete_one({"id": photo_id, "user_id": user_id})
+        await release_file(doc["file_id"])
+    await storage.progress_photos.delete(user_id, photo_id)
     return {"message": "Deleted"}
 
 @api_router.get("/nutrition/copy-yesterday")
@@ -491,13 +862,12 @@ async def copy_nutrition_from_yesterday(date: Optional[str] = None, user_id: str
     target_date = date or datetime.now(timezone.utc).strftime("%Y-%m-%d")
     d = datetime.strptime(target_date, "%Y-%m-%d")
     yesterday = (d - timedelta(days=1)).strftime("%Y-%m-%d")
-    yesterday_doc = await db.nutrition.find_one({"user_id": user_id, "date": yesterday}, {"_id": 0})
+    yesterday_doc = await storage.nutrition.get_day(user_id, yesterday)
     if not yesterday_doc or not yesterday_doc.get("total", {}).get("calories"):
         raise HTTPException(404, "No nutrition data found for previous day")
-    new_doc = {**yesterday_doc, "id": str(uuid.uuid4()), "date": target_date,
-               "source": "copied_from_yesterday", "updated_at": datetime.now(timezone.utc).isoformat()}
-    new_doc.pop("_id", None)
-    await db.nutrition.update_one({"user_id": user_id, "date": target_date}, {"$set": new_doc}, upsert=True)
+    new_doc = {k: v for k, v in yesterday_doc.items() if k not in ("user_id", "date")}
+    new_doc.update(id=str(uuid.uuid4()), source="copied_from_yesterday", updated_at=schema.now_iso())
+    await storage.nutrition.put_day(user_id, target_date, new_doc)
     return {"total": yesterday_doc["total"], "date": target_date, "source": "copied_from_yesterday", "from_date": yesterday}
 
 @api_router.post("/nutrition/manual")
@@ -513,149 +883,225 @@ async def log_nutrition_manual(entry: NutritionManualCreate, user_id: str = Depe
         total = {"calories": cal, "carbs": 0, "protein": 0, "fat": 0}
     meals = [{"name": "Manual Entry", "calories": total["calories"], "carbs": total["carbs"],
               "protein": total["protein"], "fat": total["fat"]}]
-    doc = {"id": str(uuid.uuid4()), "user_id": user_id, "date": target_date, "meals": meals,
-           "total": total, "source": "manual", "updated_at": datetime.now(timezone.utc).isoformat()}
-    await db.nutrition.update_one({"user_id": user_id, "date": target_date}, {"$set": doc}, upsert=True)
+    doc = {"id": str(uuid.uuid4()), "meals": meals, "total": total, "source": "manual",
+           "updated_at": schema.now_iso()}
+    await storage.nutrition.put_day(user_id, target_date, doc)
     return {"total": total, "date": target_date, "source": "manual"}
 
 @api_router.get("/nutrition")
+@reads.coalesce
 async def get_nutrition(date: Optional[str] = None, user_id: str = Depends(get_current_user)):
     target_date = date or datetime.now(timezone.utc).strftime("%Y-%m-%d")
-    doc = await db.nutrition.find_one({"user_id": user_id, "date": target_date}, {"_id": 0})
+    doc = await storage.nutrition.get_day(user_id, target_date)
     return doc or {"meals": [], "total": {"calories": 0, "carbs": 0, "protein": 0, "fat": 0}}
 
+# --- Meal templates ---
+TEMPLATE_APPLY_MAX_DAYS = 366
+
+@api_router.post("/nutrition/templates")
+async def create_meal_template(body: MealTemplateCreate, user_id: str = Depends(get_current_user)):
+    if not body.name.strip():
+        raise HTTPException(400, "Template name required")
+    source_date = body.date or datetime.now(timezone.utc).strftime("%Y-%m-%d")
+    day = await storage.nutrition.get_day(user_id, source_date)
+    if not day or not day.get("meals"):
+        raise HTTPException(404, f"No meals logged on {source_date}")
+    doc = {"id": str(uuid.uuid4()), "user_id": user_id, "name": body.name.strip(), "meals": day["meals"],
+           "total": day.get("total") or nutrition_sync.meal_totals(day["meals"]), "source_date": source_date,
+           "timestamp": schema.now_iso()}
+    await storage.meal_templates.insert(doc)
+    return doc
+
+@api_router.get("/nutrition/templates")
+@reads.coalesce
+async def get_meal_templates(user_id: str = Depends(get_current_user)):
+    return await storage.meal_templates.find(user_id, order_by="timestamp", sort=-1, limit=100)
+
+@api_router.delete("/nutrition/templates/{template_id}")
+async def delete_meal_template(template_id: str, user_id: str = Depends(get_current_user)):
+    if not await storage.meal_templates.delete(user_id, template_id):
+        raise HTTPException(404, "Template not found")
+    return {"message": "Deleted"}
+
+@api_router.post("/nutrition/templates/{template_id}/apply")
+async def apply_meal_template(template_id: str, body: MealTemplateApply, user_id: str = Depends(get_current_user)):
+    try:
+        start_d, end_d = datetime.strptime(body.start, "%Y-%m-%d"), datetime.strptime(body.end, "%Y-%m-%d")
+    except ValueError:
+        raise HTTPException(400, "start and end must be YYYY-MM-DD")
+    if end_d < start_d:
+        raise HTTPException(400, "end must not be before start")
+    if (end_d - start_d).days >= TEMPLATE_APPLY_MAX_DAYS:
+        raise HTTPException(400, f"Range is limited to {TEMPLATE_APPLY_MAX_DAYS} days")
+    if body.weekdays is not None and not set(body.weekdays) <= set(range(7)):
+        raise HTTPException(400, "weekdays must be 0 (Mon) to 6 (Sun)")
+    template = await storage.meal_templates.get(user_id, template_id)
+    if not template:
+        raise HTTPException(404, "Template not found")
+    dates = [d for d in metrics.date_range(body.start, body.end)
+             if body.weekdays is None or datetime.strptime(d, "%Y-%m-%d").weekday() in body.weekdays]
+    if not body.overwrite:
+        # One range read instead of a lookup per day
+        logged = await storage.nutrition.daily_values(user_id, body.start, body.end, "total.calories")
+        dates = [d for d in dates if d not in logged]
+    now = schema.now_iso()
+    values = {"meals": template["meals"], "total": template["total"], "source": "template",
+              "template_id": template_id, "updated_at": now}
+    # Every day in one bulk upsert
+    await storage.nutrition.put_days([(user_id, d, values, {"id": str(uuid.uuid4())}) for d in dates])
+    return {"template_id": template_id, "applied": len(dates), "dates": dates}
+
 @api_router.post("/upload/avatar")
 async def upload_avatar(file: UploadFile = File(...), user_id: str = Depends(get_current_user)):
     data = await file.read()
-    file_id = await upload_to_gridfs(data, file.filename or "avatar.png", file.content_type or "image/png")
+    file_id = await storage.files.put(data, file.filename or "avatar.png", file.content_type or "image/png")
     avatar_url = f"/api/files/{file_id}"
-    await db.users.update_one({"id": user_id}, {"$set": {"avatarUrl": avatar_url}})
-    await db.profiles.update_one({"user_id": user_id}, {"$set": {"avatarUrl": avatar_url}})
+    previous = await storage.users.update(user_id, {"avatarUrl": avatar_url})
+    await storage.profiles.update(user_id, {"avatarUrl": avatar_url})
+    old_id = file_id_from_url((previous or {}).get("avatarUrl"))
+    # Even when it is the same file: re-uploading identical bytes dedupes onto it and took a new ref
+    if old_id:
+        await release_file(old_id)
     return {"file_id": file_id, "url": avatar_url}
 
 @api_router.get("/files/{file_id:path}")
 async def serve_file(file_id: str):
     try:
-        data, content_type = await get_from_gridfs(file_id)
+        data, content_type = await storage.files.get(file_id)
         return Response(content=data, media_type=content_type)
     except Exception:
         raise HTTPException(404, "File not found")
 
 @api_router.get("/push/vapid-key")
 async def get_vapid_key():
-    if not vapid_keys["public"]:
-        await init_vapid()
+    await init_vapid()
     return {"publicKey": vapid_keys["public"]}
 
 @api_router.post("/push/subscribe")
 async def push_subscribe(sub: PushSubRequest, user_id: str = Depends(get_current_user)):
+    # One document per browser/device endpoint, so each device keeps its own subscription
     doc = {"user_id": user_id, "endpoint": sub.endpoint, "keys": sub.keys,
            "created_at": datetime.now(timezone.utc).isoformat()}
-    await db.push_subs.update_one({"user_id": user_id}, {"$set": doc}, upsert=True)
+    await storage.push_subs.upsert(doc)
     return {"message": "Subscribed"}
 
+@api_router.post("/push/unsubscribe")
+async def push_unsubscribe(sub: PushUnsubRequest, user_id: str = Depends(get_current_user)):
+    if not await storage.push_subs.delete(sub.endpoint, user_id):
+        raise HTTPException(404, "Subscription not found")
+    return {"message": "Unsubscribed"}
+
 @api_router.post("/push/send-checkin")
 async def send_checkin(user_id: str = Depends(get_current_user)):
-    sub = await db.push_subs.find_one({"user_id": user_id}, {"_id": 0})
-    if not sub:
+    subs = await storage.push_subs.for_user(user_id)
+    if not subs:
         raise HTTPException(404, "No push subscription")
-    if not vapid_keys["private"]:
-        await init_vapid()
+    dispatcher = await get_push_dispatcher()
+    report = await dispatcher.send_many(subs, CHECKIN_PAYLOAD)
+    await record_push_report(report)
+    await prune_push_subs(report.expired)
+    if not report.sent:
+        if len(report.expired) == len(subs):
+            raise HTTPException(410, "Push subscription expired")
+        raise HTTPException(500, "Push failed")
+    return {"message": "Notification sent", "devices": report.sent}
+
+@api_router.get("/admin/jobs", dependencies=[Depends(require_admin)])
+async def get_jobs():
+    status = await scheduler.status()
+    status["push"] = {k.split(":", 1)[1]: v for k, v in (await shared_state.get_many("push:")).items()}
+    status["workers"] = WORKERS
+    status["shared_state"] = SHARED_STATE
+    status["storage"] = STORAGE_BACKEND
+    return status
+
+@api_router.get("/admin/limits", dependencies=[Depends(require_admin)])
+async def get_limits():
+    # Per worker: each process has its own in-flight cap and, with RATE_LIMIT_STATE=local, buckets
+    return {"worker": os.getpid(), "enabled": RATE_LIMIT_ENABLED, "state": RATE_LIMIT_STATE,
+            "users": user_limiter.stats(), "auth": ip_limiter.stats(), "in_flight": in_flight.stats(),
+            "coalesced": reads.stats(), "db_timeouts": db_timeouts,
+            "mongo_pool": mongo_pool.stats() if mongo_pool else None,
+            "mongo_pool_size": MONGO_MAX_POOL_SIZE if mongo_pool else None}
+
+@api_router.get("/admin/profiles", dependencies=[Depends(require_admin)])
+async def list_request_profiles():
+    dumps = (await shared_state.get_many("profile:")).values()
+    return sorted(({k: v for k, v in d.items() if k != "folded"} for d in dumps), key=lambda d: d["at"], reverse=True)
+
+@api_router.get("/admin/profiles/{profile_id}", dependencies=[Depends(require_admin)])
+async def get_request_profile(profile_id: str, format: str = "json"):
+    dump = await shared_state.get(f"profile:{profile_id}")
+    if dump is None:
+        raise HTTPException(404, "Profile not found")
+    if format == "folded":
+        return Response(dump["folded"] + "\n", media_type="text/plain")
+    return dump
+
+@api_router.post("/admin/jobs/{name}/run", dependencies=[Depends(require_admin)])
+async def run_job_now(name: str):
+    if name not in scheduler.jobs:
+        raise HTTPException(404, "Job not found")
     try:
-        webpush(subscription_info={"endpoint": sub["endpoint"], "keys": sub["keys"]},
-            data=json.dumps({"title": "FitTrack Pro", "body": "Sunday Check-in! Plan your week ahead and log your weight."}),
-            vapid_private_key=vapid_keys["private"],
-            vapid_claims={"sub": "mailto:admin@fittrackpro.com"})
-        return {"message": "Notification sent"}
-    except WebPushException as e:
-        raise HTTPException(500, f"Push failed: {str(e)}")
+        return {"name": name, "result": await scheduler.run_job(name)}
+    except JobRunning:
+        raise HTTPException(409, "Job is already running")
+
+# --- Leaderboards ---
+LEADERBOARD_MAX_LIMIT = 100
+
+@api_router.get("/leaderboards/{board}")
+@reads.coalesce
+async def get_leaderboard(board: str, period: Optional[str] = None, limit: int = 10,
+                          user_id: str = Depends(get_current_user)):
+    # Weekly boards take an ISO week ("2024-W19", default this week); streak has only the current board
+    if board not in BOARDS:
+        raise HTTPException(404, "Leaderboard not found")
+    if board == STREAK or not period:
+        period = current_period(board, datetime.now(timezone.utc).strftime("%Y-%m-%d"))
+    else:
+        try:
+            week_bounds(period)
+        except ValueError:
+            raise HTTPException(400, "period must be an ISO week like 2024-W19")
+    return await rankings.standings(board, period, user_id, max(1, min(limit, LEADERBOARD_MAX_LIMIT)))
 
 @api_router.get("/stats")
+@reads.coalesce
 async def get_stats(date: Optional[str] = None, user_id: str = Depends(get_current_user)):
-    profile = await db.profiles.find_one({"user_id": user_id}, {"_id": 0})
+    profile = await storage.profiles.get(user_id)
     if not profile:
         raise HTTPException(404, "Profile not found")
     weight = profile["weight"]
     height_cm = profile["heightCm"]
-    age = profile["age"]
-    gender = profile["gender"]
     cal_target = profile["calTarget"]
     goal_kg = profile["goalKg"]
     height_m = height_cm / 100
 
-    # BMI: weight(kg) / height(m)^2
-    bmi = round(weight / (height_m ** 2), 1)
-
-    # BMR: Mifflin-St Jeor equation
-    bmr = round(10 * weight + 6.25 * height_cm - 5 * age + (5 if gender == "male" else -161))
-
-    # TDEE: BMR * activity factor (1.2 = sedentary base)
-    tdee = round(bmr * 1.2)
-
-    # BMI categories
-    if bmi < 18.5:
-        bmi_category, bmi_color = "Underweight", "blue"
-    elif bmi < 25:
-        bmi_category, bmi_color = "Normal", "green"
-    elif bmi < 30:
-        bmi_category, bmi_color = "Overweight", "orange"
-    else:
-        bmi_category, bmi_color = "Obese", "red"
+    bmi, bmr, tdee = metrics.body_metrics(weight, height_cm, profile["age"], profile["gender"])
+    bmi_category, bmi_color = metrics.bmi_category(bmi)
 
     today = datetime.now(timezone.utc).strftime("%Y-%m-%d")
     target_date = date or today
 
     # Burned from workouts on target date
-    today_workouts = await db.workouts.find({"user_id": user_id, "date": target_date}, {"_id": 0}).to_list(100)
+    today_workouts = await storage.workouts.find_day(user_id, target_date)
     burned_workouts = sum(w.get("calories", 0) for w in today_workouts)
 
-    # Precise steps calories: stride = height × 0.413, MET 3.5 moderate walking
-    steps_doc = await db.steps.find_one({"user_id": user_id, "date": target_date}, {"_id": 0})
+    steps_doc = await storage.steps.get_day(user_id, target_date)
     steps = steps_doc["steps"] if steps_doc else 0
-    stride_m = height_cm * 0.413 / 100
-    distance_km = steps * stride_m / 1000
-    walking_time_h = distance_km / 4.8
-    steps_calories = round(3.5 * weight * walking_time_h)
+    steps_calories = metrics.steps_calories(steps, height_cm, weight)
     burned_today = burned_workouts + steps_calories
 
     # Nutrition
-    nutrition = await db.nutrition.find_one({"user_id": user_id, "date": target_date}, {"_id": 0})
+    nutrition = await storage.nutrition.get_day(user_id, target_date)
     has_nutrition = bool(nutrition and nutrition.get("total") and nutrition["total"].get("calories"))
     eaten = nutrition["total"]["calories"] if has_nutrition else 0
-
-    if has_nutrition:
-        deficit = (tdee + burned_today) - eaten
-    else:
-        deficit = (tdee + burned_today) - cal_target
+    deficit = metrics.daily_deficit(tdee, burned_today, eaten, has_nutrition, cal_target)
 
     # Weight logs (sorted ascending by date)
-    weight_logs = await db.weight_logs.find({"user_id": user_id}, {"_id": 0}).sort("date", 1).to_list(1000)
-
-    # Streak: count consecutive days with weight log entries (backward from today)
-    streak = 0
-    if weight_logs:
-        from datetime import date as date_cls
-        unique_dates = sorted(set(log["date"] for log in weight_logs), reverse=True)
-        today_date = date_cls.fromisoformat(today)
-        prev = None
-        for d_str in unique_dates:
-            try:
-                d = date_cls.fromisoformat(d_str)
-                if prev is None:
-                    # First date: must be today or yesterday to count
-                    diff_from_today = (today_date - d).days
-                    if diff_from_today <= 1:
-                        streak = 1
-                        prev = d
-                    else:
-                        break
-                elif (prev - d).days == 1:
-                    streak += 1
-                    prev = d
-                else:
-                    break
-            except Exception:
-                break
+    weight_logs = await storage.weight_logs.find(user_id, limit=1000)
+    streak = metrics.weight_log_streak([log["date"] for log in weight_logs], today)
 
     # Weight to lose
     weight_to_lose = max(weight - goal_kg, 0)
@@ -663,11 +1109,19 @@ async def get_stats(date: Optional[str] = None, user_id: str = Depends(get_curre
     # Projection: based on actual TDEE vs calTarget
     # Daily planned deficit = TDEE - calTarget (positive means caloric deficit)
     planned_daily_deficit = max(tdee - cal_target, 0)
-    # weekly_loss in kg: (daily_deficit * 7) / 7700 cal per kg of body fat
-    weekly_loss = (planned_daily_deficit * 7) / 7700 if planned_daily_deficit > 0 else 0
-    weeks_to_goal = round(weight_to_lose / weekly_loss) if weekly_loss > 0 else 0
+    weekly_loss, weeks_to_goal = metrics.goal_pace(weight, goal_kg, planned_daily_deficit)
     days_to_goal = weeks_to_goal * 7
 
+    # Chart and "add gym" estimate: a baseline lane and one with GYM_EXERCISE_KCAL a day. The gym
+    # lane's crossing is rounded as goal_pace rounds weeks_to_goal; past the horizon goal_pace gives it
+    import projection as engine
+    _, _, _, lanes = engine.project(weight, height_cm, profile["age"], profile["gender"], None, [cal_target],
+                                    exercise_kcal=(0, GYM_EXERCISE_KCAL), weeks=PROJECTION_MAX_WEEKS, adaptive=False)
+    gym_crossing = float(engine.goal_weeks(lanes, goal_kg)[1])
+    gym_weeks = round(gym_crossing) if gym_crossing >= 0 else \
+        metrics.goal_pace(weight, goal_kg, planned_daily_deficit + GYM_EXERCISE_KCAL)[1]
+    gym_days_saved = max(days_to_goal - gym_weeks * 7, 0)
+
     # Build projection array (24 weeks)
     projection = []
     actual_weights = weight_logs[-6:] if len(weight_logs) >= 6 else weight_logs
@@ -675,38 +1129,16 @@ async def get_stats(date: Optional[str] = None, user_id: str = Depends(get_curre
         projection.append({"week": i + 1, "actual": log["weight"], "projected": None,
                           "bmi_actual": round(log["weight"] / (height_m ** 2), 1)})
     start_week = len(actual_weights) + 1
-    current_projected = weight
-    for i in range(start_week, 25):
-        current_projected = max(current_projected - weekly_loss, goal_kg)
-        projection.append({"week": i, "actual": None, "projected": round(current_projected, 1),
-                          "bmi_projected": round(current_projected / (height_m ** 2), 1)})
-
-    # "Add gym" estimate: how many days faster with 300cal daily exercise
-    gym_bonus_deficit = planned_daily_deficit + 300
-    gym_weekly_loss = (gym_bonus_deficit * 7) / 7700 if gym_bonus_deficit > 0 else 0
-    gym_weeks = round(weight_to_lose / gym_weekly_loss) if gym_weekly_loss > 0 else 0
-    gym_days_saved = max(days_to_goal - (gym_weeks * 7), 0)
+    for i, projected in enumerate(lanes[0, 1:26 - start_week].tolist(), start_week):
+        projected = max(projected, goal_kg)
+        projection.append({"week": i, "actual": None, "projected": round(projected, 1),
+                          "bmi_projected": round(projected / (height_m ** 2), 1)})
 
     # Water intake for target date
-    water_doc = await db.water.find_one({"user_id": user_id, "date": target_date}, {"_id": 0})
+    water_doc = await storage.water.get_day(user_id, target_date)
     water_glasses = water_doc["glasses"] if water_doc else 0
 
-    # Health Score (0-100)
-    # BMI score (25 pts): 25 if normal, scaled down for over/underweight
-    bmi_score = 25 if 18.5 <= bmi < 25 else max(0, 25 - abs(bmi - 22) * 2)
-    # Activity score (25 pts): based on steps (10k = max) and burned cals
-    steps_score = min(steps / 10000, 1) * 15
-    burn_score = min(burned_today / 500, 1) * 10
-    activity_score = steps_score + burn_score
-    # Nutrition score (25 pts): adherence to calTarget (closer = better)
-    if has_nutrition:
-        cal_diff = abs(eaten - cal_target)
-        nutrition_score = max(0, 25 - (cal_diff / cal_target) * 25)
-    else:
-        nutrition_score = 12  # Partial if not tracking
-    # Streak score (25 pts): 7+ days = full
-    streak_score = min(streak / 7, 1) * 25
-    health_score = round(min(bmi_score + activity_score + nutrition_score + streak_score, 100))
+    health_score = metrics.health_score(bmi, steps, burned_today, has_nutrition, eaten, cal_target, streak)
 
     return {"bmi": bmi, "bmi_category": bmi_category, "bmi_color": bmi_color, "bmr": bmr,
             "tdee": tdee, "deficit": round(deficit), "burned_today": burned_today,
@@ -719,7 +1151,131 @@ async def get_stats(date: Optional[str] = None, user_id: str = Depends(get_curre
             "water_glasses": water_glasses, "health_score": health_score,
             "planned_daily_deficit": planned_daily_deficit, "date": target_date}
 
+@api_router.get("/health-reports")
+@reads.coalesce
+async def get_health_reports(limit: int = 12, user_id: str = Depends(get_current_user)):
+    # Newest first; written weekly by the health_reports job
+    return await storage.health_reports.find(user_id, sort=-1, limit=max(1, min(limit, 104)))
+
+STATS_RANGE_MAX_DAYS = 366
+
+@api_router.get("/stats/range")
+@reads.coalesce
+async def get_stats_range(start: str, end: str, user_id: str = Depends(get_current_user)):
+    try:
+        start_d, end_d = datetime.strptime(start, "%Y-%m-%d"), datetime.strptime(end, "%Y-%m-%d")
+    except ValueError:
+        raise HTTPException(400, "start and end must be YYYY-MM-DD")
+    if end_d < start_d:
+        raise HTTPException(400, "end must not be before start")
+    if (end_d - start_d).days >= STATS_RANGE_MAX_DAYS:
+        raise HTTPException(400, f"Range is limited to {STATS_RANGE_MAX_DAYS} days")
+    profile = await storage.profiles.get(user_id)
+    if not profile:
+        raise HTTPException(404, "Profile not found")
+    weight, height_cm, cal_target = profile["weight"], profile["heightCm"], profile["calTarget"]
+    bmi, bmr, tdee = metrics.body_metrics(weight, height_cm, profile["age"], profile["gender"])
+
+    burned, steps, eaten, water, log_dates = await asyncio.gather(
+        storage.workouts.daily_values(user_id, start, end, "calories", op="sum"),
+        storage.steps.daily_values(user_id, start, end, "steps"),
+        storage.nutrition.daily_values(user_id, start, end, "total.calories"),
+        storage.water.daily_values(user_id, start, end, "glasses"),
+        storage.weight_logs.distinct("date", user_id=user_id))
+    # Same streak as /stats: consecutive weigh-ins ending today, not per historical day
+    today = datetime.now(timezone.utc).strftime("%Y-%m-%d")
+    streak = metrics.weight_log_streak(log_dates, today)
+
+    days = [metrics.day_stats(d, steps.get(d) or 0, burned.get(d, 0), eaten.get(d), water.get(d) or 0,
+                              weight, height_cm, bmi, tdee, cal_target, streak)
+            for d in metrics.date_range(start, end)]
+    return {"start": start, "end": end, "bmi": bmi, "bmr": bmr, "tdee": tdee,
+            "streak": streak, "days": days}
+
+PROJECTION_MAX_SCENARIOS = 1000
+PROJECTION_MAX_WEEKS = 260
+# Daily exercise behind /stats' "add gym" estimate
+GYM_EXERCISE_KCAL = 300
+
+@api_router.post("/projection")
+async def get_projection(body: ProjectionRequest, user_id: str = Depends(get_current_user)):
+    import projection
+    profile = await storage.profiles.get(user_id)
+    if not profile:
+        raise HTTPException(404, "Profile not found")
+    cal_targets = body.calTargets or [profile["calTarget"]]
+    n = len(cal_targets) * len(body.activityFactors) * len(body.exerciseKcal)
+    if n == 0 or n > PROJECTION_MAX_SCENARIOS:
+        raise HTTPException(400, f"Scenario grid must have 1-{PROJECTION_MAX_SCENARIOS} combinations")
+    if not 1 <= body.weeks <= PROJECTION_MAX_WEEKS:
+        raise HTTPException(400, f"weeks must be 1-{PROJECTION_MAX_WEEKS}")
+    goal_kg = profile["goalKg"]
+    cal, af, ex, weights = projection.project(
+        profile["weight"], profile["heightCm"], profile["age"], profile["gender"], goal_kg,
+        cal_targets, body.activityFactors, body.exerciseKcal, weeks=body.weeks, adaptive=body.adaptive)
+    to_goal = projection.weeks_to_goal(weights, goal_kg)
+    rounded = weights.round(1).tolist()
+    scenarios = [{"calTarget": int(cal[i]), "activityFactor": float(af[i]), "exerciseKcal": int(ex[i]),
+                  "weeks_to_goal": int(to_goal[i]) if to_goal[i] >= 0 else None,
+                  "final_weight": rounded[i][-1], "weights": rounded[i]} for i in range(len(rounded))]
+    return {"weeks": body.weeks, "adaptive": body.adaptive, "goal_kg": goal_kg,
+            "current_weight": profile["weight"], "scenarios": scenarios}
+
 app.include_router(api_router)
+
+async def save_profile(dump):
+    try:
+        await shared_state.set(f"profile:{dump['id']}", dump, ttl=PROFILE_TTL)
+    except Exception as e:
+        logger.warning(f"Saving profile {dump['id']} failed: {e}")
+
+# Added first so it is innermost and samples the task the route handler runs in
+app.add_middleware(ProfilingMiddleware, profiler=Profiler(PROFILE_INTERVAL_MS / 1000),
+                   sample_rate=PROFILE_SAMPLE_RATE, admin_token=ADMIN_TOKEN, on_finish=save_profile)
+
+def db_deadline(route):
+    # Admin job runs take as long as the job does
+    deadline = 0 if route.split(" ", 1)[1].startswith("/api/admin/") else ROUTE_DEADLINES.get(route, MONGO_MAX_TIME_MS)
+    # pymongo.timeout bounds pool checkout and server selection, and sends the remaining time as maxTimeMS
+    return pymongo.timeout(deadline / 1000) if STORAGE_BACKEND == 'mongo' and deadline else contextlib.nullcontext()
+
+@app.middleware("http")
+async def detach_coalesced_reads(request: Request, call_next):
+    # After a user's write their later reads must not join one that started before it; this
+    # runs before the response reaches the client
+    try:
+        return await call_next(request)
+    finally:
+        user_id = getattr(request.state, "user_id", None)
+        if user_id and request.method not in ("GET", "HEAD", "OPTIONS"):
+            reads.wrote(user_id)
+
+@app.middleware("http")
+async def shed_load(request: Request, call_next):
+    global db_timeouts
+    # Rejecting early is cheaper than queueing: past the cap every request would just wait longer
+    if request.url.path in ("/api/health", "/api/health/ready"):
+        return await call_next(request)
+    if not in_flight.enter():
+        return JSONResponse({"detail": "Server busy, retry shortly"}, status_code=503, headers={"Retry-After": "1"})
+    route = f"{request.method} {request.url.path}"
+    # Both context variables are copied into the task that runs the route
+    preference = storage_read_preference.set(heavy_read_preference if route in HEAVY_READ_ROUTES else None)
+    try:
+        with db_deadline(route):
+            return await call_next(request)
+    except PyMongoError as e:
+        # A slow or unreachable primary past the deadline: shed like the in-flight cap instead of piling up
+        if not e.timeout:
+            raise
+        db_timeouts += 1
+        logger.warning(f"{route} hit its database deadline: {e}")
+        return JSONResponse({"detail": "Database busy, retry shortly"}, status_code=503, headers={"Retry-After": "1"})
+    finally:
+        storage_read_preference.reset(preference)
+        in_flight.leave()
+
+# Added last so it wraps shed_load and 503s still carry CORS headers
 app.add_middleware(CORSMiddleware, allow_credentials=True,
     allow_origins=os.environ.get('CORS_ORIGINS', '*').split(','),
     allow_methods=["*"], allow_headers=["*"])
@@ -727,11 +1283,16 @@ app.add_middleware(CORSMiddleware, allow_credentials=True,
 @app.on_event("startup")
 async def startup():
     try:
-        await init_vapid()
-        logger.info("VAPID keys initialized")
+        await warm_up()
     except Exception as e:
-        logger.error(f"VAPID init failed: {e}")
+        logger.error(f"Warm-up failed, readiness will retry: {e}")
+    if SCHEDULER_ENABLED:
+        scheduler.start()
 
 @app.on_event("shutdown")
 async def shutdown_db_client():
-    client.close()
+    await scheduler.stop()
+    if push_dispatcher:
+        push_dispatcher.close()
+    await diary_sync.close()
+    storage.close()
@@ -0,0 +1,109 @@
+"""
+Shared key/value state for anything that must agree across worker processes
+(counters, small caches). `local` keeps it in this process; `mongo` stores it
+in the `shared_state` collection so every worker sees the same values.
+"""
+import re
+import time
+from datetime import datetime, timezone, timedelta
+
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+
+class LocalState:
+    def __init__(self):
+        self._data = {}
+
+    def _live(self, key):
+        item = self._data.get(key)
+        if item and item[1] is not None and item[1] < time.monotonic():
+            del self._data[key]
+            return None
+        return item
+
+    async def get(self, key, default=None):
+        item = self._live(key)
+        return item[0] if item else default
+
+    async def set(self, key, value, ttl=None):
+        self._data[key] = (value, time.monotonic() + ttl if ttl else None)
+
+    async def incr(self, key, amount=1, ttl=None):
+        item = self._live(key)
+        value = (item[0] if item else 0) + amount
+        expires = item[1] if item else (time.monotonic() + ttl if ttl else None)
+        self._data[key] = (value, expires)
+        return value
+
+    async def delete(self, key):
+        self._data.pop(key, None)
+
+    async def get_many(self, prefix):
+        out = {}
+        for key in list(self._data):
+            item = self._live(key) if key.startswith(prefix) else None
+            if item:
+                out[key] = item[0]
+        return out
+
+
+class MongoState:
+    def __init__(self, db, collection="shared_state"):
+        self.coll = db[collection]
+
+    async def ensure_indexes(self):
+        # Documents with expires_at are reaped by Mongo's TTL monitor
+        await self.coll.create_index("expires_at", expireAfterSeconds=0)
+
+    @staticmethod
+    def _expiry(ttl):
+        return datetime.now(timezone.utc) + timedelta(seconds=ttl) if ttl else None
+
+    @staticmethod
+    def _fresh(doc):
+        exp = doc.get("expires_at") if doc else None
+        if exp is None:
+            return bool(doc)
+        if exp.tzinfo is None:
+            exp = exp.replace(tzinfo=timezone.utc)
+        # The TTL monitor runs once a minute; don't serve values it hasn't reaped yet
+        return exp > datetime.now(timezone.utc)
+
+    async def get(self, key, default=None):
+        doc = await self.coll.find_one({"_id": key})
+        return doc["value"] if self._fresh(doc) else default
+
+    async def set(self, key, value, ttl=None):
+        await self.coll.update_one({"_id": key}, {"$set": {"value": value, "expires_at": self._expiry(ttl)}},
+                                   upsert=True)
+
+    async def incr(self, key, amount=1, ttl=None):
+        # One atomic upsert, so concurrent first increments from several workers all count
+        while True:
+            now = datetime.now(timezone.utc)
+            try:
+                doc = await self.coll.find_one_and_update(
+                    {"_id": key, "$or": [{"expires_at": None}, {"expires_at": {"$gt": now}}]},
+                    {"$inc": {"value": amount}, "$setOnInsert": {"expires_at": self._expiry(ttl)}},
+                    upsert=True, return_document=ReturnDocument.AFTER)
+                return doc["value"]
+            except DuplicateKeyError:
+                # Either another worker inserted it first (the retry increments that) or an expired
+                # window the TTL monitor hasn't reaped is in the way: drop it and start a fresh one
+                await self.coll.delete_one({"_id": key, "expires_at": {"$lte": now}})
+
+    async def delete(self, key):
+        await self.coll.delete_one({"_id": key})
+
+    async def get_many(self, prefix):
+        cursor = self.coll.find({"_id": {"$regex": f"^{re.escape(prefix)}"}})
+        return {d["_id"]: d["value"] async for d in cursor if self._fresh(d)}
+
+
+def make_shared_state(backend, db=None):
+    if backend == "mongo":
+        return MongoState(db)
+    if backend == "local":
+        return LocalState()
+    raise ValueError(f"Unknown SHARED_STATE backend: {backend}")
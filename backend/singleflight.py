@@ -0,0 +1,52 @@
+"""
+Request coalescing ("singleflight"). While a read is in flight, identical
+calls (same handler, same user, same params) wait for it and get its result
+instead of repeating the DB fan-out. Nothing is kept once it finishes, and a
+user's write detaches their in-flight reads, so a request never sees data
+older than its own start: a read that begins after a write never joins one
+that began before it.
+"""
+import asyncio
+import functools
+
+
+class SingleFlight:
+    def __init__(self):
+        self._calls = {}
+        self.leaders = 0
+        self.shared = 0
+
+    async def do(self, key, fn, owner=None):
+        entry = self._calls.get(key)
+        if entry is None:
+            self.leaders += 1
+            # A task, not a bare await: if the first caller disconnects the others still get the result
+            entry = (asyncio.ensure_future(fn()), owner)
+            self._calls[key] = entry
+
+            def done(_):
+                # wrote() may already have replaced it with a newer run
+                if self._calls.get(key) is entry:
+                    del self._calls[key]
+            entry[0].add_done_callback(done)
+        else:
+            self.shared += 1
+        return await asyncio.shield(entry[0])
+
+    def wrote(self, owner):
+        """Call once `owner`'s write is done: their reads still in flight may predate it, so
+        later calls start a fresh run instead of joining them."""
+        for key in [k for k, (_, o) in self._calls.items() if o == owner]:
+            del self._calls[key]
+
+    def coalesce(self, handler):
+        """Decorator for read-only route handlers; the key is the handler plus its resolved
+        arguments, and the `user_id` argument the owner that wrote() detaches."""
+        @functools.wraps(handler)
+        async def wrapper(**kwargs):
+            key = (handler.__name__, *sorted(kwargs.items()))
+            return await self.do(key, lambda: handler(**kwargs), owner=kwargs.get("user_id"))
+        return wrapper
+
+    def stats(self):
+        return {"in_flight": len(self._calls), "leaders": self.leaders, "shared": self.shared}
@@ -0,0 +1,661 @@
+"""
+Embedded SQLite storage (STORAGE_BACKEND=sqlite) for single-node installs and
+in-process load tests. One database file in WAL mode; every query runs on a
+single worker thread that owns the connection, so the event loop never waits
+on disk and writes are serialized without extra locking.
+
+Documents are stored as JSON next to the columns used for filtering and
+sorting. Uploaded photos/avatars live in the `files` table (blobs="table") or
+as plain files under <database>.files/ (blobs="disk").
+"""
+import asyncio
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from storage import LOG_COLLECTIONS, ONE_PER_DAY, TEXT_FIELDS
+
+FIELD_RE = re.compile(r"^[A-Za-z_][A-Za-z0-9_.]*$")
+# Columns a log document's fields are copied into; everything else is JSON only
+LOG_COLUMNS = ("id", "user_id", "date", "timestamp")
+SORT_COLUMNS = {"date", "timestamp"}
+PAGE = 500
+
+
+def _dumps(doc):
+    return json.dumps(doc, separators=(",", ":"))
+
+
+def _path(field):
+    # Field names come from code, never from requests; still refuse anything odd
+    if not FIELD_RE.match(field):
+        raise ValueError(f"Invalid field name: {field}")
+    return f"$.{field}"
+
+
+async def _values(db, table, order, column, prefix, start):
+    # Non-null `column` values (strings starting with `prefix`, if given), a page at a time
+    where, args = "v IS NOT NULL", ()
+    if prefix:
+        where, args = "substr(v, 1, ?) = ?", (len(prefix), prefix)
+    sql = f"SELECT {order} AS o, {column} AS v FROM {table} WHERE {order} > ? AND {where} ORDER BY {order} LIMIT ?"
+    last = start
+    while True:
+        rows = await db.read(lambda c: c.execute(sql, (last, *args, PAGE)).fetchall())
+        for r in rows:
+            yield r["v"]
+        if len(rows) < PAGE:
+            return
+        last = rows[-1]["o"]
+
+
+class Database:
+    def __init__(self, path, schema_sql):
+        self.path = str(path)
+        self.schema_sql = schema_sql
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="sqlite")
+        self._conn = None
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        # Durable at checkpoints, not every commit; fine for a WAL single-node store
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("PRAGMA busy_timeout=5000")
+        for stmt in self.schema_sql:
+            conn.execute(stmt)
+        return conn
+
+    def _call(self, fn, args, write):
+        if self._conn is None:
+            self._conn = self._connect()
+        if not write:
+            return fn(self._conn, *args)
+        self._conn.execute("BEGIN IMMEDIATE")
+        try:
+            result = fn(self._conn, *args)
+        except BaseException:
+            self._conn.execute("ROLLBACK")
+            raise
+        self._conn.execute("COMMIT")
+        return result
+
+    async def read(self, fn, *args):
+        return await asyncio.get_running_loop().run_in_executor(self._executor, self._call, fn, args, False)
+
+    async def write(self, fn, *args):
+        return await asyncio.get_running_loop().run_in_executor(self._executor, self._call, fn, args, True)
+
+    def close(self):
+        def _close():
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+        self._executor.submit(_close).result()
+        self._executor.shutdown(wait=True)
+
+
+class SqliteRecords:
+    # users (keyed by id), profiles and nutrition_accounts (keyed by user_id)
+    def __init__(self, db, name, key, lookups=()):
+        self.db, self.name, self.key = db, name, key
+        self.schema_sql = [f"CREATE TABLE IF NOT EXISTS {name} (key TEXT PRIMARY KEY, doc TEXT NOT NULL)"]
+        self.schema_sql += [f"CREATE INDEX IF NOT EXISTS {name}_{f} ON {name} (json_extract(doc, '{_path(f)}'))"
+                            for f in lookups]
+
+    async def get(self, key):
+        row = await self.db.read(lambda c: c.execute(f"SELECT doc FROM {self.name} WHERE key = ?", (key,)).fetchone())
+        return json.loads(row["doc"]) if row else None
+
+    async def find_one(self, **fields):
+        where = " AND ".join(f"json_extract(doc, '{_path(f)}') = ?" for f in fields)
+        sql = f"SELECT doc FROM {self.name} WHERE {where} LIMIT 1"
+        row = await self.db.read(lambda c: c.execute(sql, tuple(fields.values())).fetchone())
+        return json.loads(row["doc"]) if row else None
+
+    async def get_many(self, keys):
+        keys = list(keys)
+        if not keys:
+            return []
+        sql = f"SELECT doc FROM {self.name} WHERE key IN ({', '.join('?' * len(keys))})"
+        return [json.loads(r["doc"]) for r in await self.db.read(lambda c: c.execute(sql, keys).fetchall())]
+
+    async def insert(self, doc):
+        await self.db.write(lambda c: c.execute(f"INSERT INTO {self.name} (key, doc) VALUES (?, ?)",
+                                                (doc[self.key], _dumps(doc))))
+
+    async def update(self, key, values):
+        # Returns the document as it was before the update
+        def _update(c):
+            row = c.execute(f"SELECT doc FROM {self.name} WHERE key = ?", (key,)).fetchone()
+            if not row:
+                return None
+            previous = json.loads(row["doc"])
+            c.execute(f"UPDATE {self.name} SET doc = ? WHERE key = ?", (_dumps({**previous, **values}), key))
+            return previous
+        return await self.db.write(_update)
+
+    async def distinct(self, field):
+        sql = f"SELECT DISTINCT json_extract(doc, '{_path(field)}') AS v FROM {self.name} WHERE v IS NOT NULL"
+        return [r["v"] for r in await self.db.read(lambda c: c.execute(sql).fetchall())]
+
+    async def values(self, field, prefix=None):
+        async for v in _values(self.db, self.name, "key", f"json_extract(doc, '{_path(field)}')", prefix, ""):
+            yield v
+
+    async def upsert(self, key, values):
+        def _upsert(c):
+            row = c.execute(f"SELECT doc FROM {self.name} WHERE key = ?", (key,)).fetchone()
+            doc = {**(json.loads(row["doc"]) if row else {}), **values, self.key: key}
+            c.execute(f"INSERT OR REPLACE INTO {self.name} (key, doc) VALUES (?, ?)", (key, _dumps(doc)))
+        await self.db.write(_upsert)
+
+    async def update_many(self, updates):
+        def _update_many(c):
+            for key, values in updates.items():
+                row = c.execute(f"SELECT doc FROM {self.name} WHERE key = ?", (key,)).fetchone()
+                if row:
+                    c.execute(f"UPDATE {self.name} SET doc = ? WHERE key = ?",
+                              (_dumps({**json.loads(row["doc"]), **values}), key))
+        if updates:
+            await self.db.write(_update_many)
+
+    async def all(self):
+        last = ""
+        while True:
+            rows = await self.db.read(lambda c: c.execute(
+                f"SELECT key, doc FROM {self.name} WHERE key > ? ORDER BY key LIMIT ?", (last, PAGE)).fetchall())
+            for r in rows:
+                yield json.loads(r["doc"])
+            if len(rows) < PAGE:
+                return
+            last = rows[-1]["key"]
+
+
+class SqliteLogs:
+    def __init__(self, db, name, one_per_day=False):
+        self.db, self.name, self.one_per_day = db, name, one_per_day
+        unique = "UNIQUE " if one_per_day else ""
+        self.schema_sql = [
+            f"CREATE TABLE IF NOT EXISTS {name} (pk INTEGER PRIMARY KEY, id TEXT, user_id TEXT NOT NULL, "
+            f"date TEXT, timestamp TEXT, doc TEXT NOT NULL)",
+            f"CREATE {unique}INDEX IF NOT EXISTS {name}_user_date ON {name} (user_id, date)",
+            f"CREATE INDEX IF NOT EXISTS {name}_user_timestamp ON {name} (user_id, timestamp)",
+            f"CREATE INDEX IF NOT EXISTS {name}_date ON {name} (date)",
+            f"CREATE INDEX IF NOT EXISTS {name}_id ON {name} (id)",
+        ]
+
+    @staticmethod
+    def _row(doc):
+        return (*(doc.get(col) for col in LOG_COLUMNS), _dumps(doc))
+
+    def _select(self, where, order="pk", limit=None):
+        sql = f"SELECT doc FROM {self.name} WHERE {where} ORDER BY {order}"
+        return sql + (f" LIMIT {int(limit)}" if limit else "")
+
+    async def _docs(self, sql, args):
+        rows = await self.db.read(lambda c: c.execute(sql, args).fetchall())
+        return [json.loads(r["doc"]) for r in rows]
+
+    async def insert(self, doc):
+        await self.insert_many([doc])
+
+    async def insert_many(self, docs):
+        if docs:
+            sql = f"INSERT INTO {self.name} ({', '.join(LOG_COLUMNS)}, doc) VALUES (?, ?, ?, ?, ?)"
+            await self.db.write(lambda c: c.executemany(sql, [self._row(d) for d in docs]))
+
+    async def find(self, user_id, order_by="date", sort=1, limit=None, fields=None, since=None):
+        if order_by not in SORT_COLUMNS:
+            raise ValueError(f"Cannot sort {self.name} by {order_by}")
+        direction = "ASC" if sort == 1 else "DESC"
+        where, args = "user_id = ?", [user_id]
+        if since:
+            where, args = where + " AND date >= ?", args + [since]
+        docs = await self._docs(self._select(where, f"{order_by} {direction}, pk {direction}", limit), args)
+        return [{k: d[k] for k in fields if k in d} for d in docs] if fields else docs
+
+    async def find_day(self, user_id, day):
+        return await self._docs(self._select("user_id = ? AND date = ?"), (user_id, day))
+
+    async def get_day(self, user_id, day):
+        docs = await self._docs(self._select("user_id = ? AND date = ?", limit=1), (user_id, day))
+        return docs[0] if docs else None
+
+    def _put_day(self, c, user_id, day, values, on_insert):
+        row = c.execute(f"SELECT pk, doc FROM {self.name} WHERE user_id = ? AND date = ? ORDER BY pk LIMIT 1",
+                            (user_id, day)).fetchone()
+        if row:
+            doc = {**json.loads(row["doc"]), **values}
+            c.execute(f"UPDATE {self.name} SET id = ?, timestamp = ?, doc = ? WHERE pk = ?",
+                      (doc.get("id"), doc.get("timestamp"), _dumps(doc), row["pk"]))
+        else:
+            doc = {**(on_insert or {}), "user_id": user_id, "date": day, **values}
+            c.execute(f"INSERT INTO {self.name} ({', '.join(LOG_COLUMNS)}, doc) VALUES (?, ?, ?, ?, ?)",
+                      self._row(doc))
+        return doc
+
+    async def put_day(self, user_id, day, values, on_insert=None):
+        return await self.db.write(self._put_day, user_id, day, values, on_insert)
+
+    async def put_days(self, items):
+        """Bulk put_day: items are (user_id, day, values, on_insert) tuples, written in one transaction."""
+        def _put_days(c):
+            for item in items:
+                self._put_day(c, *item)
+        if items:
+            await self.db.write(_put_days)
+
+    async def get(self, user_id, doc_id):
+        docs = await self._docs(self._select("id = ? AND user_id = ?", limit=1), (doc_id, user_id))
+        return docs[0] if docs else None
+
+    async def delete(self, user_id, doc_id):
+        sql = f"DELETE FROM {self.name} WHERE pk = (SELECT pk FROM {self.name} WHERE id = ? AND user_id = ? LIMIT 1)"
+        cursor = await self.db.write(lambda c: c.execute(sql, (doc_id, user_id)))
+        return cursor.rowcount > 0
+
+    async def daily_values(self, user_id, start, end, field, op="first"):
+        sql = (f"SELECT date, json_extract(doc, '{_path(field)}') AS v FROM {self.name} "
+               f"WHERE user_id = ? AND date BETWEEN ? AND ? ORDER BY pk")
+        rows = await self.db.read(lambda c: c.execute(sql, (user_id, start, end)).fetchall())
+        out = {}
+        for r in rows:
+            if op == "sum":
+                out[r["date"]] = out.get(r["date"], 0) + (r["v"] or 0)
+            else:
+                out.setdefault(r["date"], r["v"])
+        return out
+
+    async def values(self, field, prefix=None):
+        column = field if field in LOG_COLUMNS else f"json_extract(doc, '{_path(field)}')"
+        async for v in _values(self.db, self.name, "pk", column, prefix, 0):
+            yield v
+
+    async def distinct(self, field, user_id=None):
+        column = field if field in LOG_COLUMNS else f"json_extract(doc, '{_path(field)}')"
+        sql = f"SELECT DISTINCT {column} AS v FROM {self.name} WHERE v IS NOT NULL"
+        args = ()
+        if user_id:
+            sql, args = sql + " AND user_id = ?", (user_id,)
+        return [r["v"] for r in await self.db.read(lambda c: c.execute(sql, args).fetchall())]
+
+    def _filter(self, user_id, start=None, end=None, equals=None, text=None):
+        where, args = ["user_id = ?"], [user_id]
+        for field, value in (equals or {}).items():
+            column = field if field in LOG_COLUMNS else f"json_extract(doc, '{_path(field)}')"
+            where.append(f"{column} = ?")
+            args.append(value)
+        if start:
+            where.append("date >= ?")
+            args.append(start)
+        if end:
+            where.append("date <= ?")
+            args.append(end)
+        if text and text.strip():
+            # Like MongoDB's $text: any of the words in any text field, but substrings rather than stems
+            words = text.lower().split()
+            fields = [f"lower(json_extract(doc, '{_path(f)}'))" for f in TEXT_FIELDS[self.name]]
+            where.append("(" + " OR ".join(f"instr({f}, ?) > 0" for w in words for f in fields) + ")")
+            args += [w for w in words for _ in fields]
+        return " AND ".join(where), args
+
+    async def search(self, user_id, start=None, end=None, equals=None, text=None, limit=50):
+        """Newest-first documents matching every given filter."""
+        where, args = self._filter(user_id, start, end, equals, text)
+        return await self._docs(self._select(where, "timestamp DESC, pk DESC", limit), args)
+
+    async def grouped_totals(self, user_id, by, fields, start=None, end=None, equals=None, text=None):
+        """[{"date", by, "count", **sums of fields}] per day and value of `by`."""
+        where, args = self._filter(user_id, start, end, equals, text)
+        sums = "".join(f", SUM(json_extract(doc, '{_path(f)}')) AS f{i}" for i, f in enumerate(fields))
+        sql = (f"SELECT date, json_extract(doc, '{_path(by)}') AS k, COUNT(*) AS n{sums} FROM {self.name} "
+               f"WHERE {where} GROUP BY date, k")
+        rows = await self.db.read(lambda c: c.execute(sql, args).fetchall())
+        return [{"date": r["date"], by: r["k"], "count": r["n"], **{f: r[f"f{i}"] or 0 for i, f in enumerate(fields)}}
+                for r in rows]
+
+    async def daily_values_many(self, user_ids, start, end, field, op="first"):
+        """daily_values for a batch of users: {user_id: {date: value}}."""
+        user_ids = list(user_ids)
+        sql = (f"SELECT user_id, date, json_extract(doc, '{_path(field)}') AS v FROM {self.name} "
+               f"WHERE user_id IN ({', '.join('?' * len(user_ids))}) AND date BETWEEN ? AND ? ORDER BY pk")
+        out = {}
+        for r in await self.db.read(lambda c: c.execute(sql, (*user_ids, start, end)).fetchall()):
+            days = out.setdefault(r["user_id"], {})
+            if op == "sum":
+                days[r["date"]] = days.get(r["date"], 0) + (r["v"] or 0)
+            else:
+                days.setdefault(r["date"], r["v"])
+        return out
+
+    async def latest_by_user(self, user_ids):
+        """{user_id: most recently written document} for a batch of users."""
+        user_ids = list(user_ids)
+        sql = (f"SELECT doc FROM {self.name} WHERE pk IN (SELECT MAX(pk) FROM {self.name} "
+               f"WHERE user_id IN ({', '.join('?' * len(user_ids))}) GROUP BY user_id)")
+        return {d["user_id"]: d for d in await self._docs(sql, user_ids)}
+
+    async def totals_by_user(self, start, end, field):
+        """{user_id: sum of field} over [start, end] for every user."""
+        sql = (f"SELECT user_id, SUM(json_extract(doc, '{_path(field)}')) AS v FROM {self.name} "
+               f"WHERE date BETWEEN ? AND ? GROUP BY user_id")
+        rows = await self.db.read(lambda c: c.execute(sql, (start, end)).fetchall())
+        return {r["user_id"]: r["v"] or 0 for r in rows}
+
+    async def dates_by_user(self, since, user_ids=None):
+        """{user_id: [logged days]} since `since` for every user (or just `user_ids`)."""
+        sql, args = f"SELECT DISTINCT user_id, date FROM {self.name} WHERE date >= ?", [since]
+        if user_ids:
+            user_ids = list(user_ids)
+            sql, args = sql + f" AND user_id IN ({', '.join('?' * len(user_ids))})", args + user_ids
+        out = {}
+        for r in await self.db.read(lambda c: c.execute(sql, args).fetchall()):
+            out.setdefault(r["user_id"], []).append(r["date"])
+        return out
+
+
+class SqliteLeaderboards:
+    schema_sql = [
+        "CREATE TABLE IF NOT EXISTS leaderboards (board TEXT NOT NULL, period TEXT NOT NULL, user_id TEXT NOT NULL, "
+        "score NUMERIC NOT NULL, PRIMARY KEY (board, period, user_id))",
+        "CREATE INDEX IF NOT EXISTS leaderboards_score ON leaderboards (board, period, score DESC, user_id)",
+    ]
+
+    def __init__(self, db):
+        self.db = db
+
+    async def set(self, board, period, user_id, score):
+        if score > 0:
+            sql, args = "INSERT OR REPLACE INTO leaderboards VALUES (?, ?, ?, ?)", (board, period, user_id, score)
+        else:
+            sql, args = "DELETE FROM leaderboards WHERE board = ? AND period = ? AND user_id = ?", (board, period, user_id)
+        await self.db.write(lambda c: c.execute(sql, args))
+
+    async def replace(self, board, period, scores):
+        """Makes the board exactly `scores` ({user_id: score}); zero scores are dropped."""
+        def _replace(c):
+            c.execute("DELETE FROM leaderboards WHERE board = ? AND period = ?", (board, period))
+            c.executemany("INSERT INTO leaderboards VALUES (?, ?, ?, ?)",
+                          [(board, period, user_id, score) for user_id, score in scores.items() if score > 0])
+        await self.db.write(_replace)
+
+    async def top(self, board, period, limit):
+        rows = await self.db.read(lambda c: c.execute(
+            "SELECT user_id, score FROM leaderboards WHERE board = ? AND period = ? "
+            "ORDER BY score DESC, user_id LIMIT ?", (board, period, limit)).fetchall())
+        return [dict(r) for r in rows]
+
+    async def rank(self, board, period, user_id):
+        """{"rank", "score"} with ties sharing a rank, or None when the user isn't on the board."""
+        def _rank(c):
+            row = c.execute("SELECT score FROM leaderboards WHERE board = ? AND period = ? AND user_id = ?",
+                            (board, period, user_id)).fetchone()
+            if not row:
+                return None
+            above = c.execute("SELECT COUNT(*) FROM leaderboards WHERE board = ? AND period = ? AND score > ?",
+                              (board, period, row["score"])).fetchone()[0]
+            return {"rank": above + 1, "score": row["score"]}
+        return await self.db.read(_rank)
+
+    async def count(self, board, period):
+        return await self.db.read(lambda c: c.execute(
+            "SELECT COUNT(*) FROM leaderboards WHERE board = ? AND period = ?", (board, period)).fetchone()[0])
+
+    async def prune(self, board, before):
+        cursor = await self.db.write(lambda c: c.execute(
+            "DELETE FROM leaderboards WHERE board = ? AND period < ?", (board, before)))
+        return cursor.rowcount
+
+
+class SqliteTrends:
+    schema_sql = [
+        "CREATE TABLE IF NOT EXISTS weight_trends (user_id TEXT PRIMARY KEY, version INTEGER NOT NULL, doc TEXT NOT NULL)",
+        "CREATE TABLE IF NOT EXISTS weight_trend_points (user_id TEXT NOT NULL, date TEXT NOT NULL, "
+        "doc TEXT NOT NULL, PRIMARY KEY (user_id, date))",
+    ]
+
+    def __init__(self, db):
+        self.db = db
+
+    async def get(self, user_id):
+        row = await self.db.read(
+            lambda c: c.execute("SELECT doc FROM weight_trends WHERE user_id = ?", (user_id,)).fetchone())
+        return json.loads(row["doc"]) if row else None
+
+    async def save(self, user_id, state, version):
+        """Stores state if the stored version is still `version` (0 = no state yet); False on a lost race."""
+        def _save(c):
+            if version:
+                return c.execute("UPDATE weight_trends SET version = ?, doc = ? WHERE user_id = ? AND version = ?",
+                                 (state["version"], _dumps(state), user_id, version)).rowcount > 0
+            return c.execute("INSERT OR IGNORE INTO weight_trends (user_id, version, doc) VALUES (?, ?, ?)",
+                             (user_id, state["version"], _dumps(state))).rowcount > 0
+        return await self.db.write(_save)
+
+    async def replace(self, user_id, state, points):
+        def _replace(c):
+            c.execute("DELETE FROM weight_trend_points WHERE user_id = ?", (user_id,))
+            if not state:
+                c.execute("DELETE FROM weight_trends WHERE user_id = ?", (user_id,))
+                return
+            c.execute("INSERT OR REPLACE INTO weight_trends (user_id, version, doc) VALUES (?, ?, ?)",
+                      (user_id, state["version"], _dumps(state)))
+            c.executemany("INSERT INTO weight_trend_points (user_id, date, doc) VALUES (?, ?, ?)",
+                          [(user_id, p["date"], _dumps(p)) for p in points])
+        await self.db.write(_replace)
+
+    async def put_point(self, user_id, point):
+        await self.db.write(lambda c: c.execute(
+            "INSERT OR REPLACE INTO weight_trend_points (user_id, date, doc) VALUES (?, ?, ?)",
+            (user_id, point["date"], _dumps(point))))
+
+    async def points_since(self, user_id, since, limit=None):
+        sql = "SELECT doc FROM weight_trend_points WHERE user_id = ? AND date >= ? ORDER BY date"
+        if limit:
+            sql += f" LIMIT {int(limit)}"
+        rows = await self.db.read(lambda c: c.execute(sql, (user_id, since)).fetchall())
+        return [json.loads(r["doc"]) for r in rows]
+
+    async def point_at_or_before(self, user_id, day):
+        row = await self.db.read(lambda c: c.execute(
+            "SELECT doc FROM weight_trend_points WHERE user_id = ? AND date <= ? ORDER BY date DESC LIMIT 1",
+            (user_id, day)).fetchone())
+        return json.loads(row["doc"]) if row else None
+
+
+class SqlitePushSubs:
+    schema_sql = [
+        "CREATE TABLE IF NOT EXISTS push_subs (endpoint TEXT PRIMARY KEY, user_id TEXT NOT NULL, doc TEXT NOT NULL)",
+        "CREATE INDEX IF NOT EXISTS push_subs_user ON push_subs (user_id)",
+    ]
+
+    def __init__(self, db):
+        self.db = db
+
+    @staticmethod
+    def _sub(row):
+        doc = json.loads(row["doc"])
+        return {"endpoint": doc["endpoint"], "keys": doc.get("keys")}
+
+    async def upsert(self, doc):
+        await self.db.write(lambda c: c.execute(
+            "INSERT OR REPLACE INTO push_subs (endpoint, user_id, doc) VALUES (?, ?, ?)",
+            (doc["endpoint"], doc["user_id"], _dumps(doc))))
+
+    async def delete(self, endpoint, user_id):
+        cursor = await self.db.write(lambda c: c.execute(
+            "DELETE FROM push_subs WHERE endpoint = ? AND user_id = ?", (endpoint, user_id)))
+        return cursor.rowcount > 0
+
+    async def for_user(self, user_id, limit=50):
+        rows = await self.db.read(lambda c: c.execute(
+            "SELECT doc FROM push_subs WHERE user_id = ? LIMIT ?", (user_id, limit)).fetchall())
+        return [self._sub(r) for r in rows]
+
+    async def all(self):
+        last = ""
+        while True:
+            rows = await self.db.read(lambda c: c.execute(
+                "SELECT endpoint, doc FROM push_subs WHERE endpoint > ? ORDER BY endpoint LIMIT ?",
+                (last, PAGE)).fetchall())
+            for r in rows:
+                yield self._sub(r)
+            if len(rows) < PAGE:
+                return
+            last = rows[-1]["endpoint"]
+
+    async def delete_endpoints(self, endpoints):
+        marks = ", ".join("?" * len(endpoints))
+        cursor = await self.db.write(lambda c: c.execute(
+            f"DELETE FROM push_subs WHERE endpoint IN ({marks})", tuple(endpoints)))
+        return cursor.rowcount
+
+
+class SqliteSettings:
+    schema_sql = ["CREATE TABLE IF NOT EXISTS settings (type TEXT PRIMARY KEY, doc TEXT NOT NULL)"]
+
+    def __init__(self, db):
+        self.db = db
+
+    async def get(self, type_):
+        row = await self.db.read(lambda c: c.execute("SELECT doc FROM settings WHERE type = ?", (type_,)).fetchone())
+        return json.loads(row["doc"]) if row else None
+
+    async def setdefault(self, type_, values):
+        def _setdefault(c):
+            c.execute("INSERT OR IGNORE INTO settings (type, doc) VALUES (?, ?)",
+                      (type_, _dumps({"type": type_, **values})))
+            return json.loads(c.execute("SELECT doc FROM settings WHERE type = ?", (type_,)).fetchone()["doc"])
+        return await self.db.write(_setdefault)
+
+
+class SqliteFiles:
+    # Content-addressed like the GridFS store: identical bytes share one row
+    # whose refs counts the documents pointing at it
+    schema_sql = [
+        "CREATE TABLE IF NOT EXISTS files (id TEXT PRIMARY KEY, sha256 TEXT NOT NULL, length INTEGER NOT NULL, "
+        "filename TEXT, content_type TEXT, refs INTEGER NOT NULL, uploaded_at REAL NOT NULL, data BLOB)",
+        "CREATE INDEX IF NOT EXISTS files_sha256 ON files (sha256)",
+        "CREATE INDEX IF NOT EXISTS files_uploaded_at ON files (uploaded_at)",
+    ]
+
+    def __init__(self, db, blobs, files_dir):
+        if blobs not in ("table", "disk"):
+            raise ValueError(f"Unknown SQLITE_BLOBS mode: {blobs}")
+        self.db, self.blobs, self.files_dir = db, blobs, Path(files_dir)
+
+    def _file(self, file_id):
+        return self.files_dir / file_id[:2] / file_id
+
+    def _unlink(self, file_id):
+        try:
+            self._file(file_id).unlink()
+        except FileNotFoundError:
+            pass
+
+    async def put(self, data, filename, content_type):
+        digest = hashlib.sha256(data).hexdigest()
+
+        def _put(c):
+            row = c.execute("SELECT id FROM files WHERE sha256 = ? AND length = ? AND refs > 0 LIMIT 1",
+                            (digest, len(data))).fetchone()
+            if row:
+                # Attaching restarts the sweep's grace period, like a fresh upload
+                c.execute("UPDATE files SET refs = refs + 1, uploaded_at = ? WHERE id = ?", (time.time(), row["id"]))
+                return row["id"]
+            file_id = uuid.uuid4().hex
+            if self.blobs == "disk":
+                path = self._file(file_id)
+                path.parent.mkdir(parents=True, exist_ok=True)
+                path.write_bytes(data)
+            c.execute("INSERT INTO files (id, sha256, length, filename, content_type, refs, uploaded_at, data) "
+                      "VALUES (?, ?, ?, ?, ?, 1, ?, ?)",
+                      (file_id, digest, len(data), filename, content_type, time.time(),
+                       data if self.blobs == "table" else None))
+            return file_id
+        return await self.db.write(_put)
+
+    async def get(self, file_id):
+        def _get(c):
+            row = c.execute("SELECT content_type, data FROM files WHERE id = ?", (file_id,)).fetchone()
+            if not row:
+                raise KeyError(file_id)
+            data = row["data"] if row["data"] is not None else self._file(file_id).read_bytes()
+            return bytes(data), row["content_type"] or "application/octet-stream"
+        return await self.db.read(_get)
+
+    async def release(self, file_id):
+        # Drops one reference; the bytes go away with the last one
+        def _release(c):
+            c.execute("UPDATE files SET refs = refs - 1 WHERE id = ?", (file_id,))
+            gone = c.execute("DELETE FROM files WHERE id = ? AND refs <= 0", (file_id,)).rowcount
+            if gone and self.blobs == "disk":
+                self._unlink(file_id)
+        await self.db.write(_release)
+
+    async def sweep(self, referenced, grace, batch_size):
+        # Files younger than the grace period may belong to an upload whose metadata insert is in flight
+        cutoff = time.time() - grace.total_seconds()
+        rows = await self.db.read(lambda c: c.execute(
+            "SELECT id, length FROM files WHERE uploaded_at < ?", (cutoff,)).fetchall())
+        orphans = [(r["id"], r["length"]) for r in rows if r["id"] not in referenced]
+        stats = {"scanned": len(rows), "deleted": 0, "reclaimed_bytes": 0}
+        for i in range(0, len(orphans), batch_size):
+            batch = orphans[i:i + batch_size]
+
+            def _delete(c, batch=batch):
+                # Re-checked at delete time: a put() that attached since the snapshot moved uploaded_at
+                deleted = [(file_id, length) for file_id, length in batch
+                           if c.execute("DELETE FROM files WHERE id = ? AND uploaded_at < ?", (file_id, cutoff)).rowcount]
+                if self.blobs == "disk":
+                    for file_id, _ in deleted:
+                        self._unlink(file_id)
+                return deleted
+            deleted = await self.db.write(_delete)
+            stats["deleted"] += len(deleted)
+            stats["reclaimed_bytes"] += sum(length for _, length in deleted)
+        return stats
+
+
+class SqliteStorage:
+    backend = "sqlite"
+
+    def __init__(self, path, blobs="table"):
+        path = Path(path)
+        if path.parent:
+            os.makedirs(path.parent, exist_ok=True)
+        self.db = Database(path, [])
+        self.users = SqliteRecords(self.db, "users", "id", lookups=("email", "google_id", "avatarUrl"))
+        self.profiles = SqliteRecords(self.db, "profiles", "user_id", lookups=("avatarUrl",))
+        self.nutrition_accounts = SqliteRecords(self.db, "nutrition_accounts", "user_id")
+        self.logs = {}
+        for name in LOG_COLLECTIONS:
+            repo = SqliteLogs(self.db, name, one_per_day=name in ONE_PER_DAY)
+            self.logs[name] = repo
+            setattr(self, name, repo)
+        self.trends = SqliteTrends(self.db)
+        self.leaderboards = SqliteLeaderboards(self.db)
+        self.push_subs = SqlitePushSubs(self.db)
+        self.settings = SqliteSettings(self.db)
+        self.files = SqliteFiles(self.db, blobs, f"{path}.files")
+        # Tables are created on first connect, so a handler can never run ahead of them
+        for repo in (self.users, self.profiles, self.nutrition_accounts, *self.logs.values(), self.trends,
+                     self.leaderboards, self.push_subs, self.settings, self.files):
+            self.db.schema_sql += repo.schema_sql
+
+    async def ping(self):
+        await self.db.read(lambda c: c.execute("SELECT 1").fetchone())
+
+    async def ensure_indexes(self):
+        await self.ping()
+
+    def close(self):
+        self.db.close()
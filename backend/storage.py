@@ -0,0 +1,643 @@
+"""
+Storage backends. Handlers talk to the repositories on a storage object
+(users, profiles, the per-user log collections, trends, leaderboards, push
+subscriptions, settings, files) instead of a Motor database, so the same API runs on:
+
+  mongo   MongoDB via Motor (default); honours SCHEMA_MODE and MEASUREMENT_STORAGE
+  sqlite  an embedded SQLite file for single-node installs and tests (sqlite_storage.py)
+
+Repositories take and return documents in API form ("YYYY-MM-DD" dates,
+ISO timestamps, string ids) whatever the backend stores.
+"""
+import hashlib
+import heapq
+import itertools
+import logging
+import re
+from contextvars import ContextVar
+from datetime import datetime, timezone
+
+from bson import ObjectId
+from motor.motor_asyncio import AsyncIOMotorGridFSBucket
+from pymongo import ReturnDocument, UpdateOne
+from pymongo.errors import CollectionInvalid, DuplicateKeyError
+
+import schema
+
+logger = logging.getLogger(__name__)
+
+LOG_COLLECTIONS = schema.COMPACT_COLLECTIONS
+# At most one document per user and day; writes go through put_day
+ONE_PER_DAY = {"steps", "water", "nutrition", "health_reports"}
+TIMESERIES_COLLECTIONS = ("weight_logs", "steps", "water")
+# Fields matched by a log repo's `text` filter (a per-user text index on MongoDB)
+TEXT_FIELDS = {"workouts": ("type", "notes")}
+# Read preference for log reads in the current request; server.py sets it on heavy read-only routes
+read_preference = ContextVar("read_preference", default=None)
+
+INDEXES = [
+    ("users", [("id", 1)], {"unique": True}),
+    ("users", [("email", 1)], {}),
+    ("users", [("google_id", 1)], {"sparse": True}),
+    ("profiles", [("user_id", 1)], {"unique": True}),
+    ("weight_logs", [("user_id", 1), ("date", 1)], {}),
+    ("weight_logs", [("date", 1)], {}),
+    ("workouts", [("user_id", 1), ("timestamp", -1)], {}),
+    ("workouts", [("user_id", 1), ("date", 1)], {}),
+    ("workouts", [("date", 1)], {}),
+    ("workouts", [("user_id", 1), *((f, "text") for f in TEXT_FIELDS["workouts"])], {}),
+    ("measurements", [("user_id", 1), ("date", -1)], {}),
+    ("steps", [("user_id", 1), ("date", -1)], {}),
+    ("steps", [("date", 1)], {}),
+    ("water", [("user_id", 1), ("date", 1)], {}),
+    ("nutrition", [("user_id", 1), ("date", 1)], {}),
+    ("body_comp", [("user_id", 1), ("date", -1)], {}),
+    ("progress_photos", [("user_id", 1), ("timestamp", 1)], {}),
+    ("progress_photos", [("file_id", 1)], {}),
+    ("meal_templates", [("user_id", 1), ("timestamp", -1)], {}),
+    ("health_reports", [("user_id", 1), ("date", -1)], {"unique": True}),
+    ("push_subs", [("endpoint", 1)], {"unique": True}),
+    ("push_subs", [("user_id", 1)], {}),
+    ("fs.files", [("metadata.sha256", 1)], {}),
+    ("settings", [("type", 1)], {"unique": True}),
+    ("nutrition_accounts", [("user_id", 1)], {"unique": True}),
+    ("weight_trends", [("user_id", 1)], {"unique": True}),
+    ("weight_trend_points", [("user_id", 1), ("date", 1)], {"unique": True}),
+    ("leaderboards", [("board", 1), ("period", 1), ("user_id", 1)], {"unique": True}),
+    ("leaderboards", [("board", 1), ("period", 1), ("score", -1), ("user_id", 1)], {}),
+]
+# Unique indexes that data written before them may violate: when the build hits a duplicate,
+# the first document per key in this sort order is kept and the build retried
+DEDUPE_ON_INDEX_BUILD = {
+    # Workers that booted concurrently each inserted their own VAPID keys; the first is the one served
+    "settings": {"_id": 1},
+    # Subscriptions used to be one per user, so a device shared by several accounts has one per
+    # account; it belongs to whoever subscribed on it last (created_at is rewritten on every subscribe)
+    "push_subs": {"created_at": -1, "_id": -1},
+}
+
+
+def _values_query(field, prefix=None):
+    # Cursor rather than distinct(): that returns one document, capped at 16MB
+    return {field: {"$regex": f"^{re.escape(prefix)}"} if prefix else {"$ne": None}}
+
+
+def merge_day(values, day, value, op):
+    # With SCHEMA_MODE=migrating a day's legacy string and compact int dates group separately
+    if day not in values:
+        values[day] = value
+    elif op == "sum":
+        values[day] += value
+
+
+class MongoRecords:
+    # users (keyed by id), profiles and nutrition_accounts (keyed by user_id)
+    def __init__(self, db, name, key):
+        self.coll, self.key = db[name], key
+
+    async def get(self, key):
+        return await self.coll.find_one({self.key: key}, {"_id": 0})
+
+    async def find_one(self, **fields):
+        return await self.coll.find_one(fields, {"_id": 0})
+
+    async def get_many(self, keys):
+        return await self.coll.find({self.key: {"$in": list(keys)}}, {"_id": 0}).to_list(None)
+
+    async def insert(self, doc):
+        await self.coll.insert_one({**doc})
+
+    async def update(self, key, values):
+        # Returns the document as it was before the update
+        return await self.coll.find_one_and_update({self.key: key}, {"$set": values}, projection={"_id": 0})
+
+    async def distinct(self, field):
+        return await self.coll.distinct(field)
+
+    async def values(self, field, prefix=None):
+        """Streams every non-null `field` value, or only strings starting with `prefix`."""
+        async for doc in self.coll.find(_values_query(field, prefix), {"_id": 0, field: 1}):
+            yield doc[field]
+
+    async def upsert(self, key, values):
+        await self.coll.update_one({self.key: key}, {"$set": {**values, self.key: key}}, upsert=True)
+
+    async def update_many(self, updates):
+        # {key: values}, one round trip
+        if updates:
+            await self.coll.bulk_write([UpdateOne({self.key: k}, {"$set": v}) for k, v in updates.items()],
+                                       ordered=False)
+
+    async def all(self):
+        async for doc in self.coll.find({}, {"_id": 0}).sort(self.key, 1):
+            yield doc
+
+
+class MongoLogs:
+    # One regular document per reading, written through the SCHEMA_MODE codec
+    def __init__(self, db, name, one_per_day=False):
+        self.db = db
+        self.name = name
+        self.one_per_day = one_per_day
+
+    @property
+    def coll(self):
+        coll, preference = self.db[self.name], read_preference.get()
+        return coll if preference is None else coll.with_options(read_preference=preference)
+
+    async def ensure(self):
+        pass
+
+    async def insert(self, doc):
+        await self.insert_many([doc])
+
+    async def insert_many(self, docs):
+        if docs:
+            await self.coll.insert_many([schema.encode(d) for d in docs])
+
+    async def find(self, user_id, order_by="date", sort=1, limit=None, fields=None, since=None):
+        query = {"user_id": user_id, **(schema.date_range(gte=since) if since else {})}
+        projection = schema.projection(fields)
+        return await self._sorted(query, projection, order_by, sort, limit)
+
+    async def _sorted(self, query, projection, field, direction, limit):
+        if schema.MODE != "migrating" or field not in schema.DATE_FIELDS | schema.TIME_FIELDS:
+            cursor = self.coll.find(query, projection).sort(field, direction)
+            return schema.decode_all(await cursor.to_list(limit))
+        # Mongo sorts by BSON type first, so every compact value would order before every
+        # legacy string: sort each form on its own and merge them by the decoded value
+        extra = {} if len(projection) == 1 or field in projection else {field: 1}
+        halves = []
+        for form in ({"$type": "string"}, {"$not": {"$type": "string"}}):
+            cursor = self.coll.find({**query, field: form}, {**projection, **extra}).sort(field, direction)
+            halves.append(schema.decode_all(await cursor.to_list(limit)))
+        merged = heapq.merge(*halves, key=lambda d: d.get(field) or "", reverse=direction < 0)
+        docs = list(itertools.islice(merged, limit))
+        return [{k: v for k, v in d.items() if k not in extra} for d in docs] if extra else docs
+
+    async def find_day(self, user_id, day):
+        return schema.decode_all(await self.coll.find(schema.match(user_id=user_id, date=day), {"_id": 0}).to_list(None))
+
+    async def get_day(self, user_id, day):
+        return schema.decode(await self.coll.find_one(schema.match(user_id=user_id, date=day), {"_id": 0}))
+
+    async def put_day(self, user_id, day, values, on_insert=None):
+        doc = await self.coll.find_one_and_update(
+            schema.match(user_id=user_id, date=day),
+            {"$set": schema.encode(values),
+             "$setOnInsert": schema.encode({**(on_insert or {}), "user_id": user_id, "date": day})},
+            projection={"_id": 0}, upsert=True, return_document=ReturnDocument.AFTER)
+        return schema.decode(doc)
+
+    async def put_days(self, items):
+        """Bulk put_day: items are (user_id, day, values, on_insert) tuples, written in one round trip."""
+        if items:
+            await self.coll.bulk_write([UpdateOne(
+                schema.match(user_id=user_id, date=day),
+                {"$set": schema.encode(values),
+                 "$setOnInsert": schema.encode({**(on_insert or {}), "user_id": user_id, "date": day})},
+                upsert=True) for user_id, day, values, on_insert in items], ordered=False)
+
+    async def get(self, user_id, doc_id):
+        return schema.decode(await self.coll.find_one(schema.match(id=doc_id, user_id=user_id), {"_id": 0}))
+
+    async def delete(self, user_id, doc_id):
+        result = await self.coll.delete_one(schema.match(id=doc_id, user_id=user_id))
+        return result.deleted_count > 0
+
+    async def daily_values(self, user_id, start, end, field, op="first"):
+        # One $match/$group for the whole range, keyed by date; op is "first" or "sum"
+        pipeline = [{"$match": {"user_id": user_id, **schema.date_range(gte=start, lte=end)}},
+                    {"$group": {"_id": "$date", "value": {f"${op}": f"${field}"}}}]
+        out = {}
+        async for d in self.coll.aggregate(pipeline):
+            merge_day(out, schema.day_string(d["_id"]), d["value"], op)
+        return out
+
+    async def values(self, field, prefix=None):
+        """Streams every non-null `field` value, or only strings starting with `prefix`."""
+        async for doc in self.coll.find(_values_query(field, prefix), {"_id": 0, field: 1}):
+            yield doc[field]
+
+    async def distinct(self, field, user_id=None):
+        values = await self.coll.distinct(field, {"user_id": user_id} if user_id else {})
+        # dict.fromkeys: in SCHEMA_MODE=migrating a day can be stored both ways
+        return list(dict.fromkeys(schema.day_string(v) for v in values)) if field == "date" else values
+
+    def _range(self, start=None, end=None):
+        return schema.date_range(gte=start, lte=end)
+
+    def _filter(self, user_id, start=None, end=None, equals=None, text=None):
+        query = {"user_id": user_id, **schema.match(**(equals or {}))}
+        if start or end:
+            query.update(self._range(start, end))
+        if text:
+            # Any of the words, stemmed; the text index is prefixed by user_id so this stays per user
+            query["$text"] = {"$search": text}
+        return query
+
+    async def search(self, user_id, start=None, end=None, equals=None, text=None, limit=50):
+        """Newest-first documents matching every given filter."""
+        return await self._sorted(self._filter(user_id, start, end, equals, text), {"_id": 0}, "timestamp", -1, limit)
+
+    async def grouped_totals(self, user_id, by, fields, start=None, end=None, equals=None, text=None):
+        """[{"date", by, "count", **sums of fields}] per day and value of `by`, one $group."""
+        pipeline = [{"$match": self._filter(user_id, start, end, equals, text)},
+                    {"$group": {"_id": {"date": "$date", "key": f"${by}"}, "count": {"$sum": 1},
+                                **{f: {"$sum": f"${f}"} for f in fields}}}]
+        rows = {}
+        async for d in self.coll.aggregate(pipeline):
+            day, key = schema.day_string(d["_id"]["date"]), d["_id"].get("key")
+            row = rows.setdefault((day, key), {"date": day, by: key, "count": 0, **{f: 0 for f in fields}})
+            for f in ("count", *fields):
+                row[f] += d[f]
+        return list(rows.values())
+
+    async def daily_values_many(self, user_ids, start, end, field, op="first"):
+        """daily_values for a batch of users: {user_id: {date: value}}, one $group."""
+        pipeline = [{"$match": {"user_id": {"$in": list(user_ids)}, **self._range(start, end)}},
+                    {"$group": {"_id": {"user_id": "$user_id", "date": "$date"}, "value": {f"${op}": f"${field}"}}}]
+        out = {}
+        async for d in self.coll.aggregate(pipeline):
+            merge_day(out.setdefault(d["_id"]["user_id"], {}), schema.day_string(d["_id"]["date"]), d["value"], op)
+        return out
+
+    async def latest_by_user(self, user_ids):
+        """{user_id: most recently written document} for a batch of users."""
+        pipeline = [{"$match": {"user_id": {"$in": list(user_ids)}}}, {"$sort": {"_id": -1}},
+                    {"$group": {"_id": "$user_id", "doc": {"$first": "$$ROOT"}}},
+                    {"$replaceRoot": {"newRoot": "$doc"}}, {"$project": {"_id": 0}}]
+        return {d["user_id"]: schema.decode(d) async for d in self.coll.aggregate(pipeline)}
+
+    async def totals_by_user(self, start, end, field):
+        """{user_id: sum of field} over [start, end] for every user, one $group."""
+        pipeline = [{"$match": self._range(start, end)},
+                    {"$group": {"_id": "$user_id", "value": {"$sum": f"${field}"}}}]
+        return {d["_id"]: d["value"] async for d in self.coll.aggregate(pipeline)}
+
+    async def dates_by_user(self, since, user_ids=None):
+        """{user_id: [logged days]} since `since` for every user (or just `user_ids`)."""
+        pipeline = [{"$match": {**self._range(since), **({"user_id": {"$in": list(user_ids)}} if user_ids else {})}},
+                    {"$group": {"_id": "$user_id", "dates": {"$addToSet": "$date"}}}]
+        return {d["_id"]: sorted({schema.day_string(v) for v in d["dates"]}) async for d in self.coll.aggregate(pipeline)}
+
+
+class MongoTimeSeriesLogs(MongoLogs):
+    # MongoDB time-series collection: user_id is the metaField and the day (a
+    # BSON date at UTC midnight) the timeField, so each user's readings are
+    # bucketed and compressed together. Time-series documents can't be
+    # upserted, so a day's value is changed by appending a newer reading;
+    # reads take the latest one by recorded_at.
+    def __init__(self, db, name, one_per_day=False):
+        super().__init__(db, f"{name}_ts", one_per_day)
+
+    async def ensure(self):
+        if self.name not in await self.db.list_collection_names(filter={"name": self.name}):
+            try:
+                await self.db.create_collection(self.name, timeseries={
+                    "timeField": "date", "metaField": "user_id", "granularity": "hours"})
+            except CollectionInvalid:
+                pass
+
+    def _encode(self, doc):
+        # New collections, so always the compact codec whatever SCHEMA_MODE says
+        out = schema.compact({k: v for k, v in doc.items() if k != "date"})
+        out["date"] = schema.day_datetime(doc["date"])
+        out.setdefault("recorded_at", datetime.now(timezone.utc))
+        return out
+
+    @staticmethod
+    def _decode(doc):
+        if doc:
+            doc.pop("recorded_at", None)
+        return schema.decode(doc)
+
+    def _range(self, start=None, end=None):
+        cond = {}
+        if start is not None:
+            cond["$gte"] = schema.day_datetime(start)
+        if end is not None:
+            cond["$lte"] = schema.day_datetime(end)
+        return {"date": cond} if cond else {}
+
+    async def insert_many(self, docs):
+        if docs:
+            await self.coll.insert_many([self._encode(d) for d in docs])
+
+    async def _latest_per_day(self, match, sort=-1, limit=None):
+        pipeline = [{"$match": match}, {"$sort": {"date": 1, "recorded_at": -1}},
+                    {"$group": {"_id": "$date", "doc": {"$first": "$$ROOT"}}},
+                    {"$replaceRoot": {"newRoot": "$doc"}}, {"$sort": {"date": sort}}]
+        if limit:
+            pipeline.append({"$limit": limit})
+        pipeline.append({"$project": {"_id": 0}})
+        return [self._decode(d) async for d in self.coll.aggregate(pipeline)]
+
+    async def find(self, user_id, order_by="date", sort=1, limit=None, fields=None, since=None):
+        query = {"user_id": user_id, **self._range(since)}
+        if self.one_per_day:
+            docs = await self._latest_per_day(query, sort, limit)
+            return [{k: d[k] for k in fields if k in d} for d in docs] if fields else docs
+        projection = schema.projection(fields)
+        cursor = self.coll.find(query, projection).sort(order_by, sort)
+        return [self._decode(d) for d in await cursor.to_list(limit)]
+
+    async def find_day(self, user_id, day):
+        if self.one_per_day:
+            return await self._latest_per_day({"user_id": user_id, **self._range(day, day)})
+        cursor = self.coll.find({"user_id": user_id, **self._range(day, day)}, {"_id": 0})
+        return [self._decode(d) for d in await cursor.to_list(None)]
+
+    async def get_day(self, user_id, day):
+        docs = await self._latest_per_day({"user_id": user_id, **self._range(day, day)}, limit=1)
+        return docs[0] if docs else None
+
+    async def put_day(self, user_id, day, values, on_insert=None):
+        current = await self.get_day(user_id, day) or {**(on_insert or {}), "user_id": user_id, "date": day}
+        doc = {**current, **values}
+        await self.coll.insert_one(self._encode(doc))
+        return doc
+
+    async def put_days(self, items):
+        for user_id, day, values, on_insert in items:
+            await self.put_day(user_id, day, values, on_insert)
+
+    async def daily_values(self, user_id, start, end, field, op="first"):
+        if self.one_per_day:
+            docs = await self._latest_per_day({"user_id": user_id, **self._range(start, end)})
+            return {d["date"]: d.get(field) for d in docs}
+        pipeline = [{"$match": {"user_id": user_id, **self._range(start, end)}},
+                    {"$group": {"_id": "$date", "value": {f"${op}": f"${field}"}}}]
+        return {schema.day_string(d["_id"]): d["value"] async for d in self.coll.aggregate(pipeline)}
+
+    async def daily_values_many(self, user_ids, start, end, field, op="first"):
+        if not self.one_per_day:
+            return await super().daily_values_many(user_ids, start, end, field, op)
+        pipeline = [{"$match": {"user_id": {"$in": list(user_ids)}, **self._range(start, end)}},
+                    {"$sort": {"date": 1, "recorded_at": -1}},
+                    {"$group": {"_id": {"user_id": "$user_id", "date": "$date"}, "value": {"$first": f"${field}"}}}]
+        out = {}
+        async for d in self.coll.aggregate(pipeline):
+            out.setdefault(d["_id"]["user_id"], {})[schema.day_string(d["_id"]["date"])] = d["value"]
+        return out
+
+    async def totals_by_user(self, start, end, field):
+        if not self.one_per_day:
+            return await super().totals_by_user(start, end, field)
+        pipeline = [{"$match": self._range(start, end)}, {"$sort": {"date": 1, "recorded_at": -1}},
+                    {"$group": {"_id": {"user_id": "$user_id", "date": "$date"}, "value": {"$first": f"${field}"}}},
+                    {"$group": {"_id": "$_id.user_id", "value": {"$sum": "$value"}}}]
+        return {d["_id"]: d["value"] async for d in self.coll.aggregate(pipeline)}
+
+
+class MongoTrends:
+    # Per-user smoothed-trend state (optimistic `version`) plus one point per day
+    def __init__(self, db):
+        self.states, self.points = db.weight_trends, db.weight_trend_points
+
+    async def get(self, user_id):
+        return await self.states.find_one({"user_id": user_id}, {"_id": 0})
+
+    async def save(self, user_id, state, version):
+        """Stores state if the stored version is still `version` (0 = no state yet); False on a lost race."""
+        try:
+            if version:
+                result = await self.states.replace_one({"user_id": user_id, "version": version}, state)
+                return result.matched_count > 0
+            await self.states.insert_one({**state})
+            return True
+        except DuplicateKeyError:
+            return False
+
+    async def replace(self, user_id, state, points):
+        await self.points.delete_many({"user_id": user_id})
+        if not state:
+            await self.states.delete_one({"user_id": user_id})
+            return
+        await self.states.replace_one({"user_id": user_id}, state, upsert=True)
+        await self.points.insert_many([{**p, "user_id": user_id} for p in points])
+
+    async def put_point(self, user_id, point):
+        await self.points.update_one({"user_id": user_id, "date": point["date"]},
+                                     {"$set": {**point, "user_id": user_id}}, upsert=True)
+
+    async def points_since(self, user_id, since, limit=None):
+        cursor = self.points.find({"user_id": user_id, "date": {"$gte": since}}, {"_id": 0, "user_id": 0})
+        return await cursor.sort("date", 1).to_list(limit)
+
+    async def point_at_or_before(self, user_id, day):
+        return await self.points.find_one({"user_id": user_id, "date": {"$lte": day}}, {"_id": 0, "user_id": 0},
+                                          sort=[("date", -1)])
+
+
+class MongoLeaderboards:
+    # One document per (board, period, user) holding the user's score; the
+    # (board, period, score) index serves top-N reads and rank counts
+    def __init__(self, db):
+        self.coll = db.leaderboards
+
+    async def set(self, board, period, user_id, score):
+        key = {"board": board, "period": period, "user_id": user_id}
+        if score > 0:
+            await self.coll.update_one(key, {"$set": {"score": score}}, upsert=True)
+        else:
+            await self.coll.delete_one(key)
+
+    async def replace(self, board, period, scores):
+        """Makes the board exactly `scores` ({user_id: score}); zero scores are dropped."""
+        generation = str(ObjectId())
+        ops = [UpdateOne({"board": board, "period": period, "user_id": user_id},
+                         {"$set": {"score": score, "generation": generation}}, upsert=True)
+               for user_id, score in scores.items() if score > 0]
+        if ops:
+            await self.coll.bulk_write(ops, ordered=False)
+        await self.coll.delete_many({"board": board, "period": period, "generation": {"$ne": generation}})
+
+    async def top(self, board, period, limit):
+        cursor = self.coll.find({"board": board, "period": period}, {"_id": 0, "user_id": 1, "score": 1})
+        return await cursor.sort([("score", -1), ("user_id", 1)]).to_list(limit)
+
+    async def rank(self, board, period, user_id):
+        """{"rank", "score"} with ties sharing a rank, or None when the user isn't on the board."""
+        doc = await self.coll.find_one({"board": board, "period": period, "user_id": user_id}, {"score": 1})
+        if not doc:
+            return None
+        above = await self.coll.count_documents({"board": board, "period": period, "score": {"$gt": doc["score"]}})
+        return {"rank": above + 1, "score": doc["score"]}
+
+    async def count(self, board, period):
+        return await self.coll.count_documents({"board": board, "period": period})
+
+    async def prune(self, board, before):
+        result = await self.coll.delete_many({"board": board, "period": {"$lt": before}})
+        return result.deleted_count
+
+
+class MongoPushSubs:
+    # One document per browser/device endpoint
+    def __init__(self, db):
+        self.coll = db.push_subs
+
+    async def upsert(self, doc):
+        await self.coll.update_one({"endpoint": doc["endpoint"]}, {"$set": doc}, upsert=True)
+
+    async def delete(self, endpoint, user_id):
+        result = await self.coll.delete_one({"endpoint": endpoint, "user_id": user_id})
+        return result.deleted_count > 0
+
+    async def for_user(self, user_id, limit=50):
+        return await self.coll.find({"user_id": user_id}, {"_id": 0, "endpoint": 1, "keys": 1}).to_list(limit)
+
+    async def all(self):
+        async for sub in self.coll.find({}, {"_id": 0, "endpoint": 1, "keys": 1}).sort("endpoint", 1):
+            yield sub
+
+    async def delete_endpoints(self, endpoints):
+        result = await self.coll.delete_many({"endpoint": {"$in": endpoints}})
+        return result.deleted_count
+
+
+class MongoSettings:
+    def __init__(self, db):
+        self.coll = db.settings
+
+    async def get(self, type_):
+        return await self.coll.find_one({"type": type_}, {"_id": 0})
+
+    async def setdefault(self, type_, values):
+        # Concurrent callers all get the first stored value: $setOnInsert plus
+        # the unique index on settings.type means exactly one insert wins
+        try:
+            return await self.coll.find_one_and_update(
+                {"type": type_}, {"$setOnInsert": {"type": type_, **values}},
+                projection={"_id": 0}, upsert=True, return_document=ReturnDocument.AFTER)
+        except DuplicateKeyError:
+            return await self.get(type_)
+
+
+class MongoFiles:
+    # GridFS, content-addressed: identical bytes share one file whose
+    # metadata.refs counts the documents pointing at it
+    def __init__(self, db):
+        self.db = db
+
+    async def put(self, data, filename, content_type):
+        digest = hashlib.sha256(data).hexdigest()
+        # Attaching restarts the sweep's grace period, like a fresh upload: the new reference may not be written yet
+        existing = await self.db["fs.files"].find_one_and_update(
+            {"metadata.sha256": digest, "length": len(data), "metadata.refs": {"$gt": 0}},
+            {"$inc": {"metadata.refs": 1}, "$set": {"uploadDate": datetime.now(timezone.utc)}}, projection={"_id": 1})
+        if existing:
+            return str(existing["_id"])
+        bucket = AsyncIOMotorGridFSBucket(self.db)
+        file_id = await bucket.upload_from_stream(
+            filename, data, metadata={"content_type": content_type, "sha256": digest, "refs": 1})
+        return str(file_id)
+
+    async def get(self, file_id):
+        bucket = AsyncIOMotorGridFSBucket(self.db)
+        stream = await bucket.open_download_stream(ObjectId(file_id))
+        data = await stream.read()
+        content_type = (stream.metadata or {}).get("content_type", "application/octet-stream")
+        return data, content_type
+
+    async def release(self, file_id):
+        # Drops one reference; the bytes go away with the last one
+        doc = await self.db["fs.files"].find_one_and_update(
+            {"_id": ObjectId(file_id)}, {"$inc": {"metadata.refs": -1}},
+            projection={"metadata.refs": 1}, return_document=ReturnDocument.AFTER)
+        if doc and doc.get("metadata", {}).get("refs", 0) <= 0:
+            bucket = AsyncIOMotorGridFSBucket(self.db)
+            await bucket.delete(ObjectId(file_id))
+
+    async def sweep(self, referenced, grace, batch_size):
+        # Files younger than the grace period may belong to an upload whose metadata insert is in flight
+        cutoff = datetime.now(timezone.utc) - grace
+        stats = {"scanned": 0, "deleted": 0, "reclaimed_bytes": 0}
+        batch = {}
+
+        async def flush():
+            ids = list(batch)
+            # Re-checked at delete time: a put() that attached since the snapshot moved uploadDate past the cutoff
+            await self.db["fs.files"].delete_many({"_id": {"$in": ids}, "uploadDate": {"$lt": cutoff}})
+            kept = {f["_id"] async for f in self.db["fs.files"].find({"_id": {"$in": ids}}, {"_id": 1})}
+            deleted = [i for i in ids if i not in kept]
+            if deleted:
+                await self.db["fs.chunks"].delete_many({"files_id": {"$in": deleted}})
+            stats["deleted"] += len(deleted)
+            stats["reclaimed_bytes"] += sum(batch[i] for i in deleted)
+            batch.clear()
+        async for f in self.db["fs.files"].find({"uploadDate": {"$lt": cutoff}}, {"_id": 1, "length": 1}):
+            stats["scanned"] += 1
+            if str(f["_id"]) in referenced:
+                continue
+            batch[f["_id"]] = f.get("length", 0)
+            if len(batch) >= batch_size:
+                await flush()
+        if batch:
+            await flush()
+        return stats
+
+
+class MongoStorage:
+    backend = "mongo"
+
+    def __init__(self, db, measurement_storage="documents"):
+        if measurement_storage not in ("documents", "timeseries"):
+            raise ValueError(f"Unknown MEASUREMENT_STORAGE: {measurement_storage}")
+        self.db = db
+        self.users = MongoRecords(db, "users", "id")
+        self.profiles = MongoRecords(db, "profiles", "user_id")
+        self.nutrition_accounts = MongoRecords(db, "nutrition_accounts", "user_id")
+        self.logs = {}
+        for name in LOG_COLLECTIONS:
+            timeseries = measurement_storage == "timeseries" and name in TIMESERIES_COLLECTIONS
+            repo = (MongoTimeSeriesLogs if timeseries else MongoLogs)(db, name, one_per_day=name in ONE_PER_DAY)
+            self.logs[name] = repo
+            setattr(self, name, repo)
+        self.trends = MongoTrends(db)
+        self.leaderboards = MongoLeaderboards(db)
+        self.push_subs = MongoPushSubs(db)
+        self.settings = MongoSettings(db)
+        self.files = MongoFiles(db)
+
+    async def ping(self):
+        await self.db.command("ping")
+
+    async def ensure_indexes(self):
+        # Time-series collections must exist before their first insert or index
+        for repo in self.logs.values():
+            await repo.ensure()
+        for coll, keys, opts in INDEXES:
+            name = self.logs[coll].name if coll in self.logs else coll
+            try:
+                try:
+                    await self.db[name].create_index(keys, **opts)
+                except DuplicateKeyError:
+                    if coll not in DEDUPE_ON_INDEX_BUILD:
+                        raise
+                    await self._dedupe(name, keys, DEDUPE_ON_INDEX_BUILD[coll])
+                    await self.db[name].create_index(keys, **opts)
+            except Exception as e:
+                logger.error(f"Index creation failed for {name} {keys}: {e}")
+
+    async def _dedupe(self, name, keys, keep):
+        pipeline = [{"$sort": keep},
+                    {"$group": {"_id": {f"k{i}": f"${field}" for i, (field, _) in enumerate(keys)},
+                                "ids": {"$push": "$_id"}, "n": {"$sum": 1}}},
+                    {"$match": {"n": {"$gt": 1}}}]
+        extra = [i async for d in self.db[name].aggregate(pipeline, allowDiskUse=True) for i in d["ids"][1:]]
+        result = await self.db[name].delete_many({"_id": {"$in": extra}})
+        logger.warning(f"Removed {result.deleted_count} duplicate {name} documents to build its {keys} index")
+
+    def close(self):
+        self.db.client.close()
+
+
+def make_storage(backend, db=None, measurement_storage="documents", sqlite_path=None, sqlite_blobs="table"):
+    if backend == "mongo":
+        return MongoStorage(db, measurement_storage)
+    if backend == "sqlite":
+        from sqlite_storage import SqliteStorage
+        return SqliteStorage(sqlite_path, blobs=sqlite_blobs)
+    raise ValueError(f"Unknown STORAGE_BACKEND: {backend}")
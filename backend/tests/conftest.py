@@ -0,0 +1,32 @@
+"""
+Shared fixtures: a fresh SQLite storage per test.
+"""
+import asyncio
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from sqlite_storage import SqliteStorage  # noqa: E402
+
+
+@pytest.fixture
+def run_sqlite(tmp_path):
+    """run_sqlite(fn, *services, blobs="table") runs `await fn(storage, *services)` on a new
+    database under tmp_path. Each service is built from the storage by a factory; ones with
+    an async close() are closed before the storage."""
+    def run(fn, *factories, blobs="table"):
+        async def go():
+            storage = SqliteStorage(tmp_path / "t.db", blobs=blobs)
+            services = []
+            try:
+                services = [make(storage) for make in factories]
+                return await fn(storage, *services)
+            finally:
+                for service in services:
+                    if hasattr(service, "close"):
+                        await service.close()
+                storage.close()
+        return asyncio.run(go())
+    return run
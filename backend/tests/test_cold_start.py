@@ -0,0 +1,23 @@
+"""
+Cold-start tests: heavy modules stay lazy and the first request is served
+without touching Mongo.
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import bench  # noqa: E402
+
+
+class TestColdStart:
+    def test_heavy_modules_not_imported_at_boot(self):
+        result = bench.measure_cold_start(runs=1)
+        assert result["eager"] == [], f"Eagerly imported: {result['eager']}"
+        assert result["status"] == 200
+
+    def test_cold_start_within_baseline(self):
+        baseline = bench.load_baseline()
+        result = bench.measure_cold_start(runs=3)
+        timings = {k: result[k] for k in ("import_s", "first_request_s")}
+        # Generous tolerance: CI machines are noisier than the one that recorded the baseline
+        assert bench.compare("cold_start", timings, baseline, tolerance=2.0) == []
@@ -1,6 +1,6 @@
 """
 FitForge Backend API Tests
-Tests: Auth (register/login), Nutrition (manual log, copy-yesterday),
+Tests: Auth (register/login), Nutrition (manual log, copy-yesterday, templates),
 Steps, Water, Stats, Profile endpoints
 """
 import pytest
@@ -242,6 +242,42 @@ class TestNutrition:
         print("PASS: Copy yesterday with no data returns 404")
 
 
+# ---- Meal Template Tests ----
+
+class TestMealTemplates:
+    """Meal templates built from a logged day and applied across a range"""
+
+    def test_create_and_apply_on_weekdays(self, auth_headers):
+        requests.post(f"{BASE_URL}/api/nutrition/manual", headers=auth_headers, json={
+            "mode": "total",
+            "calories": 1700,
+            "date": "2026-03-01"
+        })
+        resp = requests.post(f"{BASE_URL}/api/nutrition/templates", headers=auth_headers, json={
+            "name": "TEST plan",
+            "date": "2026-03-01"
+        })
+        assert resp.status_code == 200, f"Expected 200 got {resp.status_code}: {resp.text}"
+        template_id = resp.json()["id"]
+        # Mondays and Wednesdays of March 2026
+        resp = requests.post(f"{BASE_URL}/api/nutrition/templates/{template_id}/apply", headers=auth_headers,
+                             json={"start": "2026-03-01", "end": "2026-03-31", "weekdays": [0, 2]})
+        assert resp.status_code == 200, f"Expected 200 got {resp.status_code}: {resp.text}"
+        assert resp.json()["applied"] == 9
+        day = requests.get(f"{BASE_URL}/api/nutrition?date=2026-03-04", headers=auth_headers).json()
+        assert day["total"]["calories"] == 1700
+        assert day["source"] == "template"
+        print("PASS: Template applied to 9 weekdays in one request")
+
+    def test_template_from_empty_day(self, auth_headers):
+        resp = requests.post(f"{BASE_URL}/api/nutrition/templates", headers=auth_headers, json={
+            "name": "TEST empty",
+            "date": "2020-01-03"
+        })
+        assert resp.status_code == 404
+        print("PASS: Template from a day with no meals returns 404")
+
+
 # ---- Steps Tests ----
 
 class TestSteps:
@@ -276,6 +312,28 @@ class TestSteps:
         print(f"PASS: GET /steps returns list of {len(data)} entries")
 
 
+# ---- Leaderboard Tests ----
+
+class TestLeaderboards:
+    """Weekly and streak leaderboards"""
+
+    def test_steps_board_tracks_own_score(self, auth_headers):
+        for steps in (6000, 12000):
+            requests.post(f"{BASE_URL}/api/steps", headers=auth_headers, json={"steps": steps, "date": "2026-03-10"})
+        resp = requests.get(f"{BASE_URL}/api/leaderboards/steps?period=2026-W11", headers=auth_headers)
+        assert resp.status_code == 200, f"Expected 200 got {resp.status_code}: {resp.text}"
+        data = resp.json()
+        assert data["me"]["score"] == 12000
+        assert any(e["me"] for e in data["top"]) or data["me"]["rank"] > len(data["top"])
+        print(f"PASS: Steps leaderboard rank {data['me']['rank']} of {data['participants']}")
+
+    def test_unknown_board_and_bad_period(self, auth_headers):
+        assert requests.get(f"{BASE_URL}/api/leaderboards/nope", headers=auth_headers).status_code == 404
+        resp = requests.get(f"{BASE_URL}/api/leaderboards/steps?period=March", headers=auth_headers)
+        assert resp.status_code == 400
+        print("PASS: Unknown board 404, malformed period 400")
+
+
 # ---- Water Tests ----
 
 class TestWater:
@@ -339,6 +397,21 @@ class TestStats:
         assert data["eaten"] == 1800
         print(f"PASS: Stats reflects logged nutrition: eaten={data['eaten']}")
 
+    def test_gym_days_saved_matches_goal_pace(self, auth_headers):
+        """Add-gym estimate: days_to_goal minus rounded weeks at deficit + 300, even years out"""
+        profile = requests.get(f"{BASE_URL}/api/profile", headers=auth_headers).json()
+        for weight, goal, deficit in [(70.0, 60.0, 39), (90.0, 80.0, 419)]:
+            requests.put(f"{BASE_URL}/api/profile", headers=auth_headers, json={"weight": weight, "goalKg": goal})
+            tdee = requests.get(f"{BASE_URL}/api/stats", headers=auth_headers).json()["tdee"]
+            requests.put(f"{BASE_URL}/api/profile", headers=auth_headers, json={"calTarget": tdee - deficit})
+            data = requests.get(f"{BASE_URL}/api/stats", headers=auth_headers).json()
+            gym_weeks = round((weight - goal) / ((deficit + 300) * 7 / 7700))
+            assert data["days_to_goal"] == round((weight - goal) / (deficit * 7 / 7700)) * 7
+            assert data["gym_days_saved"] == max(data["days_to_goal"] - gym_weeks * 7, 0) > 0
+            print(f"PASS: gym_days_saved={data['gym_days_saved']} of days_to_goal={data['days_to_goal']}")
+        requests.put(f"{BASE_URL}/api/profile", headers=auth_headers,
+                     json={k: profile[k] for k in ("weight", "goalKg", "calTarget")})
+
     def test_get_stats_historical_date(self, auth_headers):
         resp = requests.get(f"{BASE_URL}/api/stats?date=2026-02-20", headers=auth_headers)
         assert resp.status_code == 200
@@ -347,6 +420,68 @@ class TestStats:
         assert data["date"] == "2026-02-20"
         print("PASS: GET /stats with historical date works")
 
+    def test_get_stats_range_matches_daily_stats(self, auth_headers):
+        resp = requests.get(f"{BASE_URL}/api/stats/range?start=2026-02-24&end=2026-02-26", headers=auth_headers)
+        assert resp.status_code == 200, f"Expected 200 got {resp.status_code}: {resp.text}"
+        days = resp.json()["days"]
+        assert [d["date"] for d in days] == ["2026-02-24", "2026-02-25", "2026-02-26"]
+        daily = requests.get(f"{BASE_URL}/api/stats?date=2026-02-25", headers=auth_headers).json()
+        for key in ("eaten", "deficit", "burned_today", "water_glasses", "health_score"):
+            assert days[1][key] == daily[key], f"{key}: range={days[1][key]} daily={daily[key]}"
+        print("PASS: GET /stats/range agrees with per-day /stats")
+
+    def test_get_stats_range_rejects_inverted_range(self, auth_headers):
+        resp = requests.get(f"{BASE_URL}/api/stats/range?start=2026-02-26&end=2026-02-24", headers=auth_headers)
+        assert resp.status_code == 400
+        print("PASS: GET /stats/range with end before start returns 400")
+
+
+# ---- Weight Trend Tests ----
+
+class TestWeightTrend:
+    """Smoothed trend weight endpoint tests"""
+
+    def test_trend_seeded_for_new_user(self, auth_headers):
+        resp = requests.get(f"{BASE_URL}/api/weight-trend?days=365", headers=auth_headers)
+        assert resp.status_code == 200, f"Expected 200 got {resp.status_code}: {resp.text}"
+        data = resp.json()
+        assert data["trend"] is not None
+        assert len(data["series"]) >= 6
+        print(f"PASS: GET /weight-trend → trend={data['trend']}, weekly_rate={data['weekly_rate']}")
+
+    def test_trend_follows_new_weigh_in(self, auth_headers):
+        requests.post(f"{BASE_URL}/api/weight-logs", headers=auth_headers, json={"weight": 85.0})
+        data = requests.get(f"{BASE_URL}/api/weight-trend", headers=auth_headers).json()
+        assert data["series"][-1]["weight"] == 85.0
+        print("PASS: New weight log updates the trend series")
+
+
+# ---- Projection Tests ----
+
+class TestProjection:
+    """What-if projection endpoint tests"""
+
+    def test_projection_grid(self, auth_headers):
+        resp = requests.post(f"{BASE_URL}/api/projection", headers=auth_headers, json={
+            "calTargets": [1600, 1800],
+            "activityFactors": [1.2, 1.55],
+            "exerciseKcal": [0, 300],
+            "weeks": 52
+        })
+        assert resp.status_code == 200, f"Expected 200 got {resp.status_code}: {resp.text}"
+        data = resp.json()
+        assert len(data["scenarios"]) == 8
+        assert all(len(s["weights"]) == 53 for s in data["scenarios"])
+        print("PASS: POST /projection returns 8 scenarios x 52 weeks")
+
+    def test_projection_rejects_oversized_grid(self, auth_headers):
+        resp = requests.post(f"{BASE_URL}/api/projection", headers=auth_headers, json={
+            "calTargets": list(range(1000, 3000)),
+            "exerciseKcal": [0, 100]
+        })
+        assert resp.status_code == 400
+        print("PASS: POST /projection with >1000 scenarios returns 400")
+
 
 # ---- Workouts Tests ----
 
@@ -388,3 +523,54 @@ class TestWorkouts:
         del_resp = requests.delete(f"{BASE_URL}/api/workouts/{wid}", headers=auth_headers)
         assert del_resp.status_code == 200
         print("PASS: Delete workout works")
+
+    def test_workout_analytics(self, auth_headers):
+        resp = requests.get(f"{BASE_URL}/api/workouts/analytics?type=TEST_Chest Day&q=test", headers=auth_headers)
+        assert resp.status_code == 200, f"Expected 200 got {resp.status_code}: {resp.text}"
+        data = resp.json()
+        assert [g["type"] for g in data["by_type"]] == ["TEST_Chest Day"]
+        assert data["totals"]["calories"] == data["by_type"][0]["calories"] >= 350
+        assert sum(w["count"] for w in data["by_week"]) == data["totals"]["count"]
+        assert all(w["type"] == "TEST_Chest Day" for w in data["workouts"])
+        print(f"PASS: Workout analytics over {data['totals']['count']} matching workouts")
+
+    def test_workout_analytics_range_limit(self, auth_headers):
+        resp = requests.get(f"{BASE_URL}/api/workouts/analytics?start=2020-01-01&end=2026-01-01", headers=auth_headers)
+        assert resp.status_code == 400
+        print("PASS: Analytics range over a year rejected")
+
+
+# ---- Health Report Tests ----
+
+class TestHealthReports:
+    """Weekly reports written by the health_reports job"""
+
+    def test_get_health_reports(self, auth_headers):
+        resp = requests.get(f"{BASE_URL}/api/health-reports", headers=auth_headers)
+        assert resp.status_code == 200, f"Expected 200 got {resp.status_code}: {resp.text}"
+        assert isinstance(resp.json(), list)
+        print(f"PASS: GET /health-reports returns {len(resp.json())} reports")
+
+
+# ---- Admin Tests ----
+
+class TestAdmin:
+    """Admin job endpoints"""
+
+    def test_jobs_requires_admin_token(self, auth_headers):
+        resp = requests.get(f"{BASE_URL}/api/admin/jobs", headers=auth_headers)
+        assert resp.status_code == 403
+        print("PASS: /admin/jobs without admin token returns 403")
+
+    def test_profile_requires_admin_token(self, auth_headers):
+        resp = requests.get(f"{BASE_URL}/api/workouts", headers={**auth_headers, "X-Profile": "1"})
+        assert resp.status_code == 200
+        assert "X-Profile-Id" not in resp.headers
+        resp = requests.get(f"{BASE_URL}/api/admin/profiles", headers=auth_headers)
+        assert resp.status_code == 403
+        print("PASS: X-Profile without admin token is ignored")
+
+    def test_send_checkin_without_subscription(self, auth_headers):
+        resp = requests.post(f"{BASE_URL}/api/push/send-checkin", headers=auth_headers)
+        assert resp.status_code == 404
+        print("PASS: send-checkin without subscription returns 404")
@@ -0,0 +1,65 @@
+"""
+Weekly health report tests against the SQLite storage backend.
+Tests: agreement with the /stats math, streak as of the week's end, body fat
+from the latest measurements, batching through the process pool, re-runs
+replacing reports, incomplete profiles skipped
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import metrics  # noqa: E402
+from health_reports import HealthReports, last_week  # noqa: E402
+
+WEEK = "2024-W19"  # 2024-05-06 .. 2024-05-12
+PROFILE = {"weight": 90, "heightCm": 180, "age": 35, "gender": "male", "calTarget": 1900, "goalKg": 80}
+
+
+def reports(**kwargs):
+    return lambda storage: HealthReports(storage, workers=1, **kwargs)
+
+
+async def add_user(storage, user_id, **profile):
+    await storage.profiles.insert({"user_id": user_id, **PROFILE, **profile})
+
+
+class TestHealthReports:
+    def test_report_matches_stats_math(self, run_sqlite):
+        async def fn(storage, reports):
+            await add_user(storage, "u")
+            await storage.steps.put_day("u", "2024-05-06", {"steps": 10000})
+            await storage.workouts.insert_many([{"user_id": "u", "date": "2024-05-07", "calories": c} for c in (200, 150)])
+            await storage.nutrition.put_day("u", "2024-05-07", {"total": {"calories": 2000}})
+            await storage.weight_logs.insert_many([{"user_id": "u", "date": d, "weight": 90}
+                                                   for d in ("2024-05-11", "2024-05-12", "2024-05-20")])
+            await storage.body_comp.insert_many([{"user_id": "u", "date": "2024-05-01", "waist": 100, "neck": 40},
+                                                 {"user_id": "u", "date": "2024-05-08", "waist": 95, "neck": 40}])
+            totals = await reports.run(WEEK)
+            return totals, await storage.health_reports.find("u")
+        totals, docs = run_sqlite(fn, reports())
+        assert (totals["users"], totals["reports"]) == (1, 1)
+        report = docs[0]
+        assert (report["date"], report["week"]) == ("2024-05-06", WEEK)
+        bmi, _, tdee = metrics.body_metrics(90, 180, 35, "male")
+        monday = metrics.day_stats("2024-05-06", 10000, 0, None, 0, 90, 180, bmi, tdee, 1900, 2)
+        assert report["daily_scores"][0] == monday["health_score"]
+        assert (report["steps"], report["workout_calories"], report["nutrition_days"]) == (10000, 350, 1)
+        assert report["streak"] == 2  # the 2024-05-20 weigh-in is after the week
+        assert report["body_fat"] == metrics.navy_body_fat("male", 180, 95, 40)
+        assert report["weeks_to_goal"] == metrics.goal_pace(90, 80, max(tdee - 1900, 0))[1]
+
+    def test_batches_and_reruns(self, run_sqlite):
+        async def fn(storage, reports):
+            for i in range(25):
+                await add_user(storage, f"user-{i:02d}")
+            await add_user(storage, "incomplete", heightCm=None)
+            first = await reports.run(WEEK)
+            second = await reports.run(WEEK)
+            return first, second, await storage.health_reports.distinct("user_id")
+        first, second, users = run_sqlite(fn, reports(batch_size=10))
+        assert (first["users"], first["reports"], first["skipped"]) == (26, 25, 1)
+        assert second["reports"] == 25
+        assert len(users) == 25
+
+    def test_last_week(self):
+        assert last_week("2024-05-13") == WEEK
@@ -0,0 +1,84 @@
+"""
+Leaderboard tests against the SQLite storage backend.
+Tests: ISO week periods, per-user refresh from the logs, shared ranks on ties,
+top-N with names, reconciliation (drift, lapsed streaks, pruning)
+"""
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from leaderboards import CURRENT, STREAK, Leaderboards, week_bounds, week_of  # noqa: E402
+
+TODAY = "2024-05-08"  # Wednesday of 2024-W19
+
+
+async def log_steps(storage, boards, user_id, day, steps):
+    await storage.steps.put_day(user_id, day, {"steps": steps}, on_insert={"id": f"{user_id}-{day}"})
+    await boards.refresh_week("steps", user_id, day)
+
+
+class TestPeriods:
+    def test_week_of(self):
+        assert week_of(TODAY) == "2024-W19"
+        assert week_of("2024-12-30") == "2025-W01"
+
+    def test_week_bounds(self):
+        assert week_bounds("2024-W19") == ("2024-05-06", "2024-05-12")
+        with pytest.raises(ValueError):
+            week_bounds("2024-19")
+
+
+class TestLeaderboards:
+    def test_refresh_sums_the_week(self, run_sqlite):
+        async def fn(storage, boards):
+            await log_steps(storage, boards, "u", "2024-05-06", 4000)
+            await log_steps(storage, boards, "u", TODAY, 5000)
+            await log_steps(storage, boards, "u", TODAY, 6000)  # same day again replaces, not adds
+            await log_steps(storage, boards, "u", "2024-05-13", 1000)  # next week
+            return (await storage.leaderboards.rank("steps", "2024-W19", "u"),
+                    await storage.leaderboards.rank("steps", "2024-W20", "u"))
+        assert run_sqlite(fn, Leaderboards) == ({"rank": 1, "score": 10000}, {"rank": 1, "score": 1000})
+
+    def test_workout_delete_lowers_score(self, run_sqlite):
+        async def fn(storage, boards):
+            for i, calories in enumerate((300, 200)):
+                await storage.workouts.insert({"id": f"w{i}", "user_id": "u", "date": TODAY, "calories": calories})
+            await boards.refresh_week("workout_calories", "u", TODAY)
+            before = await storage.leaderboards.rank("workout_calories", "2024-W19", "u")
+            await storage.workouts.delete("u", "w0")
+            await boards.refresh_week("workout_calories", "u", TODAY)
+            return before, await storage.leaderboards.rank("workout_calories", "2024-W19", "u")
+        assert run_sqlite(fn, Leaderboards) == ({"rank": 1, "score": 500}, {"rank": 1, "score": 200})
+
+    def test_standings_rank_ties_and_names(self, run_sqlite):
+        async def fn(storage, boards):
+            for user_id, steps in (("a", 9000), ("b", 7000), ("c", 7000), ("d", 1000)):
+                await storage.profiles.insert({"user_id": user_id, "name": user_id.upper()})
+                await log_steps(storage, boards, user_id, TODAY, steps)
+            return await boards.standings("steps", "2024-W19", "d", limit=3)
+        result = run_sqlite(fn, Leaderboards)
+        assert result["participants"] == 4
+        assert [(e["rank"], e["name"], e["score"]) for e in result["top"]] == [(1, "A", 9000), (2, "B", 7000),
+                                                                              (2, "C", 7000)]
+        assert result["me"] == {"rank": 4, "score": 1000}
+
+    def test_reconcile_rebuilds_from_logs(self, run_sqlite):
+        async def fn(storage, boards):
+            await log_steps(storage, boards, "u", TODAY, 5000)
+            # Drift: a missed refresh, a stale entry and a streak that lapsed
+            await storage.steps.put_day("v", TODAY, {"steps": 8000})
+            await storage.leaderboards.set("steps", "2024-W19", "ghost", 100)
+            await storage.weight_logs.insert_many([{"id": "1", "user_id": "u", "date": "2024-05-07", "weight": 80},
+                                                   {"id": "2", "user_id": "u", "date": TODAY, "weight": 80},
+                                                   {"id": "3", "user_id": "v", "date": "2024-05-01", "weight": 70}])
+            await storage.leaderboards.set(STREAK, CURRENT, "v", 5)
+            await storage.leaderboards.set("steps", "2024-W01", "u", 100)
+            report = await boards.reconcile(today=TODAY)
+            return (report, await storage.leaderboards.top("steps", "2024-W19", 10),
+                    await storage.leaderboards.top(STREAK, CURRENT, 10))
+        report, steps, streaks = run_sqlite(fn, Leaderboards)
+        assert steps == [{"user_id": "v", "score": 8000}, {"user_id": "u", "score": 5000}]
+        assert streaks == [{"user_id": "u", "score": 2}]
+        assert report["steps:pruned"] == 1
@@ -0,0 +1,33 @@
+"""
+Pure metric tests: BMI/BMR/TDEE, steps calories, streak, health score
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import metrics  # noqa: E402
+
+
+class TestMetrics:
+    def test_body_metrics_default_profile(self):
+        # Seeded default profile: 90kg, 175cm, 30y male
+        assert metrics.body_metrics(90.0, 175.0, 30, "male") == (29.4, 1849, 2219)
+
+    def test_bmi_category(self):
+        assert metrics.bmi_category(22) == ("Normal", "green")
+        assert metrics.bmi_category(31) == ("Obese", "red")
+
+    def test_steps_calories(self):
+        assert metrics.steps_calories(0, 175, 90) == 0
+        assert metrics.steps_calories(8000, 175, 90) == 379
+
+    def test_streak_counts_back_from_yesterday(self):
+        dates = ["2026-03-01", "2026-03-02", "2026-03-03", "2026-02-20"]
+        assert metrics.weight_log_streak(dates, "2026-03-04") == 3
+        assert metrics.weight_log_streak(dates, "2026-03-06") == 0
+
+    def test_health_score_capped(self):
+        assert metrics.health_score(22, 20000, 2000, True, 1800, 1800, 30) == 100
+
+    def test_date_range_inclusive(self):
+        assert list(metrics.date_range("2026-02-27", "2026-03-01")) == ["2026-02-27", "2026-02-28", "2026-03-01"]
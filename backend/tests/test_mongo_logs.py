@@ -0,0 +1,69 @@
+"""
+Mongo log repository tests on mongomock: in SCHEMA_MODE=migrating a day can
+hold both legacy (string date) and compact (day number) documents, and the
+grouped reads must still give one value per day and sorted reads one order.
+"""
+import asyncio
+import os
+import sys
+
+import pytest
+
+mongomock_motor = pytest.importorskip("mongomock_motor")
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import schema  # noqa: E402
+from storage import MongoLogs  # noqa: E402
+
+DAY = "2026-03-01"
+
+
+def run(monkeypatch, fn, name="workouts"):
+    async def go():
+        logs = MongoLogs(mongomock_motor.AsyncMongoMockClient()["t"], name)
+        # A document written before the migration started, then one after
+        monkeypatch.setattr(schema, "MODE", "legacy")
+        await logs.insert({"id": "old", "user_id": "u", "type": "Run", "date": DAY, "calories": 100, "duration": 10})
+        monkeypatch.setattr(schema, "MODE", "migrating")
+        await logs.insert({"id": "new", "user_id": "u", "type": "Run", "date": DAY, "calories": 200, "duration": 20})
+        return await fn(logs)
+    return asyncio.run(go())
+
+
+class TestMigratingMode:
+    def test_mixed_encodings_on_one_day_merge(self, monkeypatch):
+        async def fn(logs):
+            return (await logs.daily_values("u", DAY, DAY, "calories", op="sum"),
+                    await logs.daily_values("u", DAY, DAY, "calories"),
+                    await logs.daily_values_many(["u"], DAY, DAY, "calories", op="sum"),
+                    await logs.grouped_totals("u", "type", ("calories", "duration"), DAY, DAY),
+                    await logs.dates_by_user(DAY),
+                    await logs.distinct("date", user_id="u"),
+                    await logs.find_day("u", DAY))
+        summed, first, many, grouped, dates, distinct, docs = run(monkeypatch, fn)
+        assert summed == {DAY: 300}
+        assert first[DAY] in (100, 200)
+        assert many == {"u": {DAY: 300}}
+        assert grouped == [{"date": DAY, "type": "Run", "count": 2, "calories": 300, "duration": 30}]
+        assert dates == {"u": [DAY]}
+        assert distinct == [DAY]
+        assert len(docs) == 2
+
+    def test_mixed_encodings_sort_together(self, monkeypatch):
+        async def go():
+            logs = MongoLogs(mongomock_motor.AsyncMongoMockClient()["t"], "workouts")
+            monkeypatch.setattr(schema, "MODE", "legacy")
+            for i, day in enumerate(("2026-01-01", "2026-01-02")):
+                await logs.insert({"id": f"old{i}", "user_id": "u", "type": "Run", "date": day,
+                                   "timestamp": f"{day}T08:00:00.123456+00:00"})
+            monkeypatch.setattr(schema, "MODE", "migrating")
+            await logs.insert({"id": "new", "user_id": "u", "type": "Run", "date": "2026-03-01",
+                               "timestamp": "2026-03-01T08:00:00.123456+00:00"})
+            return (await logs.find("u", sort=-1), await logs.find("u", limit=2, fields=["id"]),
+                    await logs.find("u", order_by="timestamp", sort=-1, limit=2),
+                    await logs.search("u", limit=2), await logs.find("u", sort=-1, limit=1, fields=["timestamp"]))
+        newest, oldest, by_time, searched, stamp = asyncio.run(go())
+        assert [d["date"] for d in newest] == ["2026-03-01", "2026-01-02", "2026-01-01"]
+        assert oldest == [{"id": "old0"}, {"id": "old1"}]
+        assert [d["id"] for d in by_time] == [d["id"] for d in searched] == ["new", "old1"]
+        assert stamp == [{"timestamp": "2026-03-01T08:00:00.123456+00:00"}]
@@ -0,0 +1,52 @@
+"""
+Mongo pool listener tests: checkouts and in-use counts, checkout wait timed
+per thread, failed checkouts by reason.
+"""
+import os
+import sys
+import threading
+import time
+
+from pymongo import monitoring
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from mongo_pool import PoolStats  # noqa: E402
+
+ADDRESS = ("localhost", 27017)
+
+
+def checkout(stats, wait=0.0, connection_id=1):
+    stats.connection_check_out_started(monitoring.ConnectionCheckOutStartedEvent(ADDRESS))
+    time.sleep(wait)
+    stats.connection_checked_out(monitoring.ConnectionCheckedOutEvent(ADDRESS, connection_id))
+
+
+class TestPoolStats:
+    def test_checkouts_and_in_use(self):
+        stats = PoolStats()
+        for i in (1, 2):
+            stats.connection_created(monitoring.ConnectionCreatedEvent(ADDRESS, i))
+            checkout(stats, connection_id=i)
+        stats.connection_checked_in(monitoring.ConnectionCheckedInEvent(ADDRESS, 1))
+        result = stats.stats()
+        assert (result["checkouts"], result["in_use"], result["open"]) == (2, 1, 2)
+
+    def test_wait_is_timed_per_thread(self):
+        stats = PoolStats()
+        threads = [threading.Thread(target=checkout, args=(stats, wait)) for wait in (0.0, 0.05)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        result = stats.stats()
+        assert 40 < result["wait_ms_max"] < 200
+        assert result["wait_ms_avg"] < result["wait_ms_max"]
+
+    def test_failed_checkouts_by_reason(self):
+        stats = PoolStats()
+        for reason in ("timeout", "timeout", "connectionError"):
+            stats.connection_check_out_started(monitoring.ConnectionCheckOutStartedEvent(ADDRESS))
+            stats.connection_check_out_failed(monitoring.ConnectionCheckOutFailedEvent(ADDRESS, reason))
+        result = stats.stats()
+        assert result["failed_checkouts"] == {"timeout": 2, "connectionError": 1}
+        assert result["checkouts"] == 0
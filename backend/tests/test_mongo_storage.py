@@ -0,0 +1,166 @@
+"""
+Mongo storage tests on mongomock: unique indexes built over legacy
+duplicates, streamed field values, deduplicated GridFS files.
+"""
+import asyncio
+import os
+import sys
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+mongomock_motor = pytest.importorskip("mongomock_motor")
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from bson import ObjectId  # noqa: E402
+from pymongo.errors import DuplicateKeyError  # noqa: E402
+import storage  # noqa: E402
+from storage import MongoStorage  # noqa: E402
+
+
+def run(fn):
+    async def go():
+        return await fn(MongoStorage(mongomock_motor.AsyncMongoMockClient()["t"]))
+    return asyncio.run(go())
+
+
+class TestIndexBuild:
+    def test_duplicate_settings_collapse_to_oldest(self):
+        async def fn(st):
+            await st.db.settings.insert_many([{"type": "vapid_keys", "public_key": k} for k in ("first", "second")])
+            await st.ensure_indexes()
+            with pytest.raises(DuplicateKeyError):
+                await st.db.settings.insert_one({"type": "vapid_keys", "public_key": "third"})
+            return await st.settings.setdefault("vapid_keys", {"public_key": "fourth"})
+        assert run(fn)["public_key"] == "first"
+
+    def test_duplicate_push_endpoints_collapse_to_latest_subscriber(self):
+        async def fn(st):
+            await st.db.push_subs.insert_many([
+                {"user_id": "u2", "endpoint": "https://push.example/a", "created_at": "2024-05-02T00:00:00+00:00"},
+                {"user_id": "u1", "endpoint": "https://push.example/a", "created_at": "2024-05-01T00:00:00+00:00"},
+                {"user_id": "u1", "endpoint": "https://push.example/b", "created_at": "2024-05-01T00:00:00+00:00"},
+            ])
+            await st.ensure_indexes()
+            with pytest.raises(DuplicateKeyError):
+                await st.db.push_subs.insert_one({"user_id": "u3", "endpoint": "https://push.example/a"})
+            return [(d["endpoint"], d["user_id"]) async for d in st.db.push_subs.find().sort("endpoint", 1)]
+        assert run(fn) == [("https://push.example/a", "u2"), ("https://push.example/b", "u1")]
+
+
+class TestValues:
+    def test_values_by_prefix(self):
+        async def fn(st):
+            await st.users.insert({"id": "u1", "avatarUrl": "/api/files/a"})
+            await st.users.insert({"id": "u2", "avatarUrl": "https://lh3.example/p.jpg"})
+            await st.users.insert({"id": "u3"})
+            await st.progress_photos.insert_many([{"user_id": "u", "file_id": f} for f in ("a", "d")])
+            return ([v async for v in st.users.values("avatarUrl", prefix="/api/files/")],
+                    sorted([v async for v in st.progress_photos.values("file_id")]))
+        assert run(fn) == (["/api/files/a"], ["a", "d"])
+
+
+class FakeBucket:
+    # mongomock has no GridFS; lays the bytes out in fs.files/fs.chunks the way GridFS does
+    def __init__(self, db):
+        self.db = db
+
+    async def upload_from_stream(self, filename, data, metadata=None):
+        result = await self.db["fs.files"].insert_one({
+            "filename": filename, "length": len(data), "uploadDate": datetime.now(timezone.utc), "metadata": metadata})
+        await self.db["fs.chunks"].insert_one({"files_id": result.inserted_id, "n": 0, "data": data})
+        return result.inserted_id
+
+    async def delete(self, file_id):
+        await self.db["fs.files"].delete_one({"_id": file_id})
+        await self.db["fs.chunks"].delete_many({"files_id": file_id})
+
+
+class AttachBeforeDelete:
+    # Runs a put() of the same bytes between the sweep's snapshot and its delete
+    def __init__(self, db, attach):
+        self.db, self.attach = db, attach
+
+    def __getitem__(self, name):
+        coll = self.db[name]
+        if name != "fs.files":
+            return coll
+        outer = self
+
+        class Files:
+            def __getattr__(self, attr):
+                return getattr(coll, attr)
+
+            async def delete_many(self, *args, **kwargs):
+                if outer.attach:
+                    attach, outer.attach = outer.attach, None
+                    await attach()
+                return await coll.delete_many(*args, **kwargs)
+        return Files()
+
+
+class TestFiles:
+    @pytest.fixture(autouse=True)
+    def bucket(self, monkeypatch):
+        monkeypatch.setattr(storage, "AsyncIOMotorGridFSBucket", FakeBucket)
+
+    async def age(self, st, file_id, days=2):
+        await st.db["fs.files"].update_one(
+            {"_id": ObjectId(file_id)}, {"$set": {"uploadDate": datetime.now(timezone.utc) - timedelta(days=days)}})
+
+    def test_identical_bytes_share_one_file(self):
+        async def fn(st):
+            first = await st.files.put(b"photo", "a.jpg", "image/jpeg")
+            second = await st.files.put(b"photo", "b.jpg", "image/jpeg")
+            other = await st.files.put(b"other", "c.jpg", "image/jpeg")
+            doc = await st.db["fs.files"].find_one({"_id": ObjectId(first)})
+            return first, second, other, doc["metadata"]["refs"], await st.db["fs.chunks"].count_documents({})
+        first, second, other, refs, chunks = run(fn)
+        assert first == second != other
+        assert (refs, chunks) == (2, 2)
+
+    def test_last_release_deletes_bytes(self):
+        async def fn(st):
+            file_id = await st.files.put(b"photo", "a.jpg", "image/jpeg")
+            await st.files.put(b"photo", "b.jpg", "image/jpeg")
+            await st.files.release(file_id)
+            after_one = await st.db["fs.files"].find_one({"_id": ObjectId(file_id)})
+            await st.files.release(file_id)
+            return (after_one["metadata"]["refs"], await st.db["fs.files"].count_documents({}),
+                    await st.db["fs.chunks"].count_documents({}))
+        assert run(fn) == (1, 0, 0)
+
+    def test_put_after_last_release_uploads_again(self):
+        async def fn(st):
+            file_id = await st.files.put(b"photo", "a.jpg", "image/jpeg")
+            await st.files.release(file_id)
+            return file_id, await st.files.put(b"photo", "b.jpg", "image/jpeg")
+        first, second = run(fn)
+        assert first != second
+
+    def test_sweep_deletes_old_unreferenced_files_and_chunks(self):
+        async def fn(st):
+            orphan = await st.files.put(b"orphan", "a.jpg", "image/jpeg")
+            kept = await st.files.put(b"kept", "b.jpg", "image/jpeg")
+            fresh = await st.files.put(b"fresh", "c.jpg", "image/jpeg")
+            await self.age(st, orphan)
+            await self.age(st, kept)
+            stats = await st.files.sweep({kept}, timedelta(days=1), batch_size=1)
+            files = {str(f["_id"]) async for f in st.db["fs.files"].find({}, {"_id": 1})}
+            chunks = {str(c["files_id"]) async for c in st.db["fs.chunks"].find({}, {"files_id": 1})}
+            return stats, files, chunks, {kept, fresh}
+        stats, files, chunks, survivors = run(fn)
+        assert stats == {"scanned": 2, "deleted": 1, "reclaimed_bytes": len(b"orphan")}
+        assert files == chunks == survivors
+
+    def test_sweep_keeps_file_attached_after_snapshot(self):
+        async def fn(st):
+            file_id = await st.files.put(b"photo", "a.jpg", "image/jpeg")
+            await self.age(st, file_id)
+
+            async def attach():
+                assert await st.files.put(b"photo", "b.jpg", "image/jpeg") == file_id
+            st.files.db = AttachBeforeDelete(st.db, attach)
+            stats = await st.files.sweep(set(), timedelta(days=1), batch_size=10)
+            return stats, await st.db["fs.files"].count_documents({}), await st.db["fs.chunks"].count_documents({})
+        assert run(fn) == ({"scanned": 1, "deleted": 0, "reclaimed_bytes": 0}, 1, 1)
@@ -0,0 +1,161 @@
+"""
+Nutrition sync tests against a local stand-in diary service and the SQLite
+storage backend.
+Tests: mock connector, incremental fetch, retry on 5xx, permanent failures,
+bulk writes, per-connector concurrency, daily trigger
+"""
+import asyncio
+import json
+import os
+import sys
+import threading
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from nutrition_sync import Connector, HttpConnector, MockConnector, SyncService, days_between  # noqa: E402
+from scheduler import daily  # noqa: E402
+
+TODAY = "2024-05-08"
+
+
+class StandInDiaryService(BaseHTTPRequestHandler):
+    """One 300 kcal meal per requested day; `flaky*` users get a 503 first, `gone*` users a 404"""
+    protocol_version = "HTTP/1.1"
+    requests = []
+    flaky_seen = set()
+
+    def do_GET(self):
+        q = {k: v[0] for k, v in parse_qs(urlparse(self.path).query).items()}
+        StandInDiaryService.requests.append(q)
+        user = q["username"]
+        if user.startswith("gone"):
+            status, body = 404, {}
+        elif user.startswith("flaky") and user not in StandInDiaryService.flaky_seen:
+            StandInDiaryService.flaky_seen.add(user)
+            status, body = 503, {}
+        else:
+            status = 200
+            body = {"days": [{"date": d, "meals": [{"name": "Lunch", "calories": 300, "carbs": 30,
+                                                    "protein": 20, "fat": 10}]}
+                             for d in days_between(q["since"], q["until"])]}
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture(scope="module")
+def diary_server():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StandInDiaryService)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+
+
+def sync_service(connectors):
+    return lambda storage: SyncService(storage, connectors, max_retries=2, backoff=0.01)
+
+
+async def link(storage, user_id, connector, username, **extra):
+    await storage.nutrition_accounts.upsert(user_id, {"connector": connector, "username": username, **extra})
+
+
+class TestMockConnector:
+    def test_stable_per_user_and_day(self):
+        mock = MockConnector()
+        assert mock.day("bob", TODAY) == mock.day("bob", TODAY)
+        assert mock.day("bob", TODAY) != mock.day("bob", "2024-05-09")
+        assert [m["name"] for m in mock.day("bob", TODAY)["meals"]] == ["Breakfast", "Lunch", "Dinner", "Snacks"]
+
+
+class TestSyncService:
+    def test_http_sync_is_incremental(self, run_sqlite, diary_server):
+        async def fn(storage, service):
+            await link(storage, "u", "http", "alice", last_synced="2024-05-06")
+            first = await service.sync_accounts([await storage.nutrition_accounts.get("u")], today=TODAY)
+            second = await service.sync_accounts([await storage.nutrition_accounts.get("u")], today=TODAY)
+            return first, second, await storage.nutrition.find("u"), await storage.nutrition_accounts.get("u")
+        StandInDiaryService.requests.clear()
+        first, second, docs, account = run_sqlite(fn, sync_service([HttpConnector(diary_server)]))
+        assert first == {"accounts": 1, "synced": 1, "failed": 0, "days": 3}
+        assert second["days"] == 1
+        assert [r["since"] for r in StandInDiaryService.requests] == ["2024-05-06", TODAY]
+        assert [d["date"] for d in docs] == ["2024-05-06", "2024-05-07", TODAY]
+        assert docs[0]["total"] == {"calories": 300, "carbs": 30, "protein": 20, "fat": 10}
+        assert account["status"] == "ok" and account["last_synced"] == TODAY
+
+    def test_transient_errors_retried(self, run_sqlite, diary_server):
+        async def fn(storage, service):
+            await link(storage, "u", "http", "flaky-1")
+            return await service.sync_accounts([await storage.nutrition_accounts.get("u")], today=TODAY)
+        assert run_sqlite(fn, sync_service([HttpConnector(diary_server)]))["synced"] == 1
+
+    def test_permanent_failure_recorded(self, run_sqlite, diary_server):
+        async def fn(storage, service):
+            await link(storage, "u", "http", "gone-1")
+            await link(storage, "v", "http", "alice")
+            report = await service.run()
+            return report, await storage.nutrition_accounts.get("u"), await storage.nutrition.find("v")
+        report, account, docs = run_sqlite(fn, sync_service([HttpConnector(diary_server)]))
+        assert (report["synced"], report["failed"]) == (1, 1)
+        assert account["status"] == "error" and "404" in account["last_error"]
+        assert len(docs) == 1
+
+    def test_run_writes_in_batches(self, run_sqlite):
+        async def fn(storage, service):
+            service.batch_size = 10
+            for i in range(25):
+                await link(storage, f"user-{i:02d}", "mock", f"name-{i}")
+            await link(storage, "unknown", "myfitnesspal", "x")
+            report = await service.run()
+            return report, await storage.nutrition.distinct("user_id")
+        report, users = run_sqlite(fn, sync_service([MockConnector()]))
+        assert (report["accounts"], report["synced"], report["days"]) == (25, 25, 25)
+        assert len(users) == 25
+
+    def test_concurrency_limited_per_connector(self, run_sqlite):
+        class SlowConnector(Connector):
+            name = "slow"
+            active = peak = 0
+
+            async def fetch(self, account, since, until):
+                SlowConnector.active += 1
+                SlowConnector.peak = max(SlowConnector.peak, SlowConnector.active)
+                await asyncio.sleep(0.01)
+                SlowConnector.active -= 1
+                return []
+
+        async def fn(storage, service):
+            accounts = [{"user_id": f"u{i}", "connector": "slow"} for i in range(10)]
+            await service.sync_accounts(accounts, today=TODAY)
+        run_sqlite(fn, sync_service([SlowConnector(concurrency=2)]))
+        assert SlowConnector.peak == 2
+
+    def test_enqueue_shares_one_run_per_user(self, run_sqlite):
+        async def fn(storage, service):
+            await link(storage, "u", "mock", "bob")
+            account = await storage.nutrition_accounts.get("u")
+            a, b = service.enqueue(account), service.enqueue(account)
+            assert a is b
+            return await a
+        assert run_sqlite(fn, sync_service([MockConnector()]))["days"] == 1
+
+
+class TestDailyTrigger:
+    def test_later_today(self):
+        now = datetime(2024, 5, 8, 1, 30, tzinfo=timezone.utc)
+        assert daily(hour=3).next_after(now) == datetime(2024, 5, 8, 3, 0, tzinfo=timezone.utc)
+
+    def test_rolls_to_tomorrow(self):
+        now = datetime(2024, 5, 8, 3, 0, tzinfo=timezone.utc)
+        assert daily(hour=3).next_after(now) == datetime(2024, 5, 9, 3, 0, tzinfo=timezone.utc)
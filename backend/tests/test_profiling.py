@@ -0,0 +1,77 @@
+"""
+Request profiling tests against a bare ASGI app: admin header and sampling
+triggers, the wall-time split between CPU, thread-pool waits and other
+awaits, spawned tasks followed, and the task factory restored afterwards.
+"""
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from profiling import Profiler, ProfilingMiddleware  # noqa: E402
+
+
+def busy(seconds):
+    end = time.perf_counter() + seconds
+    while time.perf_counter() < end:
+        pass
+
+
+async def handler():
+    busy(0.03)
+    await asyncio.to_thread(time.sleep, 0.03)
+    # A spawned task, as coalesced reads and gathers do
+    await asyncio.ensure_future(asyncio.sleep(0.03))
+
+
+def call(headers=(), sample_rate=0.0, fn=handler):
+    dumps, sent = [], []
+
+    async def app(scope, receive, send):
+        await fn()
+        await send({"type": "http.response.start", "status": 200, "headers": []})
+        await send({"type": "http.response.body", "body": b"ok"})
+
+    async def on_finish(dump):
+        dumps.append(dump)
+
+    async def send(message):
+        sent.append(message)
+
+    async def go():
+        middleware = ProfilingMiddleware(app, Profiler(0.001), sample_rate=sample_rate, admin_token="adm",
+                                         on_finish=on_finish)
+        scope = {"type": "http", "method": "GET", "path": "/api/x", "headers": list(headers)}
+        await middleware(scope, None, send)
+        return asyncio.get_running_loop().get_task_factory()
+    factory = asyncio.run(go())
+    return dumps, dict(sent[0]["headers"]), factory
+
+
+class TestProfiling:
+    def test_admin_header_profiles_and_splits_wall_time(self):
+        dumps, headers, factory = call([(b"x-profile", b"1"), (b"x-admin-token", b"adm")])
+        dump = dumps[0]
+        assert headers[b"x-profile-id"].decode() == dump["id"]
+        assert (dump["method"], dump["path"], dump["status"]) == ("GET", "/api/x", 200)
+        split = dump["split_ms"]
+        assert set(split) <= {"cpu", "blocking:time", "await"}
+        # 30ms each; samples are time-weighted, so the GIL-bound CPU stretch is not under-counted
+        assert all(20 < split[k] < 45 for k in ("cpu", "blocking:time", "await"))
+        lines = dump["folded"].splitlines()
+        assert any(line.startswith("cpu;") and "test_profiling.py:busy" in line for line in lines)
+        # The spawned sleep is attributed under the handler that awaited it
+        assert any(line.startswith("await;") and "tasks.py:sleep" in line for line in lines)
+        assert factory is None
+
+    def test_not_profiled_without_trigger(self):
+        assert call([(b"x-profile", b"1")])[0] == []
+        assert call([(b"x-profile", b"1"), (b"x-admin-token", b"wrong")])[0] == []
+
+    def test_sampled_requests_get_no_header(self):
+        async def quick():
+            pass
+        dumps, headers, _ = call(sample_rate=1.0, fn=quick)
+        assert len(dumps) == 1
+        assert b"x-profile-id" not in headers
@@ -0,0 +1,126 @@
+"""
+Push fan-out tests against a local stand-in push service.
+Tests: delivery, retry on 5xx, expiry detection on 410, per-origin
+connection reuse, weekly trigger
+"""
+import asyncio
+import base64
+import os
+import sys
+import threading
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import ec
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from push import PushDispatcher  # noqa: E402
+from scheduler import weekly  # noqa: E402
+
+
+def b64(data):
+    return base64.urlsafe_b64encode(data).decode().rstrip("=")
+
+
+class StandInPushService(BaseHTTPRequestHandler):
+    """Responds 201 on /ok/*, 410 on /gone/*, and 503 the first time on /flaky/*"""
+    protocol_version = "HTTP/1.1"
+    received = []
+    client_ports = set()
+    flaky_seen = set()
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        StandInPushService.received.append(self.path)
+        StandInPushService.client_ports.add(self.client_address[1])
+        if self.path.startswith("/gone/"):
+            status = 410
+        elif self.path.startswith("/flaky/") and self.path not in StandInPushService.flaky_seen:
+            StandInPushService.flaky_seen.add(self.path)
+            status = 503
+        else:
+            status = 201
+        self.send_response(status)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture(scope="module")
+def push_server():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StandInPushService)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+
+
+@pytest.fixture(scope="module")
+def dispatcher():
+    key = ec.generate_private_key(ec.SECP256R1())
+    d = PushDispatcher(b64(key.private_numbers().private_value.to_bytes(32, "big")),
+                       max_workers=4, per_origin=2, max_retries=2, backoff=0.01)
+    yield d
+    d.close()
+
+
+def make_sub(endpoint):
+    client_key = ec.generate_private_key(ec.SECP256R1())
+    p256dh = client_key.public_key().public_bytes(
+        serialization.Encoding.X962, serialization.PublicFormat.UncompressedPoint)
+    return {"endpoint": endpoint, "keys": {"p256dh": b64(p256dh), "auth": b64(os.urandom(16))}}
+
+
+class TestPushDispatcher:
+    def test_fan_out_delivers_all(self, push_server, dispatcher):
+        subs = [make_sub(f"{push_server}/ok/{i}") for i in range(20)]
+        report = asyncio.run(dispatcher.send_many(subs, {"title": "t", "body": "b"}))
+        assert report.sent == 20
+        assert report.failed == 0
+        assert report.as_dict()["sends_per_sec"] > 0
+
+    def test_connections_reused_per_origin(self, push_server, dispatcher):
+        StandInPushService.client_ports.clear()
+        subs = [make_sub(f"{push_server}/ok/reuse{i}") for i in range(30)]
+        report = asyncio.run(dispatcher.send_many(subs, "hello"))
+        assert report.sent == 30
+        assert report.origins == 1
+        assert len(StandInPushService.client_ports) <= 2
+
+    def test_groups_by_origin(self, push_server, dispatcher):
+        other = push_server.replace("127.0.0.1", "localhost")
+        subs = [make_sub(f"{push_server}/ok/x"), make_sub(f"{other}/ok/y")]
+        report = asyncio.run(dispatcher.send_many(subs, "hello"))
+        assert report.sent == 2
+        assert report.origins == 2
+
+    def test_expired_subscriptions_reported(self, push_server, dispatcher):
+        subs = [make_sub(f"{push_server}/ok/a"), make_sub(f"{push_server}/gone/b")]
+        report = asyncio.run(dispatcher.send_many(subs, "hello"))
+        assert report.sent == 1
+        assert report.expired == [f"{push_server}/gone/b"]
+        assert report.failed == 0
+
+    def test_transient_errors_retried(self, push_server, dispatcher):
+        report = asyncio.run(dispatcher.send_many([make_sub(f"{push_server}/flaky/c")], "hello"))
+        assert report.sent == 1
+        assert report.retries == 1
+
+    def test_unreachable_endpoint_counts_failure(self, dispatcher):
+        report = asyncio.run(dispatcher.send_many([make_sub("http://127.0.0.1:1/x")], "hello"))
+        assert report.sent == 0
+        assert report.failed == 1
+
+
+class TestWeeklyTrigger:
+    def test_next_sunday(self):
+        wed = datetime(2026, 3, 4, 12, 0, tzinfo=timezone.utc)
+        assert weekly(6, hour=9).next_after(wed) == datetime(2026, 3, 8, 9, 0, tzinfo=timezone.utc)
+
+    def test_same_day_after_time_rolls_a_week(self):
+        sun = datetime(2026, 3, 8, 10, 0, tzinfo=timezone.utc)
+        assert weekly(6, hour=9).next_after(sun) == datetime(2026, 3, 15, 9, 0, tzinfo=timezone.utc)
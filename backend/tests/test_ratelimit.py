@@ -0,0 +1,107 @@
+"""
+Admission control tests: token bucket spend/refill, per-route costs, the
+shared-state bucket and the in-flight cap.
+"""
+import asyncio
+import os
+import sys
+
+import pytest
+from uvicorn.middleware.proxy_headers import ProxyHeadersMiddleware
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import serve  # noqa: E402
+from ratelimit import InFlightLimiter, LocalBuckets, RateLimiter, SharedBuckets  # noqa: E402
+from shared_state import LocalState  # noqa: E402
+
+
+class TestRateLimiter:
+    def test_burst_then_limited(self):
+        async def run():
+            rl = RateLimiter(rate=1, burst=3)
+            return [await rl.check("u", "GET", "/api/stats") for _ in range(4)]
+        assert asyncio.run(run()) == [0, 0, 0, 1]
+
+    def test_costly_routes_drain_faster(self):
+        async def run():
+            rl = RateLimiter(rate=1, burst=10, costs={"POST /api/auth/login": 5})
+            return [await rl.check("ip", "POST", "/api/auth/login") for _ in range(3)]
+        results = asyncio.run(run())
+        assert results[:2] == [0, 0]
+        assert results[2] == 5
+
+    def test_keys_are_independent(self):
+        async def run():
+            rl = RateLimiter(rate=1, burst=1)
+            return await rl.check("a", "GET", "/x"), await rl.check("b", "GET", "/x")
+        assert asyncio.run(run()) == (0, 0)
+
+    def test_refill(self):
+        async def run():
+            buckets = LocalBuckets()
+            await buckets.take("u", 1, 100, 1)
+            await asyncio.sleep(0.02)
+            return await buckets.take("u", 1, 100, 1)
+        assert asyncio.run(run()) == 0
+
+    def test_counters(self):
+        async def run():
+            rl = RateLimiter(rate=1, burst=1)
+            await rl.check("u", "GET", "/api/stats")
+            await rl.check("u", "GET", "/api/stats")
+            return rl.stats()
+        stats = asyncio.run(run())
+        assert stats["allowed"] == 1
+        assert stats["limited"] == {"GET /api/stats": 1}
+
+
+class TestSharedBuckets:
+    def test_window_budget(self):
+        async def run():
+            buckets = SharedBuckets(LocalState())
+            return [await buckets.take("u", 2, 1, 60) for _ in range(31)]
+        results = asyncio.run(run())
+        assert results[:30] == [0] * 30
+        assert 0 < results[30] <= 60
+
+
+class TestInFlight:
+    def test_sheds_past_limit(self):
+        fl = InFlightLimiter(2)
+        assert fl.enter() and fl.enter()
+        assert not fl.enter()
+        fl.leave()
+        assert fl.enter()
+        assert fl.stats() == {"limit": 2, "in_flight": 2, "peak": 2, "shed": 1}
+
+    def test_zero_disables(self):
+        fl = InFlightLimiter(0)
+        assert all(fl.enter() for _ in range(1000))
+
+
+class TestClientAddress:
+    def test_spoofed_forwarded_for_hits_the_same_bucket(self, monkeypatch):
+        monkeypatch.delenv("FORWARDED_ALLOW_IPS", raising=False)
+        limiter = RateLimiter(rate=1, burst=2)
+
+        async def app(scope, receive, send):
+            # What limit_by_ip keys on: request.client.host after uvicorn's proxy headers
+            keys.append(scope["client"][0])
+            results.append(await limiter.check(scope["client"][0], "POST", "/api/auth/login"))
+        keys, results = [], []
+        proxied = ProxyHeadersMiddleware(app, trusted_hosts=serve.trusted_proxies())
+
+        async def run():
+            for i in range(4):
+                # The ingress at 127.0.0.1 appends the real peer after whatever the client sent
+                xff = f"10.9.9.{i}, 203.0.113.7".encode()
+                await proxied({"type": "http", "client": ("127.0.0.1", 5000),
+                               "headers": [(b"x-forwarded-for", xff)]}, None, None)
+        asyncio.run(run())
+        assert keys == ["203.0.113.7"] * 4
+        assert results == [0, 0, 1, 1]
+
+    def test_wildcard_trust_refused(self, monkeypatch):
+        monkeypatch.setenv("FORWARDED_ALLOW_IPS", "*")
+        with pytest.raises(RuntimeError):
+            serve.trusted_proxies()
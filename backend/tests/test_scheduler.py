@@ -0,0 +1,88 @@
+"""
+Scheduler tests (mostly without a database, so this worker is the leader):
+triggers, one run per job at a time, due jobs run from the loop and kept
+referenced, a manual run on another worker not breaking the leader's tick.
+"""
+import asyncio
+import os
+import sys
+from datetime import datetime, timezone
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from scheduler import JobRunning, Scheduler, daily, every, weekly  # noqa: E402
+
+NOW = datetime(2024, 5, 8, 12, 30, tzinfo=timezone.utc)  # a Wednesday
+
+
+class TestTriggers:
+    def test_next_after(self):
+        assert every(60).next_after(NOW) == datetime(2024, 5, 8, 12, 31, tzinfo=timezone.utc)
+        assert daily(3).next_after(NOW) == datetime(2024, 5, 9, 3, 0, tzinfo=timezone.utc)
+        assert weekly(6, hour=9).next_after(NOW) == datetime(2024, 5, 12, 9, 0, tzinfo=timezone.utc)
+
+
+class TestRunJob:
+    def test_second_run_while_running_is_refused(self):
+        async def run():
+            scheduler = Scheduler(None)
+            release = asyncio.Event()
+            calls = []
+
+            async def job():
+                calls.append(1)
+                await release.wait()
+                return "done"
+            scheduler.add_job("checkin", job, every(60))
+            first = asyncio.ensure_future(scheduler.run_job("checkin"))
+            await asyncio.sleep(0)
+            assert scheduler.is_running("checkin")
+            with pytest.raises(JobRunning):
+                await scheduler.run_job("checkin")
+            release.set()
+            return await first, calls, scheduler.is_running("checkin")
+        assert asyncio.run(run()) == ("done", [1], False)
+
+    def test_loop_keeps_job_tasks_until_done(self):
+        async def run():
+            scheduler = Scheduler(None, tick_seconds=0.01)
+            release = asyncio.Event()
+
+            async def job():
+                await release.wait()
+            scheduler.add_job("sweep", job, every(0))
+            scheduler.start()
+            # First tick schedules from now, the next one finds the job due
+            while not scheduler.is_running("sweep"):
+                await asyncio.sleep(0.01)
+            held = len(scheduler._tasks)
+            await scheduler.stop()
+            release.set()
+            await asyncio.gather(*scheduler._tasks)
+            await asyncio.sleep(0)
+            return held, len(scheduler._tasks)
+        assert asyncio.run(run()) == (1, 0)
+
+    def test_leader_tick_during_manual_run_elsewhere(self):
+        mongomock_motor = pytest.importorskip("mongomock_motor")
+
+        async def run():
+            db = mongomock_motor.AsyncMongoMockClient()["t"]
+            leader, other = Scheduler(db), Scheduler(db)
+            release = asyncio.Event()
+
+            async def job():
+                await release.wait()
+            for scheduler in (leader, other):
+                scheduler.add_job("health_reports", job, every(60))
+            manual = asyncio.ensure_future(other.run_job("health_reports"))
+            await asyncio.sleep(0.01)
+            due_during = await leader._due_jobs(NOW)
+            with pytest.raises(JobRunning):
+                await leader.run_job("health_reports")
+            release.set()
+            await manual
+            state = await db.scheduler_jobs.find_one({"_id": "health_reports"})
+            return due_during, state["running_until"], state["next_run"] is not None
+        assert asyncio.run(run()) == ([], None, True)
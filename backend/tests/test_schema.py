@@ -0,0 +1,89 @@
+"""
+Storage schema codec tests: compact/decode roundtrip, query helpers in each
+SCHEMA_MODE
+"""
+import os
+import sys
+import uuid
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import schema  # noqa: E402
+
+LOG = {"id": str(uuid.uuid4()), "user_id": str(uuid.uuid4()), "weight": 82.4,
+       "date": "2024-05-06", "timestamp": "2024-05-06T07:08:09.123000+00:00"}
+
+
+@pytest.fixture
+def mode(monkeypatch):
+    def set_mode(m):
+        monkeypatch.setattr(schema, "MODE", m)
+    return set_mode
+
+
+class TestCodec:
+    def test_roundtrip(self):
+        stored = schema.compact(LOG)
+        assert stored["date"] == 19849
+        assert stored["id"].subtype == 4
+        assert stored["user_id"] == LOG["user_id"]
+        assert schema.decode(stored) == LOG
+
+    def test_decode_passes_legacy_through(self):
+        assert schema.decode(LOG) == LOG
+        assert schema.decode(None) is None
+
+    def test_non_uuid_id_kept(self):
+        assert schema.compact({"id": "seed-1"})["id"] == "seed-1"
+
+    def test_microseconds_roundtrip(self):
+        stored = schema.compact({"timestamp": "2024-05-06T07:08:09.123456+00:00"})
+        assert stored["timestamp"].microsecond == 123000
+        assert stored[schema.SUB_MS_FIELD] == {"timestamp": 456}
+        assert schema.decode(stored) == {"timestamp": "2024-05-06T07:08:09.123456+00:00"}
+
+    @pytest.mark.parametrize("stamp", ["2024-05-06T07:08:09", "2024-05-06T09:08:09+02:00", "2024-05-06T07:08:09Z"])
+    def test_timestamp_that_would_not_roundtrip_kept(self, stamp):
+        assert schema.compact({"timestamp": stamp}) == {"timestamp": stamp}
+
+    def test_encode_copies_in_legacy(self, mode):
+        mode("legacy")
+        assert schema.encode(LOG) == LOG
+        assert schema.encode(LOG) is not LOG
+        mode("compact")
+        assert schema.encode(LOG)["date"] == 19849
+
+    def test_projection_keeps_sub_ms(self):
+        assert schema.projection() == {"_id": 0}
+        assert schema.projection(["timestamp"]) == {"_id": 0, schema.SUB_MS_FIELD: 1, "timestamp": 1}
+
+
+class TestQueries:
+    def test_match_legacy(self, mode):
+        mode("legacy")
+        assert schema.match(user_id="u", date="2024-05-06") == {"user_id": "u", "date": "2024-05-06"}
+
+    def test_match_migrating_accepts_both(self, mode):
+        mode("migrating")
+        q = schema.match(user_id="u", date="2024-05-06", id=LOG["id"])
+        assert q["user_id"] == "u"
+        assert q["date"] == {"$in": ["2024-05-06", 19849]}
+        assert q["id"]["$in"][0] == LOG["id"]
+
+    def test_match_compact(self, mode):
+        mode("compact")
+        assert schema.match(date="2024-05-06") == {"date": 19849}
+
+    def test_date_range(self, mode):
+        mode("compact")
+        assert schema.date_range(gte="1970-01-02", lte="1970-01-31") == {"date": {"$gte": 1, "$lte": 30}}
+        mode("migrating")
+        assert schema.date_range(gte="1970-01-02") == {"$or": [{"date": {"$gte": "1970-01-02"}},
+                                                              {"date": {"$gte": 1}}]}
+
+    def test_day_datetime_roundtrip(self):
+        # Time-series collections store the day as a UTC-midnight BSON date
+        dt = schema.day_datetime("2024-05-06")
+        assert dt.hour == 0 and dt.tzinfo is not None
+        assert schema.day_string(dt) == "2024-05-06"
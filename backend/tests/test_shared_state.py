@@ -0,0 +1,96 @@
+"""
+Shared state tests (in-process backend, and the Mongo one on mongomock).
+Tests: counters, TTL expiry, prefix listing, backend selection, atomic Mongo increments
+"""
+import asyncio
+import os
+import sys
+from datetime import datetime, timezone, timedelta
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from shared_state import LocalState, MongoState, make_shared_state  # noqa: E402
+
+
+class TestLocalState:
+    def test_incr_accumulates(self):
+        async def run():
+            st = LocalState()
+            await st.incr("push:sent", 3)
+            return await st.incr("push:sent", 2)
+        assert asyncio.run(run()) == 5
+
+    def test_ttl_expires(self):
+        async def run():
+            st = LocalState()
+            await st.set("k", "v", ttl=0.01)
+            await asyncio.sleep(0.03)
+            return await st.get("k", "expired")
+        assert asyncio.run(run()) == "expired"
+
+    def test_get_many_by_prefix(self):
+        async def run():
+            st = LocalState()
+            await st.set("push:sent", 1)
+            await st.set("rate:abc", 2)
+            return await st.get_many("push:")
+        assert asyncio.run(run()) == {"push:sent": 1}
+
+
+class RacingCollection:
+    # Lets another worker's whole incr run right after this worker's first database call
+    def __init__(self, coll, other, key):
+        self.coll, self.other, self.key = coll, other, key
+
+    def __getattr__(self, name):
+        async def call(*args, **kwargs):
+            result = await getattr(self.coll, name)(*args, **kwargs)
+            if self.other:
+                other, self.other = self.other, None
+                await other.incr(self.key, ttl=60)
+            return result
+        return call
+
+
+class TestMongoState:
+    @pytest.fixture
+    def db(self):
+        return pytest.importorskip("mongomock_motor").AsyncMongoMockClient()["t"]
+
+    def test_incr_accumulates_with_ttl(self, db):
+        async def run():
+            st = MongoState(db)
+            await st.incr("rate:u", 3, ttl=60)
+            return await st.incr("rate:u", 2, ttl=60), await db.shared_state.find_one({"_id": "rate:u"})
+        value, doc = asyncio.run(run())
+        assert value == 5
+        assert doc["expires_at"] is not None
+
+    def test_concurrent_first_increments_all_count(self, db):
+        async def run():
+            first, second = MongoState(db), MongoState(db)
+            first.coll = RacingCollection(first.coll, second, "rate:u")
+            await first.incr("rate:u", ttl=60)
+            return await MongoState(db).get("rate:u")
+        assert asyncio.run(run()) == 2
+
+    def test_expired_window_restarts(self, db):
+        async def run():
+            st = MongoState(db)
+            past = datetime.now(timezone.utc) - timedelta(seconds=1)
+            await db.shared_state.insert_one({"_id": "rate:u", "value": 40, "expires_at": past})
+            return await st.incr("rate:u", ttl=60), await st.incr("rate:u", ttl=60)
+        assert asyncio.run(run()) == (1, 2)
+
+
+class TestBackendSelection:
+    def test_local(self):
+        assert isinstance(make_shared_state("local"), LocalState)
+
+    def test_mongo(self):
+        assert isinstance(make_shared_state("mongo", {"shared_state": object()}), MongoState)
+
+    def test_unknown_backend(self):
+        with pytest.raises(ValueError):
+            make_shared_state("redis")
@@ -0,0 +1,100 @@
+"""
+Request coalescing tests: concurrent identical calls share one run, distinct
+keys don't, errors reach every waiter, nothing is cached afterwards and a
+read after a write doesn't join one from before it.
+"""
+import asyncio
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from singleflight import SingleFlight  # noqa: E402
+
+
+def counting_handler(sf, delay=0.01):
+    calls = []
+
+    @sf.coalesce
+    async def handler(user_id, date=None):
+        calls.append((user_id, date))
+        await asyncio.sleep(delay)
+        return {"user_id": user_id, "date": date, "n": len(calls)}
+    return handler, calls
+
+
+class TestSingleFlight:
+    def test_concurrent_identical_calls_share_one_run(self):
+        sf = SingleFlight()
+        handler, calls = counting_handler(sf)
+
+        async def run():
+            return await asyncio.gather(*[handler(user_id="u", date="2024-05-06") for _ in range(5)])
+        results = asyncio.run(run())
+        assert len(calls) == 1
+        assert all(r == results[0] for r in results)
+        assert sf.stats() == {"in_flight": 0, "leaders": 1, "shared": 4}
+
+    def test_different_params_run_separately(self):
+        sf = SingleFlight()
+        handler, calls = counting_handler(sf)
+
+        async def run():
+            await asyncio.gather(handler(user_id="u"), handler(user_id="v"), handler(user_id="u", date="2024-05-06"))
+        asyncio.run(run())
+        assert len(calls) == 3
+
+    def test_no_caching_after_completion(self):
+        sf = SingleFlight()
+        handler, calls = counting_handler(sf)
+
+        async def run():
+            first = await handler(user_id="u")
+            return first, await handler(user_id="u")
+        first, second = asyncio.run(run())
+        assert (first["n"], second["n"]) == (1, 2)
+
+    def test_errors_reach_every_waiter(self):
+        sf = SingleFlight()
+
+        async def boom():
+            await asyncio.sleep(0.01)
+            raise ValueError("nope")
+
+        async def run():
+            return await asyncio.gather(*[sf.do("k", boom) for _ in range(3)], return_exceptions=True)
+        results = asyncio.run(run())
+        assert all(isinstance(r, ValueError) for r in results)
+
+    def test_cancelled_leader_does_not_cancel_waiters(self):
+        sf = SingleFlight()
+        handler, calls = counting_handler(sf, delay=0.05)
+
+        async def run():
+            leader = asyncio.create_task(handler(user_id="u"))
+            await asyncio.sleep(0)
+            waiter = asyncio.create_task(handler(user_id="u"))
+            await asyncio.sleep(0.01)
+            leader.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await leader
+            return await waiter
+        assert asyncio.run(run())["n"] == 1
+        assert len(calls) == 1
+
+    def test_read_after_write_starts_fresh(self):
+        sf = SingleFlight()
+        handler, calls = counting_handler(sf, delay=0.05)
+
+        async def run():
+            before = asyncio.create_task(handler(user_id="u"))
+            other = asyncio.create_task(handler(user_id="v"))
+            await asyncio.sleep(0.01)
+            sf.wrote("u")
+            after, joined = await asyncio.gather(handler(user_id="u"), handler(user_id="v"))
+            return await before, after, await other, joined
+        before, after, other, joined = asyncio.run(run())
+        assert after is not before and joined is other
+        assert calls == [("u", None), ("v", None), ("u", None)]
+        assert sf.stats() == {"in_flight": 0, "leaders": 3, "shared": 1}
@@ -0,0 +1,183 @@
+"""
+SQLite storage backend tests: log repositories, trend versioning, file
+dedupe/refcounts/sweep in both blob modes, and the whole API in-process.
+"""
+import argparse
+import os
+import sys
+from datetime import timedelta
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import bench  # noqa: E402
+from storage import make_storage  # noqa: E402
+
+
+class TestLogs:
+    def test_put_day_merges_and_keeps_one_per_day(self, run_sqlite):
+        async def fn(st):
+            await st.steps.put_day("u", "2024-05-06", {"steps": 5000}, on_insert={"id": "s1"})
+            doc = await st.steps.put_day("u", "2024-05-06", {"steps": 7000}, on_insert={"id": "s2"})
+            return doc, await st.steps.find("u")
+        doc, docs = run_sqlite(fn)
+        assert doc == {"id": "s1", "user_id": "u", "date": "2024-05-06", "steps": 7000}
+        assert docs == [doc]
+
+    def test_find_sorts_limits_and_filters(self, run_sqlite):
+        async def fn(st):
+            await st.weight_logs.insert_many([{"id": str(i), "user_id": "u", "date": f"2024-05-0{i}", "weight": 90 - i}
+                                              for i in range(1, 6)])
+            await st.weight_logs.insert({"id": "x", "user_id": "other", "date": "2024-05-03", "weight": 70})
+            return (await st.weight_logs.find("u", sort=-1, limit=2, fields=["date"]),
+                    await st.weight_logs.find("u", since="2024-05-04"),
+                    await st.weight_logs.distinct("date", user_id="other"))
+        latest, since, dates = run_sqlite(fn)
+        assert latest == [{"date": "2024-05-05"}, {"date": "2024-05-04"}]
+        assert [d["id"] for d in since] == ["4", "5"]
+        assert dates == ["2024-05-03"]
+
+    def test_delete_scoped_to_user(self, run_sqlite):
+        async def fn(st):
+            await st.workouts.insert({"id": "w1", "user_id": "u", "date": "2024-05-06", "calories": 300})
+            return await st.workouts.delete("other", "w1"), await st.workouts.delete("u", "w1")
+        assert run_sqlite(fn) == (False, True)
+
+    def test_daily_values(self, run_sqlite):
+        async def fn(st):
+            await st.workouts.insert_many([{"user_id": "u", "date": "2024-05-06", "calories": c} for c in (100, 250)])
+            await st.nutrition.put_day("u", "2024-05-07", {"total": {"calories": 1800}})
+            return (await st.workouts.daily_values("u", "2024-05-01", "2024-05-31", "calories", op="sum"),
+                    await st.nutrition.daily_values("u", "2024-05-01", "2024-05-31", "total.calories"))
+        assert run_sqlite(fn) == ({"2024-05-06": 350}, {"2024-05-07": 1800})
+
+    def test_workout_search_and_grouped_totals(self, run_sqlite):
+        async def fn(st):
+            await st.workouts.insert_many([
+                {"id": "1", "user_id": "u", "type": "Run", "date": "2024-05-06", "timestamp": "2024-05-06T07:00",
+                 "duration": 30, "calories": 300, "notes": "easy"},
+                {"id": "2", "user_id": "u", "type": "Run", "date": "2024-05-06", "timestamp": "2024-05-06T18:00",
+                 "duration": 20, "calories": 250, "notes": "Tempo PR"},
+                {"id": "3", "user_id": "u", "type": "Lift", "date": "2024-05-08", "timestamp": "2024-05-08T07:00",
+                 "duration": 50, "calories": 400, "notes": ""},
+                {"id": "4", "user_id": "other", "type": "Run", "date": "2024-05-06", "timestamp": "2024-05-06T07:00",
+                 "duration": 30, "calories": 300, "notes": "PR"},
+            ])
+            return (await st.workouts.search("u", text="pr lift"),
+                    await st.workouts.search("u", equals={"type": "Run"}, end="2024-05-07", limit=1),
+                    await st.workouts.grouped_totals("u", "type", ("duration", "calories"), start="2024-05-01"))
+        by_text, runs, rows = run_sqlite(fn)
+        assert [w["id"] for w in by_text] == ["3", "2"]
+        assert [w["id"] for w in runs] == ["2"]
+        assert sorted(rows, key=lambda r: r["type"]) == [
+            {"date": "2024-05-08", "type": "Lift", "count": 1, "duration": 50, "calories": 400},
+            {"date": "2024-05-06", "type": "Run", "count": 2, "duration": 50, "calories": 550}]
+
+
+class TestRecords:
+    def test_update_returns_previous(self, run_sqlite):
+        async def fn(st):
+            await st.users.insert({"id": "u", "email": "a@b.c", "avatarUrl": "/api/files/old"})
+            previous = await st.users.update("u", {"avatarUrl": "/api/files/new"})
+            return previous, await st.users.find_one(email="a@b.c")
+        previous, user = run_sqlite(fn)
+        assert previous["avatarUrl"] == "/api/files/old"
+        assert user["avatarUrl"] == "/api/files/new"
+
+    def test_values_by_prefix_across_pages(self, run_sqlite, monkeypatch):
+        monkeypatch.setattr("sqlite_storage.PAGE", 2)
+
+        async def fn(st):
+            for i, url in enumerate(["/api/files/a", "https://lh3.example/p.jpg", "", "/api/files/b", "/api/files/c"]):
+                await st.users.insert({"id": f"u{i}", "avatarUrl": url})
+            await st.progress_photos.insert_many([{"user_id": "u", "file_id": f} for f in ("a", "d", "e")])
+            return ([v async for v in st.users.values("avatarUrl", prefix="/api/files/")],
+                    [v async for v in st.progress_photos.values("file_id")])
+        assert run_sqlite(fn) == (["/api/files/a", "/api/files/b", "/api/files/c"], ["a", "d", "e"])
+
+
+class TestTrends:
+    def test_save_rejects_stale_version(self, run_sqlite):
+        async def fn(st):
+            assert await st.trends.save("u", {"version": 1, "trend": 90}, 0)
+            assert not await st.trends.save("u", {"version": 1, "trend": 91}, 0)
+            assert await st.trends.save("u", {"version": 2, "trend": 89}, 1)
+            assert not await st.trends.save("u", {"version": 2, "trend": 88}, 1)
+            return await st.trends.get("u")
+        assert run_sqlite(fn)["trend"] == 89
+
+
+class TestSettings:
+    def test_setdefault_keeps_first(self, run_sqlite):
+        async def fn(st):
+            await st.settings.setdefault("vapid_keys", {"public_key": "a"})
+            return await st.settings.setdefault("vapid_keys", {"public_key": "b"})
+        assert run_sqlite(fn)["public_key"] == "a"
+
+
+@pytest.mark.parametrize("blobs", ["table", "disk"])
+class TestFiles:
+    def test_dedupe_and_refcount(self, tmp_path, run_sqlite, blobs):
+        async def fn(st):
+            a = await st.files.put(b"png-bytes", "a.png", "image/png")
+            b = await st.files.put(b"png-bytes", "b.png", "image/png")
+            assert a == b
+            await st.files.release(a)
+            assert await st.files.get(a) == (b"png-bytes", "image/png")
+            await st.files.release(a)
+            with pytest.raises(KeyError):
+                await st.files.get(a)
+        run_sqlite(fn, blobs=blobs)
+        if blobs == "disk":
+            assert not any(p.is_file() for p in (tmp_path / "t.db.files").rglob("*"))
+
+    def test_sweep_skips_referenced_and_recent(self, run_sqlite, blobs):
+        async def fn(st):
+            keep = await st.files.put(b"keep", "k.png", "image/png")
+            await st.files.put(b"orphan", "o.png", "image/png")
+            recent = await st.files.sweep({keep}, timedelta(hours=1), 10)
+            swept = await st.files.sweep({keep}, timedelta(seconds=-1), 10)
+            return recent, swept, await st.files.get(keep)
+        recent, swept, kept = run_sqlite(fn, blobs=blobs)
+        assert recent["deleted"] == 0
+        assert swept == {"scanned": 2, "deleted": 1, "reclaimed_bytes": 6}
+        assert kept[0] == b"keep"
+
+    def test_sweep_spares_file_reattached_after_snapshot(self, run_sqlite, blobs):
+        async def fn(st):
+            file_id = await st.files.put(b"avatar", "a.png", "image/png")
+            await st.files.db.write(lambda c: c.execute("UPDATE files SET uploaded_at = 0"))
+            read = st.files.db.read
+
+            async def scan_then_attach(fn, *args):
+                rows = await read(fn, *args)
+                # An upload of the same bytes dedupes onto the file between the sweep's scan and its delete
+                attached.append(await st.files.put(b"avatar", "b.png", "image/png"))
+                return rows
+            attached = []
+            st.files.db.read = scan_then_attach
+            stats = await st.files.sweep(set(), timedelta(hours=1), 10)
+            st.files.db.read = read
+            return stats, attached == [file_id], await st.files.get(file_id)
+        stats, deduped, kept = run_sqlite(fn, blobs=blobs)
+        assert (stats["scanned"], stats["deleted"]) == (1, 0)
+        assert deduped
+        assert kept[0] == b"avatar"
+
+
+class TestBackendSelection:
+    def test_sqlite(self, tmp_path):
+        st = make_storage("sqlite", sqlite_path=tmp_path / "t.db")
+        assert st.backend == "sqlite"
+        st.close()
+
+    def test_unknown_backend(self):
+        with pytest.raises(ValueError):
+            make_storage("postgres")
+
+
+class TestApiOnSqlite:
+    def test_load_test_runs_without_mongo(self):
+        name, result, failures = bench.cmd_api(argparse.Namespace(requests=60, concurrency=4))
+        assert failures == []
+        assert result["req_per_s"] > 0
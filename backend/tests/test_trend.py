@@ -0,0 +1,53 @@
+"""
+Trend weight tests: smoothing, same-day corrections, rolling windows,
+incremental updates agree with a full rebuild
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import trend  # noqa: E402
+
+
+class TestTrend:
+    def test_first_reading_is_trend(self):
+        state, point = trend.apply_weight(None, "2026-03-01", 90.0)
+        assert state["trend"] == 90.0
+        assert point["avg7"] == 90.0
+
+    def test_gap_counts_multiple_steps(self):
+        state, _ = trend.apply_weight(None, "2026-03-01", 90.0)
+        one_day, _ = trend.apply_weight(state, "2026-03-02", 80.0)
+        week, _ = trend.apply_weight(state, "2026-03-08", 80.0)
+        assert round(one_day["trend"], 2) == 89.0
+        assert week["trend"] < one_day["trend"]
+
+    def test_same_day_relog_replaces(self):
+        state, _ = trend.apply_weight(None, "2026-03-01", 90.0)
+        a, _ = trend.apply_weight(state, "2026-03-02", 85.0)
+        a, _ = trend.apply_weight(a, "2026-03-02", 89.0)
+        b, _ = trend.apply_weight(state, "2026-03-02", 89.0)
+        assert a["trend"] == b["trend"]
+        assert len(a["window"]) == 2
+
+    def test_window_drops_old_days(self):
+        state, _ = trend.apply_weight(None, "2026-01-01", 100.0)
+        state, _ = trend.apply_weight(state, "2026-03-01", 90.0)
+        assert state["avg30"] == 90.0
+
+    def test_backdated_write_needs_rebuild(self):
+        state, _ = trend.apply_weight(None, "2026-03-05", 90.0)
+        assert trend.apply_weight(state, "2026-03-01", 91.0) == (None, None)
+
+    def test_incremental_matches_rebuild(self):
+        logs = [{"date": f"2026-03-{d:02d}", "weight": 90 - d * 0.1} for d in range(1, 29, 2)]
+        state = None
+        for log in logs:
+            state, _ = trend.apply_weight(state, log["date"], log["weight"])
+        rebuilt, points = trend.rebuild(list(reversed(logs)))
+        assert rebuilt["trend"] == state["trend"]
+        assert len(points) == len(logs)
+
+    def test_weekly_rate(self):
+        assert trend.weekly_rate({"date": "2026-03-15", "trend": 89.0},
+                                 {"date": "2026-03-01", "trend": 90.0}) == 0.5
@@ -0,0 +1,66 @@
+"""
+Smoothed trend weight. Each user carries a small state document: the
+exponentially-smoothed trend plus the last 30 days of daily weights. A new
+weigh-in updates it in O(1), no matter how long the history is.
+"""
+from datetime import date as date_cls, timedelta
+
+# Per-day smoothing factor (the Hacker's Diet uses 0.1)
+ALPHA = 0.1
+WINDOW_DAYS = 30
+
+
+def _smooth(base_trend, base_date, weight, day):
+    if base_trend is None:
+        return weight
+    gap = max((date_cls.fromisoformat(day) - date_cls.fromisoformat(base_date)).days, 1)
+    # A gap of n days counts as n smoothing steps toward the new reading
+    factor = 1 - (1 - ALPHA) ** gap
+    return base_trend + factor * (weight - base_trend)
+
+
+def apply_weight(state, day, weight):
+    """Returns (new_state, point) or (None, None) for an out-of-order write that needs a rebuild."""
+    state = dict(state or {})
+    if state.get("trend_date") and day < state["trend_date"]:
+        return None, None
+    if day != state.get("trend_date"):
+        # New day: yesterday's final trend becomes the base for today
+        state["base_trend"], state["base_date"] = state.get("trend"), state.get("trend_date")
+    state["trend"] = _smooth(state.get("base_trend"), state.get("base_date"), weight, day)
+    state["trend_date"] = day
+
+    cutoff = (date_cls.fromisoformat(day) - timedelta(days=WINDOW_DAYS - 1)).isoformat()
+    window = [p for p in state.get("window", []) if p["date"] >= cutoff and p["date"] != day]
+    window.append({"date": day, "weight": weight})
+    state["window"] = window
+    week_cutoff = (date_cls.fromisoformat(day) - timedelta(days=6)).isoformat()
+    last7 = [p["weight"] for p in window if p["date"] >= week_cutoff]
+    state["avg7"] = sum(last7) / len(last7)
+    state["avg30"] = sum(p["weight"] for p in window) / len(window)
+
+    point = {"date": day, "weight": weight, "trend": round(state["trend"], 2),
+             "avg7": round(state["avg7"], 2), "avg30": round(state["avg30"], 2)}
+    return state, point
+
+
+def rebuild(logs):
+    """Replays weight logs (any order) and returns (final_state, points by date)."""
+    latest = {}
+    for log in sorted(logs, key=lambda l: (l["date"], l.get("timestamp", ""))):
+        latest[log["date"]] = log["weight"]
+    state, points = None, []
+    for day in sorted(latest):
+        state, point = apply_weight(state, day, latest[day])
+        points.append(point)
+    return state, points
+
+
+def weekly_rate(now_point, earlier_point):
+    # kg per week between two trend points; positive = losing weight
+    if not now_point or not earlier_point:
+        return None
+    days = (date_cls.fromisoformat(now_point["date"]) - date_cls.fromisoformat(earlier_point["date"])).days
+    if days <= 0:
+        return None
+    return round((earlier_point["trend"] - now_point["trend"]) * 7 / days, 2)